@@ -0,0 +1,79 @@
+"""
+Routed vs. single-call agent: model calls and latency per search turn.
+
+Runs the same product questions through both agent graphs with a stub
+model and vector store. The routed graph asks the supervisor (an LLM call
+unless the fast-path router is confident) and then the search node (a
+second call); the single-call graph makes one tool-enabled call and
+templates the reply.
+
+    cd apps/backend
+    python -m benchmarks.agent_modes --turns 50 --llm-latency 0.3
+    python -m benchmarks.agent_modes --fast-router    # routed mode with the rule-based router on
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("VERTEX_INDEX_ID", "bench-index")
+os.environ.setdefault("VERTEX_ENDPOINT_ID", "bench-endpoint")
+if "--fast-router" not in sys.argv:
+    os.environ["FAST_ROUTER_ENABLED"] = "false"
+
+from langchain_core.messages import HumanMessage
+
+from src import agent
+from src.cache import search_cache
+from src.retrieval import retrieval
+
+from .fakes import StubChatModel, StubVectorStore
+
+model_calls = {"count": 0}
+
+
+class CountingChatModel(StubChatModel):
+    async def _agenerate(self, *args, **kwargs):
+        model_calls["count"] += 1
+        return await super()._agenerate(*args, **kwargs)
+
+
+async def run(graph, turns: int):
+    latencies = []
+    calls_before = model_calls["count"]
+    for turn in range(turns):
+        # Distinct wording each turn so the search cache never answers
+        inputs = {"messages": [HumanMessage(content=f"looking for a linen shirt, style {turn}")], "shop_domain": "bench.myshopify.com"}
+        start = time.perf_counter()
+        result = await graph.ainvoke(inputs)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "calls": (model_calls["count"] - calls_before) / turns,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "reply": result["messages"][-1].content.splitlines()[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    parser.add_argument("--fast-router", action="store_true", help="Leave the rule-based router on in routed mode")
+    args = parser.parse_args()
+
+    agent.set_llm(CountingChatModel(latency=args.llm_latency))
+    retrieval.set_store(StubVectorStore(latency=args.search_latency))
+
+    print(f"{'mode':>7} {'LLM calls':>10} {'p50 s':>7} {'p95 s':>7}  reply")
+    for mode in ("routed", "single"):
+        search_cache.invalidate("bench.myshopify.com")
+        result = asyncio.run(run(agent.compile_agent(mode=mode), args.turns))
+        print(f"{mode:>7} {result['calls']:>10.1f} {result['p50']:>7.3f} {result['p95']:>7.3f}  {result['reply']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Cart operations against the local mock Storefront server: one mutation per
+item vs. one batched mutation per turn.
+
+Writes a catalogue snapshot of synthetic mock-Shopify products, starts
+benchmarks.mock_storefront in a subprocess, and adds several products to
+a new cart in one turn, first with one add_to_cart tool invocation (and so
+one Storefront mutation) per item, then through the cart agent node, which
+applies every cart call of the model's response as one batch. Follows up
+with a batched quantity change and removal in the same cart, and checks
+the cart's contents after each step.
+
+    cd apps/backend
+    python -m benchmarks.cart_batching --items 5 --latency 0.1
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("VERTEX_INDEX_ID", "bench-index")
+os.environ.setdefault("VERTEX_ENDPOINT_ID", "bench-endpoint")
+
+import httpx
+from langchain_core.messages import HumanMessage
+
+from src import agent
+from src.cart import CartService
+from src.catalogue import catalogue_snapshots
+from src.normalize import prepare_product
+from src.shopify_client import ShopifyClient, close_connections
+
+from .fakes import StubChatModel
+from .fetch_memory import free_port, wait_for_port
+from .mock_shopify import synthetic_product
+
+SHOP = "bench.myshopify.com"
+
+
+def in_stock_products(count: int):
+    records = {}
+    n = 0
+    while len(records) < count:
+        record = prepare_product(synthetic_product(n)).record
+        if record.available:
+            records[record.id] = record
+        n += 1
+    return records
+
+
+async def stats(stats_url: str):
+    async with httpx.AsyncClient() as http:
+        return (await http.get(stats_url)).json()
+
+
+async def measure(stats_url: str, run):
+    before = await stats(stats_url)
+    start = time.perf_counter()
+    result = await run()
+    elapsed = time.perf_counter() - start
+    after = await stats(stats_url)
+    mutations = sum(after.get(name, 0) - before.get(name, 0) for name in ("cartCreate", "cartLinesAdd", "cartLinesUpdate", "cartLinesRemove"))
+    return result, elapsed, mutations
+
+
+async def run(storefront_url: str, stats_url: str, product_ids):
+    client = ShopifyClient(SHOP, "", storefront_token="token", storefront_url=storefront_url)
+
+    async def get_client(shop):
+        return client
+
+    agent.cart_service = CartService(get_client)
+    rows = []
+
+    async def per_item():
+        cart_id = ""
+        for product_id in product_ids:
+            output = await agent.add_to_cart.ainvoke({"product_id": product_id, "cart_id": cart_id, "shop_domain": SHOP})
+            cart_id = output["cart"]["id"]
+        return output["cart"]
+
+    cart, elapsed, mutations = await measure(stats_url, per_item)
+    assert cart["total_quantity"] == len(product_ids)
+    rows.append(("per item", "add", elapsed, mutations, cart["total_quantity"]))
+
+    async def batched(message: str, cart_id: str = ""):
+        state = {"messages": [HumanMessage(content=message)], "shop_domain": SHOP, "cart_id": cart_id}
+        update = await agent.cart_agent_node(state)
+        return update.get("cart_id", cart_id), update["messages"][-1].content
+
+    (cart_id, reply), elapsed, mutations = await measure(stats_url, lambda: batched("add " + " and ".join(product_ids) + " to my cart"))
+    cart = await client.fetch_cart(cart_id)
+    assert cart["totalQuantity"] == len(product_ids), reply
+    rows.append(("batched", "add", elapsed, mutations, cart["totalQuantity"]))
+
+    (_, reply), elapsed, mutations = await measure(stats_url, lambda: batched(f"set {product_ids[0]} and {product_ids[1]} to 3", cart_id))
+    cart = await client.fetch_cart(cart_id)
+    assert cart["totalQuantity"] == len(product_ids) + 4, reply
+    rows.append(("batched", "update", elapsed, mutations, cart["totalQuantity"]))
+
+    (_, reply), elapsed, mutations = await measure(stats_url, lambda: batched("remove " + " and ".join(product_ids[1:]), cart_id))
+    cart = await client.fetch_cart(cart_id)
+    assert cart["totalQuantity"] == 3, reply
+    rows.append(("batched", "remove", elapsed, mutations, cart["totalQuantity"]))
+
+    await close_connections()
+    return rows, reply
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=5, help="Products added in one turn")
+    parser.add_argument("--latency", type=float, default=0.1, help="Mock Storefront seconds per request")
+    args = parser.parse_args()
+    if args.items < 2:
+        parser.error("--items must be at least 2")
+
+    catalogue_snapshots.directory = tempfile.mkdtemp(prefix="cart-bench-")
+    records = in_stock_products(args.items)
+    catalogue_snapshots.save(SHOP, records)
+    agent.set_llm(StubChatModel(latency=0))
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.mock_storefront", "--port", str(port), "--latency", str(args.latency)])
+    try:
+        wait_for_port(port)
+        rows, reply = asyncio.run(run(f"http://127.0.0.1:{port}/api/2024-01/graphql.json", f"http://127.0.0.1:{port}/stats", list(records)))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{'execution':>10} {'operation':>10} {'seconds':>8} {'mutations':>10} {'cart qty':>9}")
+    for name, operation, elapsed, mutations, quantity in rows:
+        print(f"{name:>10} {operation:>10} {elapsed:>8.3f} {mutations:>10} {quantity:>9}")
+    print(f"\nLast reply:\n{reply}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Catalogue snapshot: open time, lookup latency and resident memory.
+
+Writes a snapshot of synthetic mock-Shopify products, then compares looking
+products up by id in the memory-mapped snapshot against loading the same
+records from a JSON file into a dict. The snapshot opens in constant time
+and keeps almost nothing on the Python heap; the dict pays for the whole
+catalogue up front.
+
+    cd apps/backend
+    python -m benchmarks.catalogue_snapshot --products 100000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from src.catalogue import CatalogueSnapshot
+from src.normalize import prepare_product
+
+from .mock_shopify import synthetic_product
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def timed_lookups(lookup, ids):
+    latencies = []
+    for product_id in ids:
+        start = time.perf_counter()
+        lookup(product_id)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name, open_seconds, memory, latencies):
+    print(f"{name:>10} {open_seconds * 1000:>9.1f} {memory / 2**20:>8.1f} {percentile(latencies, 0.5) * 1e6:>8.1f} {percentile(latencies, 0.99) * 1e6:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=10000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="catalogue-bench-")
+    records = [prepare_product(synthetic_product(n)).record for n in range(args.products)]
+
+    start = time.perf_counter()
+    CatalogueSnapshot.write(os.path.join(directory, "snapshot"), records)
+    print(f"Wrote {args.products} products in {time.perf_counter() - start:.2f}s\n")
+
+    json_path = os.path.join(directory, "records.json")
+    with open(json_path, "w") as f:
+        json.dump({record.id: record.to_dict() for record in records}, f)
+    del records
+
+    rng = random.Random(0)
+    ids = [f"gid://shopify/Product/{rng.randrange(args.products)}" for _ in range(args.lookups)]
+
+    print(f"{'source':>10} {'open ms':>9} {'heap MB':>8} {'p50 us':>8} {'p99 us':>8}")
+    tracemalloc.start()
+    start = time.perf_counter()
+    snapshot = CatalogueSnapshot.open(os.path.join(directory, "snapshot"))
+    open_seconds = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    # Tracing slows every allocation, so time lookups without it
+    tracemalloc.stop()
+    report("snapshot", open_seconds, memory, timed_lookups(snapshot.get, ids))
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(json_path) as f:
+        loaded = json.load(f)
+    open_seconds = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    report("json dict", open_seconds, memory, timed_lookups(loaded.get, ids))
+
+
+if __name__ == "__main__":
+    main()
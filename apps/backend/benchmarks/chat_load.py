@@ -0,0 +1,84 @@
+"""
+Load benchmark for /chat with stubbed model and search backends.
+
+Runs batches of concurrent requests against a single in-process worker and
+reports throughput and latency per concurrency level. With a non-blocking
+chat path, throughput should grow roughly linearly with concurrency until
+the blocking pool (BLOCKING_POOL_SIZE) becomes the bottleneck.
+
+    cd apps/backend
+    python -m benchmarks.chat_load --requests 200 --concurrency 1 8 32 64
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("VERTEX_INDEX_ID", "bench-index")
+os.environ.setdefault("VERTEX_ENDPOINT_ID", "bench-endpoint")
+
+import httpx
+
+from src.agent import set_llm
+from src.concurrency import BLOCKING_POOL_SIZE, install_default_executor
+from src.main import app
+from src.retrieval import retrieval
+
+from .fakes import StubChatModel, StubVectorStore
+
+
+async def run_level(client: httpx.AsyncClient, total: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/chat", json={"message": f"red dress {i % 10}"})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "seconds": elapsed,
+        "rps": total / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    install_default_executor()
+    set_llm(StubChatModel(latency=args.llm_latency))
+    retrieval.set_store(StubVectorStore(latency=args.search_latency))
+
+    # Supervisor + search node each make one model call, plus one search
+    floor = 2 * args.llm_latency + args.search_latency
+    print(f"Per-request floor: {floor:.2f}s, blocking pool size: {BLOCKING_POOL_SIZE}")
+    print(f"{'concurrency':>11} {'rps':>8} {'p50':>7} {'p95':>7} {'speedup':>8}")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120.0) as client:
+        baseline = None
+        for concurrency in args.concurrency:
+            result = await run_level(client, args.requests, concurrency)
+            baseline = baseline or result["rps"]
+            print(f"{concurrency:>11} {result['rps']:>8.1f} {result['p50']:>7.3f} {result['p95']:>7.3f} {result['rps'] / baseline:>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
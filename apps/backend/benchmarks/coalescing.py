@@ -0,0 +1,122 @@
+"""
+Single-flight coalescing of identical concurrent requests (a flash-sale burst).
+
+- search: --callers concurrent search_products calls for the same query
+          (in a few phrasings that share a cache key), against a stub vector
+          store, starting from an empty search cache; reports wall time and
+          the embeddings and vector searches actually made
+- sync:   --callers concurrent identical POST /sync requests to the
+          in-process app; reports wall time, job enqueues, distinct jobs and
+          how many responses said "accepted"
+
+Each runs with coalescing and with a pass-through in its place, then the
+single-flight counters from /metrics are printed.
+
+    cd apps/backend
+    python -m benchmarks.coalescing --callers 100 --search-latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="coalescing-bench-")
+os.environ["SYNC_JOBS_PATH"] = os.path.join(_tmp, "jobs.sqlite")
+os.environ["SHOP_REGISTRY_DIR"] = os.path.join(_tmp, "shops")
+os.environ.setdefault("VERTEX_INDEX_ID", "bench-index")
+os.environ.setdefault("VERTEX_ENDPOINT_ID", "bench-endpoint")
+
+import httpx
+
+from src import agent, main
+from src.cache import search_cache
+from src.concurrency import SingleFlight, install_default_executor
+from src.retrieval import retrieval
+from src.telemetry import stage_metrics
+
+from .fakes import StubEmbeddings, StubVectorStore
+
+PHRASINGS = ["Red dresses under $50", "red dresses under $50", "RED DRESSES UNDER $50!", "red dresses, under $50"]
+
+
+class PassThrough(SingleFlight):
+    """Every call made on its own, as without coalescing."""
+
+    async def do(self, key, func, *args, **kwargs):
+        return await func(*args, **kwargs), False
+
+
+def stage_count(stage: str) -> int:
+    return stage_metrics.snapshot()["stages"].get(stage, {}).get("count", 0)
+
+
+async def search_burst(callers: int):
+    search_cache.invalidate("")
+    embeds, searches = stage_count("embed.query"), stage_count("vector.search")
+    start = time.perf_counter()
+    results = await asyncio.gather(*(agent.search_products.ainvoke({"query": PHRASINGS[i % len(PHRASINGS)]}) for i in range(callers)))
+    elapsed = time.perf_counter() - start
+    assert all(results), "a search came back empty"
+    return elapsed, stage_count("embed.query") - embeds, stage_count("vector.search") - searches
+
+
+async def sync_burst(client: httpx.AsyncClient, callers: int, shop: str):
+    enqueues = 0
+    enqueue = main.sync_jobs.enqueue
+
+    def counting_enqueue(*args, **kwargs):
+        nonlocal enqueues
+        enqueues += 1
+        return enqueue(*args, **kwargs)
+
+    main.sync_jobs.enqueue = counting_enqueue
+    try:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.post("/sync", json={"shop_url": shop, "api_token": "token"}) for _ in range(callers)
+        ))
+        elapsed = time.perf_counter() - start
+    finally:
+        main.sync_jobs.enqueue = enqueue
+    bodies = [response.json() for response in responses]
+    return elapsed, enqueues, len({body["job_id"] for body in bodies}), sum(body["status"] == "accepted" for body in bodies)
+
+
+async def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--callers", type=int, default=100)
+    parser.add_argument("--search-latency", type=float, default=0.05, help="Seconds per vector search")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per query embedding")
+    args = parser.parse_args()
+
+    install_default_executor()
+    retrieval.set_store(StubVectorStore(latency=args.search_latency, embeddings=StubEmbeddings(latency=args.embed_latency)))
+    flights = {"search": (agent, "search_flights"), "embed": (retrieval, "_embed_flights"), "sync": (main, "sync_flights")}
+    originals = {name: getattr(owner, attribute) for name, (owner, attribute) in flights.items()}
+
+    print(f"{'search':>10} {'seconds':>8} {'embeds':>7} {'searches':>9}")
+    for coalescing in (False, True):
+        for name, (owner, attribute) in flights.items():
+            setattr(owner, attribute, originals[name] if coalescing else PassThrough(name))
+        elapsed, embeds, searches = await search_burst(args.callers)
+        print(f"{'on' if coalescing else 'off':>10} {elapsed:>8.3f} {embeds:>7} {searches:>9}")
+
+    print(f"\n{'sync':>10} {'seconds':>8} {'enqueues':>9} {'jobs':>5} {'accepted':>9}")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=60.0) as client:
+        for coalescing in (False, True):
+            for name, (owner, attribute) in flights.items():
+                setattr(owner, attribute, originals[name] if coalescing else PassThrough(name))
+            # A different shop per run, so each starts without an active job
+            elapsed, enqueues, jobs, accepted = await sync_burst(client, args.callers, f"burst-{coalescing}.myshopify.com")
+            print(f"{'on' if coalescing else 'off':>10} {elapsed:>8.3f} {enqueues:>9} {jobs:>5} {accepted:>9}")
+        metrics = (await client.get("/metrics")).text
+
+    print("\n/metrics:")
+    for line in metrics.splitlines():
+        if line.startswith("shop_agent_singleflight_calls_total"):
+            print(f"  {line}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
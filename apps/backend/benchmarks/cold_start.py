@@ -0,0 +1,105 @@
+"""
+Cold start: import time per backend module, and time until a fresh server answers.
+
+- imports: each src module is imported in a fresh interpreter with
+           `-X importtime`; reports its cumulative import time (the module
+           and everything it pulls in) and whether LangGraph or the Vertex
+           AI SDK came with it
+- startup: launches `uvicorn src.main:app` and reports the time from launch
+           until GET / answers, with the startup warm-up (STARTUP_WARMUP)
+           on and off, and how long the background warm-up took
+
+Medians over --runs runs. Sync workers are disabled (SYNC_WORKERS=0), so
+only the API process is measured.
+
+    cd apps/backend
+    python -m benchmarks.cold_start --runs 3
+"""
+import argparse
+import glob
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from .fetch_memory import free_port
+
+HEAVY = {"langgraph": "langgraph", "vertexai": "langchain_google_vertexai"}
+
+
+def import_time(module: str):
+    """(seconds, heavy packages loaded) for importing `module` in a fresh interpreter."""
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True).stderr
+    match = re.search(rf"^import time:\s+\d+ \|\s+(\d+) \| {re.escape(module)}$", output, re.MULTILINE)
+    loaded = [name for name, package in HEAVY.items() if re.search(rf"\| +{package}$", output, re.MULTILINE)]
+    return int(match.group(1)) / 1e6, loaded
+
+
+def startup_time(warmup: bool, data_dir: str):
+    """(seconds until GET / answers, seconds until the warm-up finished or None) for one server launch."""
+    port = free_port()
+    log_path = os.path.join(data_dir, f"server-{port}.log")
+    env = dict(
+        os.environ,
+        STARTUP_WARMUP="true" if warmup else "false",
+        SYNC_WORKERS="0",
+        SYNC_JOBS_PATH=os.path.join(data_dir, "jobs.sqlite"),
+        SHOP_REGISTRY_DIR=os.path.join(data_dir, "shops"),
+        PYTHONWARNINGS="ignore",
+    )
+    with open(log_path, "w") as log:
+        start = time.perf_counter()
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port)], stdout=log, stderr=subprocess.STDOUT, env=env)
+    try:
+        ready = None
+        while ready is None and time.perf_counter() - start < 60:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/", timeout=1.0).status_code == 200:
+                    ready = time.perf_counter() - start
+            except httpx.TransportError:
+                time.sleep(0.01)
+        warmed = None
+        while warmup and warmed is None and time.perf_counter() - start < 60:
+            with open(log_path) as log:
+                finished = "Warm-up finished" in log.read()
+            if finished:
+                warmed = time.perf_counter() - start
+            else:
+                time.sleep(0.02)
+        return ready, warmed
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modules", nargs="+", help="Modules to time (default: every src module)")
+    args = parser.parse_args()
+
+    modules = args.modules or sorted(f"src.{os.path.basename(path)[:-3]}" for path in glob.glob("src/*.py") if not path.endswith("__init__.py"))
+    rows = []
+    for module in modules:
+        samples = [import_time(module) for _ in range(args.runs)]
+        rows.append((module, statistics.median(seconds for seconds, _ in samples), samples[0][1]))
+    print(f"{'module':<20} {'import s':>9}  heavy dependencies")
+    for module, seconds, loaded in sorted(rows, key=lambda row: -row[1]):
+        print(f"{module:<20} {seconds:>9.3f}  {', '.join(loaded) or '-'}")
+
+    data_dir = tempfile.mkdtemp(prefix="cold-start-")
+    print(f"\n{'warm-up':>8} {'GET / s':>8} {'warmed s':>9}")
+    for warmup in (True, False):
+        samples = [startup_time(warmup, data_dir) for _ in range(args.runs)]
+        ready = statistics.median(sample[0] for sample in samples)
+        warmed = [sample[1] for sample in samples if sample[1] is not None]
+        print(f"{'on' if warmup else 'off':>8} {ready:>8.2f} {statistics.median(warmed) if warmed else float('nan'):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Prompt size per turn with conversation memory: full history vs. a fixed
+window plus running summary.
+
+Plays one long conversation through the checkpointed agent graph (stub
+model, in-memory checkpointer) twice. In "full" mode every prompt carries
+the whole history; in "window" mode prompts carry the last
+MEMORY_WINDOW_MESSAGES messages and a summary that the summarizer updates
+in the background between turns.
+
+    cd apps/backend
+    python -m benchmarks.conversation_memory --turns 40
+"""
+import argparse
+import asyncio
+import functools
+import os
+import time
+
+os.environ["FAST_ROUTER_ENABLED"] = "false"
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from src import agent
+from src.memory import (
+    ConversationSummarizer,
+    MemoryMetrics,
+    prompt_window,
+    session_lock,
+    thread_config,
+)
+
+from .fakes import StubChatModel
+
+REPLY = "Here are a few ideas that match what you described, with notes on fit, materials and price. " * 4
+
+
+async def converse(turns: int, windowed: bool, llm_latency: float):
+    metrics = MemoryMetrics()
+    agent.memory_metrics = metrics
+    agent.prompt_window = prompt_window if windowed else functools.partial(prompt_window, max_messages=10**9, max_tokens=10**9)
+    agent.set_llm(StubChatModel(latency=llm_latency, route="general_chat", reply=REPLY))
+    summarizer = ConversationSummarizer(agent.get_llm, metrics=metrics)
+
+    graph = agent.compile_agent(InMemorySaver())
+    config = thread_config("bench.myshopify.com", "session-1")
+    per_turn, latencies = [], []
+    for turn in range(turns):
+        inputs = {"messages": [HumanMessage(content=f"Turn {turn}: I'd like something for a summer wedding, not too formal.")], "shop_domain": "bench.myshopify.com"}
+        before = metrics.prompt_tokens_total
+        start = time.perf_counter()
+        async with session_lock(config):
+            await graph.ainvoke(inputs, config=config)
+        latencies.append(time.perf_counter() - start)
+        per_turn.append(metrics.prompt_tokens_total - before)
+        if windowed:
+            summarizer.schedule(graph, config)
+    # Let a summary still in flight finish before reading the stored history
+    await asyncio.gather(*summarizer._running.values())
+    stored = len((await graph.aget_state(config)).values["messages"])
+    return per_turn, latencies, stored, metrics.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--llm-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    print(f"{'mode':>7} {'turn 1':>7} {'turn 10':>8} {'last':>6} {'mean':>7} {'p50 ms':>7} {'stored':>7} {'summaries':>10}")
+    for windowed in (False, True):
+        per_turn, latencies, stored, snapshot = asyncio.run(converse(args.turns, windowed, args.llm_latency))
+        latencies.sort()
+        print(
+            f"{'window' if windowed else 'full':>7} {per_turn[0]:>7} {per_turn[min(9, len(per_turn) - 1)]:>8} {per_turn[-1]:>6} "
+            f"{sum(per_turn) / len(per_turn):>7.0f} {latencies[len(latencies) // 2] * 1000:>7.1f} {stored:>7} {snapshot['summaries']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
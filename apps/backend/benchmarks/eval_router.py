@@ -0,0 +1,102 @@
+"""
+Offline evaluation of the rule-based fast-path router.
+
+Reads JSONL files of {"message": ..., "route": ...} rows and reports for
+each, per confidence threshold, how many messages skip the LLM (hit rate)
+and how many of those are routed correctly (accuracy), plus a confusion
+matrix and the misroutes at the configured threshold.
+
+router_labels.jsonl is the set the rules were written against;
+router_heldout.jsonl was written separately, with negatives that share
+keywords with another route ("where is my order?", "can I order this in
+blue?"), to check the rules generalise.
+
+    cd apps/backend
+    python -m benchmarks.eval_router --data benchmarks/data/router_heldout.jsonl
+"""
+import argparse
+import json
+from collections import Counter
+
+from src.router import FAST_ROUTER_THRESHOLD, ROUTES, IntentRouter
+
+DEFAULT_DATA = ["benchmarks/data/router_labels.jsonl", "benchmarks/data/router_heldout.jsonl"]
+
+
+def load_examples(path: str):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(router: IntentRouter, examples, threshold: float):
+    hits = correct = 0
+    confusion: Counter = Counter()
+    misroutes = []
+    for example in examples:
+        decision = router.classify(example["message"])
+        if decision.route is None or decision.confidence < threshold:
+            continue
+        hits += 1
+        confusion[(example["route"], decision.route)] += 1
+        if decision.route == example["route"]:
+            correct += 1
+        else:
+            misroutes.append((example["message"], example["route"], decision))
+    return {
+        "threshold": threshold,
+        "hit_rate": hits / len(examples) if examples else 0.0,
+        "accuracy": correct / hits if hits else None,
+        "hits": hits,
+        "confusion": confusion,
+        "misroutes": misroutes,
+    }
+
+
+def report(router: IntentRouter, path: str, threshold: float, as_json: bool):
+    examples = load_examples(path)
+    sweep = [evaluate(router, examples, t) for t in (0.5, 0.6, 0.7, 0.75, 0.8, 0.9)]
+    result = evaluate(router, examples, threshold)
+
+    if as_json:
+        return {
+            "data": path,
+            "examples": len(examples),
+            "threshold": threshold,
+            "hit_rate": result["hit_rate"],
+            "accuracy": result["accuracy"],
+            "sweep": [{"threshold": r["threshold"], "hit_rate": r["hit_rate"], "accuracy": r["accuracy"]} for r in sweep],
+        }
+
+    print(f"{len(examples)} labelled messages from {path}\n")
+    print(f"{'threshold':>9} {'hit rate':>9} {'accuracy':>9}")
+    for r in sweep:
+        accuracy = f"{r['accuracy']:.1%}" if r["accuracy"] is not None else "-"
+        print(f"{r['threshold']:>9.2f} {r['hit_rate']:>9.1%} {accuracy:>9}")
+
+    print(f"\nConfusion matrix at threshold {threshold} (rows: label, columns: fast route)")
+    print(f"{'':>14}" + "".join(f"{route:>14}" for route in ROUTES))
+    for label in ROUTES:
+        print(f"{label:>14}" + "".join(f"{result['confusion'][(label, route)]:>14}" for route in ROUTES))
+
+    if result["misroutes"]:
+        print("\nMisroutes:")
+        for message, label, decision in result["misroutes"]:
+            print(f"  {message!r}: expected {label}, got {decision.route} ({decision.confidence:.2f})")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", nargs="+", default=DEFAULT_DATA)
+    parser.add_argument("--threshold", type=float, default=FAST_ROUTER_THRESHOLD)
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    router = IntentRouter()
+    results = [report(router, path, args.threshold, args.json) for path in args.data]
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
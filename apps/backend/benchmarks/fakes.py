@@ -0,0 +1,242 @@
+"""
+Local stand-ins for the model and search backends, with configurable latency.
+They let the benchmarks run without GCP credentials or network access.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from collections.abc import AsyncIterator
+from typing import Any
+
+from google.api_core.exceptions import ResourceExhausted
+from langchain_core.documents import Document
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Chat model that sleeps for `latency` seconds and answers deterministically:
+    routing prompts get `route`, tool-bound calls get a search tool call (one
+    per product for "compare X and Y") or, with cart tools, one cart call per
+    product ID in the message; everything else, including calls that follow
+    tool results, gets a short canned reply.
+    """
+    latency: float = 0.3
+    route: str = "search_agent"
+    reply: str = "Here is what I found for you."
+    tool_names: list[str] = Field(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def bind_tools(self, tools: list[Any], **kwargs: Any) -> "StubChatModel":
+        names = [getattr(t, "name", str(t)) for t in tools]
+        return self.model_copy(update={"tool_names": names})
+
+    def _respond(self, messages: list[BaseMessage]) -> AIMessage:
+        first = messages[0]
+        first_content = first.get("content", "") if isinstance(first, dict) else first.content
+        if "Respond with ONLY the name of the next agent" in str(first_content):
+            return AIMessage(content=self.route)
+
+        last = messages[-1]
+        query = last.get("content", "") if isinstance(last, dict) else last.content
+        # Once tool results are back, answer from them
+        if "search_products" in self.tool_names and not isinstance(last, ToolMessage):
+            # "compare X and Y" asks for one search per product
+            queries = str(query).split(" and ") if str(query).startswith("compare ") else [str(query)]
+            return AIMessage(content="", tool_calls=[{
+                "name": "search_products", "args": {"query": q.removeprefix("compare ")}, "id": uuid.uuid4().hex
+            } for q in queries])
+        if "add_to_cart" in self.tool_names and not isinstance(last, ToolMessage):
+            # "add <id> and <id>", "remove <id>", "set <id> to 3": one cart call per product id
+            product_ids = re.findall(r"gid://shopify/Product/\d+", str(query))
+            quantity = re.search(r"\bto (\d+)\b", str(query))
+            if str(query).startswith("remove "):
+                calls = [("remove_from_cart", {"product_id": product_id}) for product_id in product_ids]
+            elif quantity:
+                calls = [("update_cart_item", {"product_id": product_id, "quantity": int(quantity.group(1))}) for product_id in product_ids]
+            else:
+                calls = [("add_to_cart", {"product_id": product_id}) for product_id in product_ids]
+            return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": uuid.uuid4().hex} for name, args in calls])
+        return AIMessage(content=self.reply)
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _astream(self, messages: list[BaseMessage], stop: list[str] | None = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        # Spend half the latency before the first token, spread the rest across tokens
+        message = self._respond(messages)
+        await asyncio.sleep(self.latency / 2)
+        if message.tool_calls:
+            call = message.tool_calls[0]
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[{
+                "name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0
+            }]))
+            return
+
+        tokens = message.content.split(" ")
+        for i, token in enumerate(tokens):
+            await asyncio.sleep(self.latency / 2 / len(tokens))
+            text = token if i == 0 else " " + token
+            if run_manager:
+                await run_manager.on_llm_new_token(text)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+
+class StubEmbeddings:
+    """
+    Deterministic bag-of-words embeddings: each word is hashed into one of
+    `dimensions` buckets, so queries sharing words get similar vectors.
+    """
+
+    def __init__(self, latency: float = 0.05, dimensions: int = 64, per_text_latency: float = 0.0, quota_error_rate: float = 0.0):
+        self.latency = latency
+        self.dimensions = dimensions
+        self.per_text_latency = per_text_latency
+        self.quota_error_rate = quota_error_rate
+        self.calls = 0
+
+    def _vector(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimensions
+        for word in text.lower().split():
+            digest = hashlib.md5(word.encode()).digest()
+            vector[digest[0] % self.dimensions] += 1.0
+        return vector
+
+    def embed_query(self, text: str) -> list[float]:
+        time.sleep(self.latency)
+        return self._vector(text)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls += 1
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        if self.quota_error_rate and random.random() < self.quota_error_rate:
+            raise ResourceExhausted("429 Quota exceeded for aiplatform.googleapis.com/online_prediction_requests_per_base_model")
+        return [self._vector(text) for text in texts]
+
+
+class StubVectorStore:
+    """
+    Blocking vector store: searches sleep like a synchronous network client
+    would, then return synthetic products.
+    """
+
+    def __init__(self, latency: float = 0.1, catalogue_size: int = 50, embeddings: StubEmbeddings | None = None, keep_records: bool = True):
+        self.latency = latency
+        self.catalogue_size = catalogue_size
+        self.embeddings = embeddings or StubEmbeddings()
+        self.keep_records = keep_records
+        self.upsert_count = 0
+        self.upserted: dict[str, dict[str, Any]] = {}
+        self.deleted: list[str] = []
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k=k)
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        time.sleep(self.latency)
+        start = int(sum(i * v for i, v in enumerate(embedding))) % self.catalogue_size
+        docs = []
+        for i in range(k):
+            n = (start + i) % self.catalogue_size
+            docs.append(Document(page_content=f"Product {n}", metadata={
+                "id": f"gid://shopify/Product/{n}",
+                "title": f"Product {n}",
+                "price": f"{10 + n}.00",
+                "handle": f"product-{n}",
+                "category": "General",
+            }))
+        return docs
+
+    def add_texts_with_embeddings(self, texts: list[str], embeddings: list[list[float]], metadatas: list[dict[str, Any]] | None = None, ids: list[str] | None = None, **kwargs: Any) -> list[str]:
+        time.sleep(self.latency)
+        self.upsert_count += len(ids or [])
+        if self.keep_records:
+            for i, product_id in enumerate(ids or []):
+                self.upserted[product_id] = metadatas[i] if metadatas else {}
+        return list(ids or [])
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any):
+        time.sleep(self.latency)
+        self.deleted.extend(ids or [])
+        for product_id in ids or []:
+            self.upserted.pop(product_id, None)
+
+
+class FakeFirestore:
+    """
+    In-memory subset of the Firestore client API used by the backend:
+    collection/document chains with set, get, delete and stream.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.documents: dict[str, dict[str, Any]] = {}
+
+    def collection(self, name: str) -> "_FakeCollection":
+        return _FakeCollection(self, name)
+
+
+class _FakeCollection:
+    def __init__(self, db: FakeFirestore, path: str):
+        self.db = db
+        self.path = path
+
+    def document(self, name: str) -> "_FakeDocument":
+        return _FakeDocument(self.db, f"{self.path}/{name}")
+
+    def stream(self):
+        time.sleep(self.db.latency)
+        prefix = self.path + "/"
+        for path in sorted(self.db.documents):
+            if path.startswith(prefix) and "/" not in path[len(prefix):]:
+                yield _FakeSnapshot(self.db, path)
+
+
+class _FakeDocument:
+    def __init__(self, db: FakeFirestore, path: str):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name: str) -> _FakeCollection:
+        return _FakeCollection(self.db, f"{self.path}/{name}")
+
+    def set(self, data: dict[str, Any], merge: bool = False):
+        time.sleep(self.db.latency)
+        if merge and self.path in self.db.documents:
+            self.db.documents[self.path].update(data)
+        else:
+            self.db.documents[self.path] = dict(data)
+
+    def get(self) -> "_FakeSnapshot":
+        time.sleep(self.db.latency)
+        return _FakeSnapshot(self.db, self.path)
+
+    def delete(self):
+        self.db.documents.pop(self.path, None)
+
+
+class _FakeSnapshot:
+    def __init__(self, db: FakeFirestore, path: str):
+        self.reference = _FakeDocument(db, path)
+        self.id = self.reference.id
+        self._data = db.documents.get(path)
+        self.exists = self._data is not None
+
+    def to_dict(self) -> dict[str, Any] | None:
+        return dict(self._data) if self._data is not None else None
@@ -0,0 +1,134 @@
+"""
+Peak memory of catalogue ingestion against a local mock Shopify server.
+
+Starts benchmarks.mock_shopify in a subprocess with a synthetic catalogue,
+then runs each mode in its own process and reports peak RSS:
+
+- list:   fetch_all_products, then build texts/metadatas/ids and all
+          embeddings in memory (the pre-streaming ingest)
+- stream: ProductIndexer.ingest_products, which consumes one page at a time
+
+Embedding and vector store calls are stubbed with zero latency.
+
+    cd apps/backend
+    python -m benchmarks.fetch_memory --products 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+async def run_list(base_url: str):
+    from src.normalize import prepare_products
+    from src.shopify_client import ShopifyClient
+
+    from .fakes import StubEmbeddings
+
+    client = ShopifyClient("bench.myshopify.com", "token", base_url=base_url)
+    embeddings_model = StubEmbeddings(latency=0, dimensions=768)
+    products = await client.fetch_all_products()
+    prepared = prepare_products(products)
+    texts = [item.context for item in prepared]
+    metadatas = [item.metadata for item in prepared]
+    ids = [p["id"] for p in products]
+    embeddings = []
+    for i in range(0, len(texts), 20):
+        embeddings.extend(embeddings_model.embed_documents(texts[i:i + 20]))
+    return {"products": len(ids), "embeddings": len(embeddings), "metadatas": len(metadatas)}
+
+
+async def run_stream(base_url: str):
+    from src.indexer import ProductIndexer
+    from src.manifest import LocalManifestStore
+    from src.shopify_client import ShopifyClient
+
+    from .fakes import FakeFirestore, StubEmbeddings, StubVectorStore
+
+    store = StubVectorStore(latency=0, keep_records=False)
+
+    class BenchIndexer(ProductIndexer):
+        def _create_vector_store(self, index_endpoint_name, index_id):
+            return store
+
+    client = ShopifyClient("bench.myshopify.com", "token", base_url=base_url)
+    with tempfile.TemporaryDirectory() as manifest_dir:
+        indexer = BenchIndexer(
+            client,
+            manifest_store=LocalManifestStore(manifest_dir),
+            embeddings_model=StubEmbeddings(latency=0, dimensions=768),
+            db=FakeFirestore(),
+        )
+        result = await indexer.ingest_products("bench-endpoint", "bench-index", full_rebuild=True)
+    return {"products": result["indexed"], "upserted": store.upsert_count}
+
+
+def child(mode: str, base_url: str):
+    start = time.perf_counter()
+    result = asyncio.run(run_list(base_url) if mode == "list" else run_stream(base_url))
+    result.update({"mode": mode, "seconds": round(time.perf_counter() - start, 2), "peak_rss_mb": round(peak_rss_mb(), 1)})
+    print(json.dumps(result))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"mock server did not start on port {port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--modes", nargs="+", default=["stream", "list"])
+    parser.add_argument("--child", choices=["list", "stream"], help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.base_url)
+        return
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.mock_shopify", "--products", str(args.products), "--port", str(port)])
+    try:
+        wait_for_port(port)
+        base_url = f"http://127.0.0.1:{port}/admin/api/2024-01/graphql.json"
+        env = dict(os.environ, PYTHONWARNINGS="ignore")
+        print(f"{'mode':>6} {'products':>9} {'seconds':>8} {'peak RSS (MB)':>14}")
+        for mode in args.modes:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.fetch_memory", "--child", mode, "--base-url", base_url],
+                capture_output=True, text=True, env=env, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:>6} {result['products']:>9} {result['seconds']:>8} {result['peak_rss_mb']:>14}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Paginated fetch vs. bulk export against the local mock Shopify server.
+
+Fetches the same synthetic catalogue both ways, checks that the rebuilt
+products (including images and variants) are identical, and reports time
+and GraphQL round trips for each mode.
+
+    cd apps/backend
+    python -m benchmarks.fetch_modes --products 20000 --latency 0.05
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+
+from src.shopify_client import ShopifyClient
+
+from .fetch_memory import free_port, wait_for_port
+
+
+async def collect(pages):
+    products = []
+    async for page in pages:
+        products.extend(page)
+    return products
+
+
+async def run(base_url: str):
+    client = ShopifyClient("bench.myshopify.com", "token", base_url=base_url)
+    results = {}
+    for mode, pages in (("paginate", client.iter_product_pages), ("bulk", client.iter_product_pages_bulk)):
+        start = time.perf_counter()
+        products = await collect(pages())
+        results[mode] = (time.perf_counter() - start, products)
+        print(f"{mode:>9}: {len(products)} products in {results[mode][0]:.2f}s")
+
+    paginated, bulk = results["paginate"][1], results["bulk"][1]
+    if paginated != bulk:
+        mismatch = next((i for i, (a, b) in enumerate(zip(paginated, bulk)) if a != b), min(len(paginated), len(bulk)))
+        raise SystemExit(f"Bulk export differs from paginated fetch at product {mismatch}")
+    print("Bulk export matches paginated fetch.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to each GraphQL request")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.mock_shopify",
+        "--products", str(args.products), "--port", str(port), "--latency", str(args.latency)
+    ])
+    try:
+        wait_for_port(port)
+        print(f"Paginated fetch needs {-(-args.products // 50)} round trips of {args.latency * 1000:.0f}ms; bulk needs a few polls.")
+        asyncio.run(run(f"http://127.0.0.1:{port}/admin/api/2024-01/graphql.json"))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Hybrid (BM25 + vector, RRF, filter pushdown) vs. vector-only product search.
+
+Indexes the synthetic mock-Shopify catalogue into a local vector index (stub
+embeddings) and a lexical index, then runs three kinds of shopper query
+through `search_products` in both modes:
+
+- sku:     "SKU-<n>-<v>" should return product n first
+- vendor:  "<vendor> <category>" results should all match both
+- price:   "<category> under $<p>" results should all be within budget
+
+Reports hit rate / precision and mean latency per query type.
+
+    cd apps/backend
+    python -m benchmarks.hybrid_search --products 20000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="hybrid-bench-")
+os.environ["VECTOR_BACKEND"] = "local"
+os.environ["LOCAL_INDEX_DIR"] = os.path.join(_tmp, "vectors")
+os.environ["LEXICAL_INDEX_DIR"] = os.path.join(_tmp, "lexical")
+
+from src import agent
+from src.agent import search_products
+from src.cache import search_cache
+from src.lexical import lexical_indexes, parse_price
+from src.normalize import prepare_products
+from src.retrieval import retrieval
+from src.vector_index import LocalVectorStore
+
+from .fakes import StubEmbeddings
+from .mock_shopify import CATEGORIES, VENDORS, synthetic_product
+
+SHOP = "bench.myshopify.com"
+
+
+def build_indexes(count: int):
+    embeddings = StubEmbeddings(latency=0, dimensions=256)
+    store = LocalVectorStore(os.path.join(_tmp, "vectors", SHOP), embedding=embeddings)
+    documents = {}
+    for start in range(0, count, 1000):
+        products = [synthetic_product(n) for n in range(start, min(start + 1000, count))]
+        prepared = prepare_products(products)
+        contexts = [item.context for item in prepared]
+        metadatas = [item.metadata for item in prepared]
+        store.add_texts_with_embeddings(contexts, embeddings.embed_documents(contexts), metadatas, [item.id for item in prepared])
+        for item in prepared:
+            documents[item.id] = item.document
+    store.save()
+    lexical_indexes.save(SHOP, documents)
+    retrieval.set_store(store)
+
+
+def queries(count: int, per_type: int):
+    rng = random.Random(0)
+    for _ in range(per_type):
+        n = rng.randrange(count)
+        yield "sku", f"SKU-{n}-{rng.randrange(3)}", f"gid://shopify/Product/{n}"
+    for _ in range(per_type):
+        vendor, category = rng.choice(VENDORS), rng.choice(CATEGORIES)
+        yield "vendor", f"{vendor} {category.lower()}", (vendor, category)
+    for _ in range(per_type):
+        category, budget = rng.choice(CATEGORIES), rng.choice([20, 35, 50])
+        yield "price", f"{category.lower()} under ${budget}", budget
+
+
+def score(kind: str, results, expected) -> float:
+    if kind == "sku":
+        return float(bool(results) and results[0]["id"] == expected)
+    if not results:
+        return 0.0
+    if kind == "vendor":
+        vendor, category = expected
+        # search_products does not return the vendor, so look it up from the product number
+        hits = [VENDORS[int(r["id"].rsplit("/", 1)[-1]) % len(VENDORS)] == vendor and r["category"] == category for r in results]
+    else:
+        hits = [parse_price(r["price"]) <= expected for r in results]
+    return sum(hits) / len(hits)
+
+
+async def run(count: int, per_type: int, hybrid: bool):
+    agent.HYBRID_SEARCH_ENABLED = hybrid
+    totals = {}
+    for kind, query, expected in queries(count, per_type):
+        search_cache.invalidate(SHOP)
+        start = time.perf_counter()
+        results = await search_products.ainvoke({"query": query, "shop_domain": SHOP})
+        elapsed = time.perf_counter() - start
+        quality, latency, n = totals.get(kind, (0.0, 0.0, 0))
+        totals[kind] = (quality + score(kind, results, expected), latency + elapsed, n + 1)
+    return {kind: (quality / n, latency / n * 1000) for kind, (quality, latency, n) in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=50, help="Queries per type")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    build_indexes(args.products)
+    print(f"Indexed {args.products} products in {time.perf_counter() - start:.1f}s\n")
+
+    print(f"{'mode':>7} {'query':>7} {'quality':>8} {'mean ms':>8}")
+    for hybrid in (False, True):
+        results = asyncio.run(run(args.products, args.queries, hybrid))
+        for kind, (quality, latency) in results.items():
+            print(f"{'hybrid' if hybrid else 'vector':>7} {kind:>7} {quality:>8.2f} {latency:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
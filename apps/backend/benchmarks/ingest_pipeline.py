@@ -0,0 +1,73 @@
+"""
+Embedding pipeline benchmark with a stub embedder and vector store.
+
+Compares the old sequential ingest (embed 20 at a time, then upload 20 at a
+time) with EmbeddingPipeline on a synthetic catalogue, optionally injecting
+quota errors to exercise the adaptive backoff.
+
+    cd apps/backend
+    python -m benchmarks.ingest_pipeline --products 2000 --quota-error-rate 0.05
+"""
+import argparse
+import asyncio
+import time
+
+from src.pipeline import EmbeddingPipeline, ProductRecord
+
+from .fakes import StubEmbeddings, StubVectorStore
+
+
+def synthetic_records(count: int):
+    for i in range(count):
+        text = f"Category: Dresses\nTitle: Summer dress {i}\nDescription: " + "Lightweight cotton dress. " * (i % 20 + 1)
+        yield ProductRecord(f"gid://shopify/Product/{i}", text, {"id": f"gid://shopify/Product/{i}", "title": f"Summer dress {i}"})
+
+
+def sequential_ingest(embedder, vector_store, records):
+    """The pre-pipeline behaviour: two sequential passes in batches of 20."""
+    records = list(records)
+    embeddings = []
+    for i in range(0, len(records), 20):
+        embeddings.extend(embedder.embed_documents([r.text for r in records[i:i + 20]]))
+    for i in range(0, len(records), 20):
+        batch = records[i:i + 20]
+        vector_store.add_texts_with_embeddings(
+            texts=[r.text for r in batch], embeddings=embeddings[i:i + 20],
+            metadatas=[r.metadata for r in batch], ids=[r.id for r in batch]
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--embed-latency", type=float, default=0.15, help="Fixed cost per embedding request (s)")
+    parser.add_argument("--per-text-latency", type=float, default=0.002, help="Extra cost per text in a request (s)")
+    parser.add_argument("--upsert-latency", type=float, default=0.1)
+    parser.add_argument("--embed-concurrency", type=int, default=4)
+    parser.add_argument("--quota-error-rate", type=float, default=0.0)
+    parser.add_argument("--skip-sequential", action="store_true")
+    args = parser.parse_args()
+
+    def backends():
+        embedder = StubEmbeddings(latency=args.embed_latency, per_text_latency=args.per_text_latency, quota_error_rate=args.quota_error_rate)
+        return embedder, StubVectorStore(latency=args.upsert_latency)
+
+    if not args.skip_sequential:
+        embedder, store = backends()
+        embedder.quota_error_rate = 0.0  # the old path has no retries
+        start = time.perf_counter()
+        await asyncio.to_thread(sequential_ingest, embedder, store, synthetic_records(args.products))
+        elapsed = time.perf_counter() - start
+        print(f"sequential: {elapsed:.2f}s ({args.products / elapsed:.0f} products/s, {embedder.calls} embed calls)")
+
+    embedder, store = backends()
+    pipeline = EmbeddingPipeline(embedder, store, embed_concurrency=args.embed_concurrency)
+    summary = await pipeline.run(synthetic_records(args.products))
+    assert len(store.upserted) == args.products, f"expected {args.products} upserts, got {len(store.upserted)}"
+    print(f"pipeline:   {summary['wall_seconds']:.2f}s ({args.products / summary['wall_seconds']:.0f} products/s, {embedder.calls} embed calls)")
+    for stage in ("prepare", "embed", "upsert"):
+        print(f"  {stage:>8}: {summary[stage]}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
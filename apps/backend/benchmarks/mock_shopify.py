@@ -0,0 +1,201 @@
+"""
+Local stand-in for the Shopify Admin GraphQL API serving a synthetic catalogue.
+
+Products are generated on the fly from their index, so the server's own
+memory does not depend on catalogue size. Run it standalone with
+
+    cd apps/backend
+    python -m benchmarks.mock_shopify --products 100000 --port 8787
+
+and point ShopifyClient at http://127.0.0.1:8787/admin/api/2024-01/graphql.json.
+Supports paginated `products` queries and bulk exports
+(bulkOperationRunQuery, currentBulkOperation and the JSONL download).
+Every response carries Shopify's `extensions.cost` report, and the server
+can enforce a leaky-bucket cost limit, answering THROTTLED when it is
+exceeded (see --restore-rate). GET /stats returns request and throttle counters.
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+from typing import Any
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+GRAPHQL_PATH = "/admin/api/2024-01/graphql.json"
+CATEGORIES = ["Dresses", "Shoes", "Bags", "Jackets", "Accessories"]
+VENDORS = ["Acme", "Northwind", "Globex", "Initech"]
+DESCRIPTION = (
+    "<p>Crafted from <strong>100% organic cotton</strong>, this piece is soft, breathable and made to last.</p>"
+    "<ul><li>Machine washable</li><li>Relaxed fit</li><li>Ethically made</li></ul>"
+)
+
+
+def synthetic_product(n: int) -> dict[str, Any]:
+    category = CATEGORIES[n % len(CATEGORIES)]
+    return {
+        "id": f"gid://shopify/Product/{n}",
+        "title": f"{category[:-1]} {n}",
+        "descriptionHtml": DESCRIPTION * (1 + n % 4),
+        "handle": f"{category.lower()}-{n}",
+        "tags": [category.lower(), f"tag-{n % 17}"],
+        "vendor": VENDORS[n % len(VENDORS)],
+        "productType": category,
+        "totalInventory": n % 40,
+        "updatedAt": "2024-01-01T00:00:00Z",
+        "priceRangeV2": {"minVariantPrice": {"amount": f"{10 + n % 90}.00", "currencyCode": "USD"}},
+        "images": {"edges": [{"node": {"url": f"https://cdn.example.com/{n}.jpg", "altText": None}}]},
+        "variants": {"edges": [
+            {"node": {
+                "id": f"gid://shopify/ProductVariant/{n * 10 + v}",
+                "title": ["S", "M", "L"][v],
+                "price": f"{10 + n % 90}.00",
+                "sku": f"SKU-{n}-{v}",
+                "availableForSale": (n + v) % 7 != 0,
+            }} for v in range(3)
+        ]},
+    }
+
+
+def bulk_lines(product_count: int):
+    """JSONL export in Shopify's bulk format: children follow their product with __parentId."""
+    chunk = []
+    for n in range(product_count):
+        product = synthetic_product(n)
+        images = product.pop("images")["edges"]
+        variants = product.pop("variants")["edges"]
+        chunk.append(json.dumps(product))
+        for edge in images + variants:
+            chunk.append(json.dumps({**edge["node"], "__parentId": product["id"]}))
+        if len(chunk) >= 1000:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
+def query_cost(query: str) -> int:
+    """Approximation of Shopify's requested cost: 1 per object, times the page size of each connection."""
+    match = re.search(r"products\(first:\s*(\d+)", query)
+    if not match:
+        return 10
+    per_product = 1
+    for nested in re.findall(r"\w+\(first:\s*(\d+)\)", query):
+        per_product += int(nested)
+    return 2 + int(match.group(1)) * per_product
+
+
+def create_app(product_count: int, bulk_polls: int = 2, latency: float = 0.0, maximum_available: float = 1000.0, restore_rate: float | None = None) -> FastAPI:
+    """
+    :param bulk_polls: number of status polls a bulk operation stays RUNNING for.
+    :param latency: seconds added to every GraphQL request, to emulate network round trips.
+    :param maximum_available: size of the cost bucket.
+    :param restore_rate: cost points restored per second; None disables throttling.
+    """
+    app = FastAPI()
+    operations: dict[str, dict[str, Any]] = {}
+    current: dict[str, Any] = {"id": None}
+    bucket = {"available": maximum_available, "updated_at": time.monotonic()}
+    stats = {"requests": 0, "throttled": 0}
+
+    def charge(cost: int):
+        now = time.monotonic()
+        if restore_rate is None:
+            bucket["available"] = maximum_available
+        else:
+            bucket["available"] = min(maximum_available, bucket["available"] + (now - bucket["updated_at"]) * restore_rate)
+        bucket["updated_at"] = now
+        allowed = bucket["available"] >= cost
+        if allowed and restore_rate is not None:
+            bucket["available"] -= cost
+        return allowed, {"cost": {
+            "requestedQueryCost": cost,
+            "actualQueryCost": cost if allowed else None,
+            "throttleStatus": {
+                "maximumAvailable": maximum_available,
+                "currentlyAvailable": bucket["available"],
+                "restoreRate": restore_rate or maximum_available,
+            },
+        }}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.get("/bulk/{operation}.jsonl")
+    async def bulk_result(operation: str):
+        return StreamingResponse(bulk_lines(product_count), media_type="application/jsonl")
+
+    @app.post(GRAPHQL_PATH)
+    async def graphql(request: Request):
+        body = await request.json()
+        query = body.get("query", "")
+        variables = body.get("variables") or {}
+        if latency:
+            await asyncio.sleep(latency)
+
+        stats["requests"] += 1
+        allowed, extensions = charge(query_cost(query))
+        if not allowed:
+            stats["throttled"] += 1
+            return {"errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}], "extensions": extensions}
+        response = await resolve(request, query, variables)
+        response["extensions"] = extensions
+        return response
+
+    async def resolve(request: Request, query: str, variables: dict[str, Any]) -> dict[str, Any]:
+        if "bulkOperationRunQuery" in query:
+            operation_id = f"gid://shopify/BulkOperation/{len(operations) + 1}"
+            operations[operation_id] = {"polls": 0}
+            current["id"] = operation_id
+            return {"data": {"bulkOperationRunQuery": {
+                "bulkOperation": {"id": operation_id, "status": "CREATED"}, "userErrors": []
+            }}}
+
+        if "currentBulkOperation" in query:
+            operation_id = current["id"]
+            if operation_id is None:
+                return {"data": {"currentBulkOperation": None}}
+            state = operations[operation_id]
+            state["polls"] += 1
+            done = state["polls"] > bulk_polls
+            return {"data": {"currentBulkOperation": {
+                "id": operation_id,
+                "status": "COMPLETED" if done else "RUNNING",
+                "errorCode": None,
+                "objectCount": str(product_count * 5 if done else 0),
+                "url": f"{str(request.base_url).rstrip('/')}/bulk/{operation_id.rsplit('/', 1)[-1]}.jsonl" if done else None,
+            }}}
+
+        match = re.search(r"products\(first:\s*(\d+)", query)
+        page_size = int(match.group(1)) if match else 50
+        start = int(variables.get("cursor") or 0)
+        end = min(start + page_size, product_count)
+        ids_only = "descriptionHtml" not in query
+
+        edges = []
+        for n in range(start, end):
+            node = {"id": f"gid://shopify/Product/{n}"} if ids_only else synthetic_product(n)
+            edges.append({"node": node, "cursor": str(n + 1)})
+
+        return {"data": {"products": {"edges": edges, "pageInfo": {"hasNextPage": end < product_count}}}}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each GraphQL request")
+    parser.add_argument("--restore-rate", type=float, help="Cost points restored per second (default: no throttling)")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.products, latency=args.latency, restore_rate=args.restore_rate), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
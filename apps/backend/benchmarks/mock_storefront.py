@@ -0,0 +1,135 @@
+"""
+Local stand-in for the Shopify Storefront GraphQL API's cart operations.
+
+Carts live in memory; variants are those of benchmarks.mock_shopify's
+synthetic catalogue (variant n * 10 + v belongs to product n), so products
+synced from the mock Admin API can be added here. Run it standalone with
+
+    cd apps/backend
+    python -m benchmarks.mock_storefront --port 8788
+
+and pass storefront_url=http://127.0.0.1:8788/api/2024-01/graphql.json to
+ShopifyClient. Supports cartCreate, cartLinesAdd, cartLinesUpdate,
+cartLinesRemove and the cart query, with Shopify's userErrors for unknown
+carts and lines, and 401 without a Storefront access token. GET /stats
+counts requests and mutations by name.
+"""
+import argparse
+import asyncio
+import re
+from collections import Counter
+from typing import Any
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from .mock_shopify import synthetic_product
+
+STOREFRONT_PATH = "/api/2024-01/graphql.json"
+MUTATIONS = ("cartCreate", "cartLinesAdd", "cartLinesUpdate", "cartLinesRemove")
+
+
+def variant(variant_id: str) -> dict[str, Any]:
+    number = int(variant_id.rsplit("/", 1)[-1])
+    product = synthetic_product(number // 10)
+    node = product["variants"]["edges"][number % 10]["node"]
+    return {"id": node["id"], "title": node["title"], "price": float(node["price"]), "product": {"id": product["id"], "title": product["title"]}}
+
+
+def create_app(latency: float = 0.0) -> FastAPI:
+    """
+    :param latency: seconds added to every GraphQL request, to emulate network round trips.
+    """
+    app = FastAPI()
+    carts: dict[str, dict[str, Any]] = {}
+    stats: Counter = Counter()
+
+    def render(cart: dict[str, Any]) -> dict[str, Any]:
+        lines = list(cart["lines"].values())
+        total = sum(line["quantity"] * line["merchandise"]["price"] for line in lines)
+        return {
+            "id": cart["id"],
+            "checkoutUrl": f"https://bench.myshopify.com/cart/c/{cart['id'].rsplit('/', 1)[-1]}",
+            "totalQuantity": sum(line["quantity"] for line in lines),
+            "cost": {"totalAmount": {"amount": f"{total:.2f}", "currencyCode": "USD"}},
+            "lines": {"edges": [
+                {"node": {"id": line["id"], "quantity": line["quantity"], "merchandise": {
+                    "id": line["merchandise"]["id"], "title": line["merchandise"]["title"], "product": line["merchandise"]["product"],
+                }}} for line in lines
+            ]},
+        }
+
+    def add_lines(cart: dict[str, Any], lines: list[dict[str, Any]]):
+        for line in lines:
+            existing = next((item for item in cart["lines"].values() if item["merchandise"]["id"] == line["merchandiseId"]), None)
+            if existing is not None:
+                existing["quantity"] += line.get("quantity", 1)
+                continue
+            cart["next_line"] += 1
+            line_id = f"gid://shopify/CartLine/{cart['id'].rsplit('/', 1)[-1]}-{cart['next_line']}"
+            cart["lines"][line_id] = {"id": line_id, "quantity": line.get("quantity", 1), "merchandise": variant(line["merchandiseId"])}
+
+    def payload(cart: dict[str, Any] | None = None, error: str | None = None, field: list[str] | None = None) -> dict[str, Any]:
+        if error:
+            return {"cart": None, "userErrors": [{"field": field, "message": error}]}
+        return {"cart": render(cart), "userErrors": []}
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats)
+
+    @app.post(STOREFRONT_PATH)
+    async def graphql(request: Request):
+        if not request.headers.get("X-Shopify-Storefront-Access-Token"):
+            return JSONResponse({"errors": [{"message": "Unauthorized"}]}, status_code=401)
+        body = await request.json()
+        query = body.get("query", "")
+        variables = body.get("variables") or {}
+        if latency:
+            await asyncio.sleep(latency)
+        stats["requests"] += 1
+
+        name = next((mutation for mutation in MUTATIONS if re.search(rf"\b{mutation}\(", query)), "cart")
+        stats[name] += 1
+        if name == "cartCreate":
+            cart_id = f"gid://shopify/Cart/{len(carts) + 1}"
+            carts[cart_id] = {"id": cart_id, "lines": {}, "next_line": 0}
+            add_lines(carts[cart_id], variables.get("lines") or [])
+            return {"data": {name: payload(carts[cart_id])}}
+
+        cart = carts.get(variables.get("cartId"))
+        if name == "cart":
+            return {"data": {"cart": render(cart) if cart else None}}
+        if cart is None:
+            return {"data": {name: payload(error="The specified cart does not exist.", field=["cartId"])}}
+
+        if name == "cartLinesAdd":
+            add_lines(cart, variables["lines"])
+        elif name == "cartLinesUpdate":
+            if any(line["id"] not in cart["lines"] for line in variables["lines"]):
+                return {"data": {name: payload(error="The merchandise line does not exist.")}}
+            for line in variables["lines"]:
+                if line["quantity"] <= 0:
+                    cart["lines"].pop(line["id"])
+                else:
+                    cart["lines"][line["id"]]["quantity"] = line["quantity"]
+        else:
+            for line_id in variables["lineIds"]:
+                cart["lines"].pop(line_id, None)
+        return {"data": {name: payload(cart)}}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8788)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each GraphQL request")
+    args = parser.parse_args()
+    uvicorn.run(create_app(latency=args.latency), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Multi-tool turns: sequential vs. concurrent tool execution, and the tool loop.
+
+Sends "compare A and B and ..." questions, for which the stub model asks
+for one search per product, through the search node. Compares running the
+searches one at a time (TOOL_CONCURRENCY=1) with running them concurrently,
+and shows the cost of a second tool step (results fed back to the model
+for its own answer) over the templated reply.
+
+    cd apps/backend
+    python -m benchmarks.parallel_tools --products 3 --search-latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("VERTEX_INDEX_ID", "bench-index")
+os.environ.setdefault("VERTEX_ENDPOINT_ID", "bench-endpoint")
+
+from langchain_core.messages import HumanMessage
+
+from src import agent
+from src.cache import search_cache
+from src.retrieval import retrieval
+
+from .fakes import StubChatModel, StubVectorStore
+
+SHOP = "bench.myshopify.com"
+
+
+async def run(turns: int, products: int):
+    latencies, found = [], 0
+    for turn in range(turns):
+        question = "compare " + " and ".join(f"jacket {turn}-{i}" for i in range(products))
+        start = time.perf_counter()
+        update = await agent.search_agent_node({"messages": [HumanMessage(content=question)], "shop_domain": SHOP})
+        latencies.append(time.perf_counter() - start)
+        found += len(update.get("products_found", []))
+    latencies.sort()
+    return latencies[len(latencies) // 2], found / turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--products", type=int, default=3, help="Products compared per question (= searches per turn)")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    agent.set_llm(StubChatModel(latency=args.llm_latency))
+    retrieval.set_store(StubVectorStore(latency=args.search_latency))
+
+    print(f"{'execution':>12} {'steps':>6} {'p50 s':>7} {'products':>9}")
+    for name, concurrency, steps in (("sequential", 1, 1), ("concurrent", args.products, 1), ("concurrent", args.products, 2)):
+        agent.TOOL_CONCURRENCY, agent.AGENT_MAX_TOOL_STEPS = concurrency, steps
+        search_cache.invalidate(SHOP)
+        p50, found = asyncio.run(run(args.turns, args.products))
+        print(f"{name:>12} {steps:>6} {p50:>7.3f} {found:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
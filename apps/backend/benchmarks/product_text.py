@@ -0,0 +1,143 @@
+"""
+Product text normalization during a sync.
+
+Descriptions come from benchmarks/data/storefront_descriptions.jsonl
+(storefront-editor and app-embed HTML: inline styles, entities, review
+widgets, JSON-LD, embedded video), or from --html, any JSON-lines file
+with a descriptionHtml field per line, e.g. a bulk export of a real shop.
+
+- html:    the previous clean_html (pattern compiled per call, tags stripped
+           with <.*?>) against normalize.html_to_text; reports time per
+           description and the length of the text that gets embedded
+- prepare: the previous per-product parsing (context, metadata, lexical
+           document and catalogue record built separately) against
+           normalize.prepare_product over the same synthetic catalogue
+- pages:   normalize.prepare_page for --page-sizes, in the thread pool and
+           with --processes normalization processes
+
+    cd apps/backend
+    python -m benchmarks.product_text --products 20000 --processes 2 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import time
+
+from src.catalogue import CatalogueRecord, VariantRecord
+from src.lexical import parse_price
+from src.normalize import (
+    CHARS_PER_TOKEN,
+    html_to_text,
+    prepare_page,
+    prepare_product,
+    shutdown_pool,
+)
+
+from .mock_shopify import synthetic_product
+
+SAMPLES = os.path.join(os.path.dirname(__file__), "data", "storefront_descriptions.jsonl")
+
+
+def legacy_clean_html(raw_html: str) -> str:
+    if not raw_html:
+        return ""
+    cleanr = re.compile('<.*?>')
+    return re.sub(cleanr, '', raw_html).strip()
+
+
+def legacy_prepare(product):
+    """Context, metadata, lexical document and catalogue record as built before, each parsing the product again."""
+    description = legacy_clean_html(product.get("descriptionHtml", ""))
+    variants = product.get("variants", {}).get("edges", [])
+    price = variants[0]["node"].get("price", "N/A") if variants else "N/A"
+    context = (f"Category: {product.get('productType', '')}\nTitle: {product.get('title', '')}\nDescription: {description}\n"
+               f"Tags: {', '.join(product.get('tags', []))}\nVendor: {product.get('vendor', '')}\nPrice: {price}")
+
+    images = product.get("images", {}).get("edges", [])
+    variants = product.get("variants", {}).get("edges", [])
+    price = variants[0]["node"].get("price", "N/A") if variants else "N/A"
+    metadata = {"id": product.get("id"), "title": product.get("title"), "handle": product.get("handle"),
+                "category": product.get("productType", ""), "product_type": product.get("productType", ""),
+                "vendor": product.get("vendor", ""), "price": price, "image_url": images[0]["node"].get("url", "") if images else ""}
+
+    nodes = [edge["node"] for edge in product.get("variants", {}).get("edges", [])]
+    skus = [node["sku"] for node in nodes if node.get("sku")]
+    document = {"text": context + ("\nSKU: " + ", ".join(skus) if skus else ""),
+                "metadata": {**metadata, "available": any(node.get("availableForSale", True) for node in nodes) if nodes else True}}
+
+    records = [VariantRecord(node.get("id", ""), node.get("title", ""), parse_price(node.get("price")), node.get("sku") or "", node.get("availableForSale", True))
+               for node in (edge["node"] for edge in product.get("variants", {}).get("edges", []))]
+    min_price = product.get("priceRangeV2", {}).get("minVariantPrice", {})
+    record = CatalogueRecord(product.get("id"), handle=product.get("handle") or "", title=product.get("title") or "",
+                             price=parse_price(min_price.get("amount", metadata.get("price"))), currency=min_price.get("currencyCode", ""),
+                             inventory=product.get("totalInventory") or 0, available=any(v.available for v in records) if records else True,
+                             image_url=metadata["image_url"], variants=records)
+    return context, metadata, document, record
+
+
+def per_item_us(func, items, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) / len(items) * 1e6
+
+
+def load_descriptions(path: str) -> list[str]:
+    with open(path) as f:
+        return [json.loads(line)["descriptionHtml"] or "" for line in f if line.strip()]
+
+
+async def page_rate(products, page_size: int, processes: int) -> float:
+    start = time.perf_counter()
+    for offset in range(0, len(products), page_size):
+        await prepare_page(products[offset:offset + page_size], processes=processes)
+    return len(products) / (time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--html", default=SAMPLES, help="JSON-lines file with a descriptionHtml field per line")
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[250, 2000])
+    parser.add_argument("--processes", type=int, nargs="+", default=[2])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    descriptions = await asyncio.to_thread(load_descriptions, args.html)
+    products = []
+    for n in range(args.products):
+        product = synthetic_product(n)
+        product["descriptionHtml"] = descriptions[n % len(descriptions)]
+        products.append(product)
+
+    legacy_texts = [legacy_clean_html(html) for html in descriptions]
+    texts = [html_to_text(html) for html in descriptions]
+    print(f"{len(descriptions)} descriptions, {statistics.mean(map(len, descriptions)):.0f} characters of HTML on average\n")
+    print(f"{'html':>10} {'us/desc':>8} {'chars':>7} {'~tokens':>8}")
+    for name, func, outputs in (("legacy", legacy_clean_html, legacy_texts), ("normalize", html_to_text, texts)):
+        chars = statistics.mean(map(len, outputs))
+        print(f"{name:>10} {per_item_us(func, descriptions * 200, args.runs):>8.2f} {chars:>7.0f} {chars / CHARS_PER_TOKEN:>8.0f}")
+
+    print(f"\n{'prepare':>10} {'us/product':>11} {'products/s':>11}")
+    sample = products[:5000]
+    for name, func in (("legacy", legacy_prepare), ("normalize", prepare_product)):
+        us = per_item_us(func, sample, args.runs)
+        print(f"{name:>10} {us:>11.2f} {1e6 / us:>11.0f}")
+
+    print(f"\n{'page size':>10} {'processes':>10} {'products/s':>11}")
+    for page_size in args.page_sizes:
+        for processes in [0] + args.processes:
+            # The first pass starts the pool's processes; time the second
+            await page_rate(products[:page_size * processes], page_size, processes)
+            print(f"{page_size:>10} {processes:>10} {await page_rate(products, page_size, processes):>11.0f}")
+            shutdown_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""
+Cost-aware pacing vs. retry-on-throttle against the local mock Shopify server.
+
+Runs several concurrent catalogue fetches for one shop (as overlapping syncs
+would) against a mock with a Shopify-style cost bucket, once with the
+client's CostThrottle pacing requests and once with pacing disabled so only
+THROTTLED retries with backoff slow it down. Reports wall time, requests
+the server throttled and client retries.
+
+    cd apps/backend
+    python -m benchmarks.shopify_throttle --products 1000 --fetchers 3 --restore-rate 2000
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+
+import httpx
+
+from src import shopify_client
+from src.shopify_client import ShopifyClient, close_connections, get_connection
+
+from .fetch_memory import free_port, wait_for_port
+
+
+class NoPacing:
+    waited_seconds = 0.0
+
+    async def acquire(self, cost: float):
+        pass
+
+    def update(self, throttle_status):
+        pass
+
+
+async def run(base_url: str, stats_url: str, fetchers: int, paced: bool):
+    clients = [ShopifyClient("bench.myshopify.com", "token", base_url=base_url) for _ in range(fetchers)]
+    connection = get_connection(clients[0].shop_url)
+    if not paced:
+        connection.throttle = NoPacing()
+
+    async with httpx.AsyncClient() as http:
+        before = (await http.get(stats_url)).json()
+        start = time.perf_counter()
+        results = await asyncio.gather(*(client.fetch_all_products() for client in clients))
+        elapsed = time.perf_counter() - start
+        after = (await http.get(stats_url)).json()
+
+    await close_connections()
+    return {
+        "seconds": elapsed,
+        "products": sum(len(r) for r in results),
+        "requests": after["requests"] - before["requests"],
+        "throttled": after["throttled"] - before["throttled"],
+        "retries": connection.retries,
+        "paced_wait": connection.throttle.waited_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--fetchers", type=int, default=3, help="Concurrent fetches for the same shop")
+    parser.add_argument("--restore-rate", type=float, default=2000.0, help="Mock cost points restored per second")
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    # Keep the retry budget generous so the unpaced run completes
+    shopify_client.SHOPIFY_MAX_RETRIES = 20
+
+    port = free_port()
+    server = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.mock_shopify", "--products", str(args.products), "--port", str(port),
+        "--latency", str(args.latency), "--restore-rate", str(args.restore_rate)
+    ])
+    try:
+        wait_for_port(port)
+        base_url = f"http://127.0.0.1:{port}/admin/api/2024-01/graphql.json"
+        stats_url = f"http://127.0.0.1:{port}/stats"
+        print(f"{'mode':>8} {'seconds':>8} {'requests':>9} {'throttled':>10} {'retries':>8} {'paced wait (s)':>15}")
+        for mode in ("unpaced", "paced"):
+            result = asyncio.run(run(base_url, stats_url, args.fetchers, paced=mode == "paced"))
+            assert result["products"] == args.products * args.fetchers
+            print(f"{mode:>8} {result['seconds']:>8.2f} {result['requests']:>9} {result['throttled']:>10} {result['retries']:>8} {result['paced_wait']:>15.2f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
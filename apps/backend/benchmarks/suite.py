@@ -0,0 +1,271 @@
+"""
+Offline end-to-end benchmark suite, with machine-readable results.
+
+Every external service is replaced by a deterministic local fake with
+configurable latency: the chat model (StubChatModel), embeddings
+(StubEmbeddings), the vector store (StubVectorStore), Firestore
+(FakeFirestore) and the Shopify Admin GraphQL API (benchmarks.mock_shopify,
+run as a local server). No cloud access or credentials are needed.
+
+Scenarios, each case in a fresh process so peak RSS is per case:
+
+- chat:   concurrent POST /chat turns (search and small talk) against the
+          in-process app; reports throughput and p50/p95/p99 latency per
+          concurrency level
+- ingest: ProductIndexer.ingest_products (full rebuild) of a synthetic
+          catalogue per size; reports wall time, products/s, Shopify
+          requests, embedding calls and peak RSS
+
+Results are written as JSON with --output. Pass an earlier results file
+as --baseline to compare: metrics that got worse by more than --tolerance
+are listed and the exit status is 1.
+
+    cd apps/backend
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --scenarios ingest --catalogues 1000 10000 100000 --baseline results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime
+from typing import Any
+
+from .fetch_memory import free_port, peak_rss_mb, wait_for_port
+
+# Direction of each reported metric, for comparisons against a baseline
+HIGHER_IS_BETTER = {"rps", "products_per_second"}
+LOWER_IS_BETTER = {"p50_ms", "p95_ms", "p99_ms", "seconds", "peak_rss_mb", "shopify_requests", "embed_calls"}
+
+CHAT_MESSAGES = [
+    "red dress size {n}",
+    "do you have running shoes under ${price}?",
+    "hello there",
+    "looking for a wool jumper, style {n}",
+    "what's your return policy?",
+]
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def run_chat(spec: dict[str, Any]) -> dict[str, Any]:
+    os.environ.setdefault("VERTEX_INDEX_ID", "bench-index")
+    os.environ.setdefault("VERTEX_ENDPOINT_ID", "bench-endpoint")
+    import httpx
+
+    from src.agent import set_llm
+    from src.concurrency import install_default_executor
+    from src.main import app
+    from src.retrieval import retrieval
+
+    from .fakes import StubChatModel, StubVectorStore
+
+    install_default_executor()
+    set_llm(StubChatModel(latency=spec["llm_latency"]))
+    retrieval.set_store(StubVectorStore(latency=spec["search_latency"]))
+    concurrency = spec["concurrency"]
+    latencies: list[float] = []
+    errors = 0
+
+    async def one(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, i: int, record: bool):
+        nonlocal errors
+        # A fixed pool of distinct messages, so later turns hit the search cache as repeat queries would
+        n = i % spec["distinct_messages"]
+        message = CHAT_MESSAGES[n % len(CHAT_MESSAGES)].format(n=n, price=20 + n)
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/chat", json={"message": message})
+            if record:
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code != 200
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120.0) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*(one(client, semaphore, -1 - i, False) for i in range(concurrency)))
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, semaphore, i, True) for i in range(spec["requests"])))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": spec["requests"],
+        "errors": errors,
+        "rps": round(spec["requests"] / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+async def run_ingest(spec: dict[str, Any]) -> dict[str, Any]:
+    data_dir = tempfile.mkdtemp(prefix="suite-ingest-")
+    for name in ("LOCAL_INDEX_DIR", "LEXICAL_INDEX_DIR", "CATALOGUE_DIR", "SHOP_REGISTRY_DIR", "SYNC_MANIFEST_DIR"):
+        os.environ[name] = os.path.join(data_dir, name.lower())
+    import httpx
+
+    from src.indexer import ProductIndexer
+    from src.manifest import LocalManifestStore
+    from src.shopify_client import ShopifyClient, close_connections
+
+    from .fakes import FakeFirestore, StubEmbeddings, StubVectorStore
+
+    store = StubVectorStore(latency=spec["upsert_latency"], keep_records=False)
+    embeddings = StubEmbeddings(latency=spec["embed_latency"], dimensions=64)
+
+    class BenchIndexer(ProductIndexer):
+        def _create_vector_store(self, index_endpoint_name, index_id):
+            return store
+
+    async def requests_made() -> int:
+        async with httpx.AsyncClient() as http:
+            return (await http.get(spec["stats_url"])).json()["requests"]
+
+    client = ShopifyClient("bench.myshopify.com", "token", base_url=spec["base_url"])
+    indexer = BenchIndexer(client, manifest_store=LocalManifestStore(os.environ["SYNC_MANIFEST_DIR"]), embeddings_model=embeddings, db=FakeFirestore())
+    requests_before = await requests_made()
+    start = time.perf_counter()
+    result = await indexer.ingest_products("bench-endpoint", "bench-index", full_rebuild=True)
+    elapsed = time.perf_counter() - start
+    requests = await requests_made() - requests_before
+    await close_connections()
+
+    return {
+        "products": result["indexed"],
+        "seconds": round(elapsed, 2),
+        "products_per_second": round(result["indexed"] / elapsed, 1),
+        "shopify_requests": requests,
+        "embed_calls": embeddings.calls,
+        "upserted": store.upsert_count,
+    }
+
+
+def child(scenario: str, spec: dict[str, Any]):
+    random.seed(spec["seed"])
+    metrics = asyncio.run(run_chat(spec) if scenario == "chat" else run_ingest(spec))
+    metrics["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    print(json.dumps(metrics))
+
+
+def run_case(scenario: str, spec: dict[str, Any]) -> dict[str, Any]:
+    env = dict(os.environ, PYTHONWARNINGS="ignore")
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.suite", "--child", scenario, "--spec", json.dumps(spec)],
+        capture_output=True, text=True, env=env, check=False,
+    )
+    if output.returncode != 0:
+        raise RuntimeError(f"{scenario} case {spec} failed:\n{output.stderr[-2000:]}")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: list[dict[str, Any]], baseline_path: str, tolerance: float) -> list[str]:
+    """Metrics worse than in the baseline by more than `tolerance` (a fraction), as readable lines."""
+    with open(baseline_path) as f:
+        baseline = {(item["scenario"], item["case"]): item["metrics"] for item in json.load(f)["results"]}
+    regressions = []
+    for item in results:
+        before = baseline.get((item["scenario"], item["case"]))
+        if before is None:
+            continue
+        for metric, value in item["metrics"].items():
+            old = before.get(metric)
+            if not old or metric not in HIGHER_IS_BETTER | LOWER_IS_BETTER:
+                continue
+            change = (value - old) / old
+            if (metric in HIGHER_IS_BETTER and change < -tolerance) or (metric in LOWER_IS_BETTER and change > tolerance):
+                regressions.append(f"{item['scenario']} {item['case']}: {metric} {old} -> {value} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=["chat", "ingest"], default=["chat", "ingest"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Chat turns per concurrency level")
+    parser.add_argument("--distinct-messages", type=int, default=100, help="Distinct chat messages the turns cycle through")
+    parser.add_argument("--catalogues", type=int, nargs="+", default=[1000, 10000], help="Catalogue sizes to ingest, e.g. 1000 10000 100000")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per model call")
+    parser.add_argument("--search-latency", type=float, default=0.02, help="Seconds per vector search")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Seconds per embedding request")
+    parser.add_argument("--upsert-latency", type=float, default=0.01, help="Seconds per vector store write")
+    parser.add_argument("--shopify-latency", type=float, default=0.005, help="Mock Shopify seconds per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed fraction a metric may worsen by")
+    parser.add_argument("--child", choices=["chat", "ingest"], help=argparse.SUPPRESS)
+    parser.add_argument("--spec", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, json.loads(args.spec))
+        return
+
+    results: list[dict[str, Any]] = []
+
+    def report(scenario: str, case: str, metrics: dict[str, Any]):
+        results.append({"scenario": scenario, "case": case, "metrics": metrics})
+        print(f"{scenario:>7} {case:<16} " + "  ".join(f"{name}={value}" for name, value in metrics.items()), flush=True)
+
+    if "chat" in args.scenarios:
+        for concurrency in args.concurrency:
+            spec = {"concurrency": concurrency, "requests": args.requests, "distinct_messages": args.distinct_messages,
+                    "llm_latency": args.llm_latency, "search_latency": args.search_latency, "seed": args.seed}
+            report("chat", f"concurrency={concurrency}", run_case("chat", spec))
+
+    if "ingest" in args.scenarios:
+        for products in args.catalogues:
+            port = free_port()
+            server = subprocess.Popen([sys.executable, "-m", "benchmarks.mock_shopify", "--products", str(products),
+                                       "--port", str(port), "--latency", str(args.shopify_latency)])
+            try:
+                wait_for_port(port)
+                spec = {"base_url": f"http://127.0.0.1:{port}/admin/api/2024-01/graphql.json", "stats_url": f"http://127.0.0.1:{port}/stats",
+                        "embed_latency": args.embed_latency, "upsert_latency": args.upsert_latency, "seed": args.seed}
+                report("ingest", f"products={products}", run_case("ingest", spec))
+            finally:
+                server.terminate()
+                server.wait()
+
+    document = {
+        "suite": "shop-agent-backend",
+        "created_at": datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {name: value for name, value in vars(args).items() if name not in ("child", "spec", "output", "baseline")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Interrupted syncs: work redone after a worker dies, with and without job
+checkpoints.
+
+Syncs a synthetic catalogue from benchmarks.mock_shopify (paginated, stub
+embeddings with per-batch latency) three ways:
+
+- uninterrupted: one sync job, start to finish
+- restart:       the sync is killed halfway and started again from scratch
+                 (what happened to BackgroundTasks syncs on a restart)
+- resume:        a job worker is killed halfway; once its lease runs out a
+                 second worker claims the job and resumes from its checkpoint
+
+Reports wall time, products embedded and Shopify requests per scenario,
+plus the job's final status as served by /sync/{job_id}. Also checks that
+a second enqueue for a shop with an active job returns the same job.
+
+    cd apps/backend
+    python -m benchmarks.sync_jobs --products 2000 --embed-latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="sync-jobs-bench-")
+for name in ("LOCAL_INDEX_DIR", "LEXICAL_INDEX_DIR", "CATALOGUE_DIR", "SHOP_REGISTRY_DIR", "SYNC_MANIFEST_DIR"):
+    os.environ[name] = os.path.join(_tmp, name.lower())
+os.environ["SYNC_JOBS_PATH"] = os.path.join(_tmp, "jobs.sqlite")
+os.environ["VECTOR_BACKEND"] = "local"
+# Cursors exist only for paginated fetches
+os.environ["SHOPIFY_FETCH_MODE"] = "paginate"
+
+import httpx
+
+from src.indexer import ProductIndexer
+from src.jobs import JobStore, SyncWorker
+from src.manifest import LocalManifestStore
+from src.shopify_client import ShopifyClient, close_connections
+from src.tenants import shop_registry
+
+from .fakes import FakeFirestore, StubEmbeddings, StubVectorStore
+from .fetch_memory import free_port, wait_for_port
+
+
+class BenchIndexer(ProductIndexer):
+    store = StubVectorStore(latency=0, keep_records=False)
+
+    def _create_vector_store(self, index_endpoint_name, index_id):
+        return self.store
+
+
+def indexer_factory(base_url: str, embed_latency: float):
+    def build(client):
+        return BenchIndexer(
+            ShopifyClient(client.shop_url, "token", base_url=base_url),
+            manifest_store=LocalManifestStore(os.environ["SYNC_MANIFEST_DIR"]),
+            embeddings_model=StubEmbeddings(latency=embed_latency, dimensions=64),
+            db=FakeFirestore(),
+        )
+    return build
+
+
+async def requests_made(stats_url: str) -> int:
+    async with httpx.AsyncClient() as http:
+        return (await http.get(stats_url)).json()["requests"]
+
+
+async def kill_halfway(task: asyncio.Task, products: int):
+    while BenchIndexer.store.upsert_count < products // 2 and not task.done():
+        await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def scenario(name: str, products: int, base_url: str, stats_url: str, embed_latency: float, store: JobStore):
+    shop = f"{name}.myshopify.com"
+    await shop_registry.update(shop, access_token="token")
+    factory = indexer_factory(base_url, embed_latency)
+    BenchIndexer.store.upsert_count = 0
+    requests_before = await requests_made(stats_url)
+    start = time.perf_counter()
+
+    job = None
+    if name == "restart":
+        # No job store: a killed sync leaves nothing to resume from
+        client = (await shop_registry.get(shop)).client
+        await kill_halfway(asyncio.create_task(factory(client).ingest_products("", "")), products)
+        await factory(client).ingest_products("", "")
+    else:
+        job, created = store.enqueue(shop)
+        assert created and store.enqueue(shop) == (store.get(job.id), False), "second enqueue must return the active job"
+        lease = 1.0
+        first = SyncWorker(store, "worker-a", lease_seconds=lease, checkpoint_seconds=0.2, indexer_factory=factory)
+        claimed = store.claim(first.worker_id, lease)
+        if name == "resume":
+            await kill_halfway(asyncio.create_task(first.process(claimed)), products)
+            # The dead worker's lease has to run out before anyone else may take the job
+            await asyncio.sleep(lease)
+            second = SyncWorker(store, "worker-b", lease_seconds=lease, checkpoint_seconds=0.2, indexer_factory=factory)
+            claimed = store.claim(second.worker_id, lease)
+            assert claimed is not None and claimed.id == job.id
+            status = await second.process(claimed)
+        else:
+            status = await first.process(claimed)
+        assert status == "succeeded", store.get(job.id)
+
+    elapsed = time.perf_counter() - start
+    requests = await requests_made(stats_url) - requests_before
+    return elapsed, BenchIndexer.store.upsert_count, requests, (store.get(job.id).to_dict() if job else None)
+
+
+async def run(products: int, base_url: str, stats_url: str, embed_latency: float):
+    store = JobStore(os.environ["SYNC_JOBS_PATH"])
+    print(f"{'scenario':>14} {'seconds':>8} {'embedded':>9} {'requests':>9}")
+    last_status = None
+    for name in ("uninterrupted", "restart", "resume"):
+        elapsed, embedded, requests, status = await scenario(name, products, base_url, stats_url, embed_latency, store)
+        print(f"{name:>14} {elapsed:>8.2f} {embedded:>9} {requests:>9}")
+        last_status = status or last_status
+    await close_connections()
+    print("\nResumed job status:")
+    print(json.dumps(last_status, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per embedding request")
+    parser.add_argument("--latency", type=float, default=0.01, help="Mock Shopify seconds per request")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.mock_shopify", "--products", str(args.products), "--port", str(port), "--latency", str(args.latency)])
+    try:
+        wait_for_port(port)
+        asyncio.run(run(args.products, f"http://127.0.0.1:{port}/admin/api/2024-01/graphql.json", f"http://127.0.0.1:{port}/stats", args.embed_latency))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Hit rate of the shop registry's segmented LRU vs. a plain LRU.
+
+Replays a synthetic multi-tenant request stream: shops drawn from a Zipf
+distribution (a few hot shops, a long tail), interleaved with bursts of
+one-off shops (new installs, crawlers) that are never seen again. A plain
+LRU lets each burst flush the warm shops; the segmented LRU only churns
+its probation segment.
+
+    cd apps/backend
+    python -m benchmarks.tenant_cache --capacity 32 --requests 50000
+"""
+import argparse
+import asyncio
+import random
+
+from src.tenants import ShopConfig, ShopRegistry
+
+
+class MemoryShopStore:
+    def load(self, shop: str) -> ShopConfig:
+        return ShopConfig(shop)
+
+    def save(self, config: ShopConfig):
+        pass
+
+    def warm_shops(self):
+        return []
+
+
+def request_stream(requests: int, shops: int, zipf: float, burst_every: int, burst_size: int, seed: int = 0):
+    rng = random.Random(seed)
+    weights = [1 / (rank ** zipf) for rank in range(1, shops + 1)]
+    one_off = 0
+    for i in range(requests):
+        if burst_every and i % burst_every == 0:
+            for _ in range(burst_size):
+                one_off += 1
+                yield f"new-{one_off}.myshopify.com"
+        yield f"shop-{rng.choices(range(shops), weights)[0]}.myshopify.com"
+
+
+async def replay(registry: ShopRegistry, stream) -> dict:
+    for shop in stream:
+        await registry.get(shop)
+    return registry.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--capacity", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--shops", type=int, default=500)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--burst-every", type=int, default=500, help="Requests between bursts of one-off shops")
+    parser.add_argument("--burst-size", type=int, default=40)
+    args = parser.parse_args()
+
+    print(f"{'policy':>14} {'hit rate':>9} {'evictions':>10}")
+    for name, protected_fraction in (("plain LRU", 0.0), ("segmented LRU", 0.8)):
+        registry = ShopRegistry(store=MemoryShopStore(), capacity=args.capacity, protected_fraction=protected_fraction, warm_shops=[])
+        stream = request_stream(args.requests, args.shops, args.zipf, args.burst_every, args.burst_size)
+        stats = asyncio.run(replay(registry, stream))
+        print(f"{name:>14} {stats['hit_rate']:>9.3f} {stats['evictions']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Tracing and /metrics for /chat with stubbed model and search backends.
+
+Runs the same chat turns twice against the in-process app: with stage
+metrics only (no span exporter, as when no collector is configured), then
+with spans exported to a JSON-lines file. Reports per-turn latency for
+both, so the cost of tracing can be read off, and prints the span tree of
+one turn from the file and the /metrics output.
+
+    cd apps/backend
+    python -m benchmarks.tracing --turns 200 --concurrency 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+os.environ.setdefault("VERTEX_INDEX_ID", "bench-index")
+os.environ.setdefault("VERTEX_ENDPOINT_ID", "bench-endpoint")
+
+import httpx
+
+from src import telemetry
+from src.agent import set_llm
+from src.cache import search_cache
+from src.concurrency import install_default_executor
+from src.main import app
+from src.retrieval import retrieval
+
+from .fakes import StubChatModel, StubVectorStore
+
+MESSAGES = ["red dress {i}", "do you have running shoes in size {i}?", "hello there", "what's your return policy?"]
+
+
+async def run_turns(client: httpx.AsyncClient, turns: int, concurrency: int, offset: int = 0):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/chat", json={"message": MESSAGES[i % len(MESSAGES)].format(i=offset + i)})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(turns)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return turns / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+def print_trace(path: str):
+    with open(path) as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+    by_trace = defaultdict(list)
+    for item in spans:
+        by_trace[item["context"]["trace_id"]].append(item)
+    # The turn with the most spans shows the most stages
+    trace_spans = max(by_trace.values(), key=len)
+    children = defaultdict(list)
+    for item in trace_spans:
+        children[item.get("parent_id")].append(item)
+
+    def seconds(item):
+        # Timestamps are ISO 8601 with microseconds
+        from datetime import datetime
+        return (datetime.fromisoformat(item["end_time"].rstrip("Z")) - datetime.fromisoformat(item["start_time"].rstrip("Z"))).total_seconds()
+
+    def show(parent_id, depth):
+        for item in sorted(children.get(parent_id, []), key=lambda item: item["start_time"]):
+            print(f"{'  ' * depth}{item['name']:<{32 - 2 * depth}} {seconds(item) * 1000:>8.1f} ms")
+            show(item["context"]["span_id"], depth + 1)
+
+    print(f"\n{len(spans)} spans exported; one turn ({len(trace_spans)} spans):")
+    show(None, 0)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    install_default_executor()
+    set_llm(StubChatModel(latency=args.llm_latency))
+    retrieval.set_store(StubVectorStore(latency=args.search_latency))
+    trace_file = os.path.join(tempfile.mkdtemp(prefix="tracing-bench-"), "spans.jsonl")
+
+    print(f"{'tracing':>14} {'rps':>8} {'p50':>7} {'p95':>7}")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120.0) as client:
+        # Warm up imports, pools and the stub store before measuring
+        await run_turns(client, args.concurrency * 4, args.concurrency, offset=-args.concurrency * 4)
+        for n, name in enumerate(("metrics only", "file export")):
+            if name == "file export":
+                telemetry.OTEL_TRACES_FILE = trace_file
+                telemetry.configure_tracing()
+            # Distinct queries and an empty cache per run, so both runs do the same work
+            search_cache.invalidate("")
+            rps, p50, p95 = await run_turns(client, args.turns, args.concurrency, offset=n * args.turns)
+            print(f"{name:>14} {rps:>8.1f} {p50:>7.3f} {p95:>7.3f}")
+        metrics = (await client.get("/metrics")).text
+
+    telemetry.shutdown_tracing()
+    print_trace(trace_file)
+    print("\n/metrics (p95 latency and token lines):")
+    for line in metrics.splitlines():
+        if 'quantile="0.95"' in line:
+            print(f"  {line}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
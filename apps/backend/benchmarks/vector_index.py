@@ -0,0 +1,94 @@
+"""
+Recall and latency of the local vector index: exact search vs. IVF.
+
+Builds a LocalVectorStore from synthetic clustered embeddings (products in
+the same category sit close together, as real catalogue embeddings do),
+saves it, reopens it memory-mapped, then reports per-query latency and
+recall@k of the IVF index at several nprobe values against exact search.
+
+    cd apps/backend
+    python -m benchmarks.vector_index --vectors 100000 --dimensions 768
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from src.vector_index import LocalVectorStore
+
+
+def synthetic_embeddings(count: int, dimensions: int, clusters: int, noise: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dimensions)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    return centres[labels] + noise * rng.normal(size=(count, dimensions)).astype(np.float32)
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def timed_queries(store: LocalVectorStore, queries: np.ndarray, k: int, exact: bool):
+    rows, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result, _ = store.search(query, k, exact=exact)
+        latencies.append((time.perf_counter() - start) * 1000)
+        rows.append(result[0])
+    return rows, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=2.0, help="Spread of products around their category centre")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    data = synthetic_embeddings(args.vectors, args.dimensions, args.clusters, args.noise)
+    rng = np.random.default_rng(1)
+    queries = data[rng.choice(args.vectors, size=args.queries, replace=False)]
+    queries = queries + 0.5 * args.noise * rng.normal(size=queries.shape).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        writer = LocalVectorStore(directory, ivf_threshold=0)
+        ids = [f"gid://shopify/Product/{i}" for i in range(args.vectors)]
+        for i in range(0, args.vectors, 1000):
+            writer.add_texts_with_embeddings(
+                texts=[""] * len(ids[i:i + 1000]), embeddings=data[i:i + 1000],
+                metadatas=[{"id": product_id} for product_id in ids[i:i + 1000]], ids=ids[i:i + 1000]
+            )
+        writer.save()
+        print(f"build + IVF training + save: {time.perf_counter() - start:.2f}s")
+        del writer
+
+        start = time.perf_counter()
+        store = LocalVectorStore(directory)
+        print(f"cold open (memory-mapped): {(time.perf_counter() - start) * 1000:.1f}ms for {len(store)} vectors")
+
+        start = time.perf_counter()
+        store.search(queries, args.k, exact=True)
+        batched = (time.perf_counter() - start) * 1000
+        print(f"exact, batched ({args.queries} queries in one call): {batched / args.queries:.2f}ms/query")
+
+        truth, latencies = timed_queries(store, queries, args.k, exact=True)
+        print(f"\n{'mode':>12} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p95 ms':>8}")
+        print(f"{'exact':>12} {1.0:>10.3f} {statistics.median(latencies):>8.2f} {percentile(latencies, 0.95):>8.2f}")
+
+        for nprobe in args.nprobe:
+            store.nprobe = nprobe
+            rows, latencies = timed_queries(store, queries, args.k, exact=False)
+            recall = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(rows, truth)])
+            print(f"{'ivf/' + str(nprobe):>12} {recall:>10.3f} {statistics.median(latencies):>8.2f} {percentile(latencies, 0.95):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
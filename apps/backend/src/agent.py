@@ -1,16 +1,43 @@
-import os
+import asyncio
+import json
 import logging
-from typing import TypedDict, Annotated, List, Dict, Any
-from langgraph.graph import StateGraph, END
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
-from langchain_core.tools import tool
-from langchain_google_vertexai import ChatVertexAI
-from langchain_google_vertexai import VertexAIEmbeddings, VectorSearchVectorStore
+import os
+import random
+import zlib
+from collections.abc import Awaitable, Callable
+from typing import (
+    Annotated,
+    Any,
+    NamedTuple,
+    TypedDict,
+)
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    SystemMessage,
+    ToolCall,
+    ToolMessage,
+)
+from langchain_core.tools import InjectedToolArg, tool
+from langgraph.graph import END, StateGraph
+from langgraph.graph.message import add_messages
 
-import operator
+from .cache import normalize_query, search_cache
+from .cart import CartOperation, cart_service
+from .catalogue import CatalogueRecord, catalogue_snapshots
+from .concurrency import SingleFlight, run_blocking
+from .hybrid import HYBRID_SEARCH_ENABLED, hybrid_search, merge_filters, parse_filters
+from .lexical import SearchFilters, lexical_indexes
+from .memory import ConversationSummarizer, memory_metrics, prompt_window, usage_tokens
+from .retrieval import retrieval
+from .router import intent_router
 
 # Import our custom client
-from .shopify_client import ShopifyClient
+from .shopify_client import normalize_shop_domain
+from .streaming import message_text
+from .telemetry import record_llm_tokens, span, traced
+from .tenants import shop_registry
 
 logger = logging.getLogger(__name__)
 
@@ -18,181 +45,500 @@ logger = logging.getLogger(__name__)
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
 REGION = os.getenv("GOOGLE_CLOUD_REGION", "us-central1")
 MODEL_NAME = "gemini-2.0-flash-exp" # Using the requested model or similar available
+# Tool calls from one model response run concurrently, at most this many at a time per request
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "4"))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "10"))
+# Rounds of tool calls per turn. With 1, a turn is one model call: its tools run and the reply is
+# templated from their results. Higher values send results back to the model until it stops asking
+# for tools (e.g. search, then add what it found), at the cost of a model call per extra round.
+AGENT_MAX_TOOL_STEPS = int(os.getenv("AGENT_MAX_TOOL_STEPS", "1"))
 
 # --- State Definition ---
 class AgentState(TypedDict):
-    messages: Annotated[List[BaseMessage], operator.add]
+    # add_messages (rather than list concatenation) lets the summarizer remove old turns by id
+    messages: Annotated[list[BaseMessage], add_messages]
+    # Running summary of turns that have left the prompt window
+    summary: str
     cart_id: str
     shop_domain: str
-    products_found: List[Dict[str, Any]]
+    products_found: list[dict[str, Any]]
     next_node: str
 
 # --- Tools ---
 
+# Searches in flight, keyed by shop and the exact-cache key of the query
+search_flights = SingleFlight("search")
+
 @tool
-def search_products(query: str):
+async def search_products(
+    query: str,
+    category: str | None = None,
+    vendor: str | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    in_stock_only: bool = False,
+    shop_domain: Annotated[str, InjectedToolArg] = ""
+):
     """
-    Search for products in the store using semantic search.
+    Search for products in the store by keywords, product name, SKU or description.
+    Optionally restrict results to a category, a vendor, a price range, or products in stock.
     Returns a list of products with title, price, and ID.
     """
     logger.info(f"Searching for: {query}")
-    
-    project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
-    location = os.getenv("GOOGLE_CLOUD_REGION", "us-central1")
-    index_id = os.getenv("VERTEX_INDEX_ID")
-    endpoint_id = os.getenv("VERTEX_ENDPOINT_ID")
-    bucket_name = os.getenv("GCS_BUCKET_NAME")
-    
-    if not index_id or not endpoint_id:
-        logger.warning("Vertex AI Index ID or Endpoint ID not set. Returning empty results.")
-        return []
+    shop = normalize_shop_domain(shop_domain)
 
     try:
-        # Use default VertexAI embeddings (768 dimensions)
-        embeddings = VertexAIEmbeddings(model_name="text-embedding-004")
-        
-        vector_store = VectorSearchVectorStore.from_components(
-            project_id=project_id,
-            region=location,
-            gcs_bucket_name=bucket_name,
-            index_id=index_id,
-            endpoint_id=endpoint_id,
-            embedding=embeddings
+        # Each shop searches its own indexes
+        context = await shop_registry.get(shop)
+        config = context.retrieval_config
+        index = await run_blocking(lexical_indexes.get, shop)
+        parsed, lexical_query, boosts = parse_filters(query, index)
+        filters = merge_filters(parsed, SearchFilters(category, vendor, min_price, max_price, in_stock_only))
+        cache_query = f"{query} {filters.cache_key()}".strip()
+
+        cached = await search_cache.aget_exact(shop, cache_query)
+        if cached is not None:
+            logger.info("Search cache hit (exact)")
+            return cached
+
+        # Shoppers sending the same query at once (e.g. in a flash sale) share one search
+        products, coalesced = await search_flights.do(
+            (shop, normalize_query(cache_query)), search_uncached, shop, query, lexical_query, filters, index, config, cache_query, boosts
         )
-        
-        # Search for top 5 products
-        results = vector_store.similarity_search(query, k=5)
-        
-        products = []
-        for res in results:
-            # Metadata is stored in the document
-            products.append({
-                "title": res.metadata.get("title", "Unknown Product"),
-                "price": res.metadata.get("price", "0.00"),
-                "id": res.metadata.get("id", ""),
-                "image_url": res.metadata.get("image_url", ""),
-                "handle": res.metadata.get("handle", ""),
-                "category": res.metadata.get("category", "General")
-            })
-            
+        if coalesced:
+            logger.info("Search coalesced with an identical one in flight")
         return products
-    except Exception as e:
-        logger.error(f"Error during vector search: {e}")
+    except Exception:
+        logger.exception("Error during product search")
+        return []
+
+
+async def search_uncached(shop: str, query: str, lexical_query: str, filters: SearchFilters, index, config, cache_query: str,
+                          boosts: SearchFilters | None = None) -> list[dict[str, Any]]:
+    """The part of search_products behind the exact-match cache; caches its results."""
+    # Embed once: the vector is used for the semantic cache and the search
+    embedding = await retrieval.aembed_query(query, shop=shop, config=config)
+    if embedding is None and (index is None or not HYBRID_SEARCH_ENABLED):
+        logger.warning("Vertex AI Index ID or Endpoint ID not set. Returning empty results.")
         return []
 
+    # Similar wording can still mean different filters, so only unfiltered searches use the semantic cache
+    if embedding is not None and filters.is_empty:
+        cached = await search_cache.aget_semantic(shop, embedding)
+        if cached is not None:
+            logger.info("Search cache hit (semantic)")
+            return cached
+
+    # Without an embedding only hybrid search's lexical half can run
+    if HYBRID_SEARCH_ENABLED or embedding is None:
+        results = await hybrid_search(shop, lexical_query or query, embedding, filters, index, config=config, k=5, boosts=boosts)
+    else:
+        # Search for top 5 products using the shared, per-process vector store
+        documents = await retrieval.asimilarity_search_by_vector(embedding, k=5 if filters.is_empty else 20, shop=shop, config=config)
+        results = [doc.metadata for doc in documents if filters.matches(doc.metadata)][:5]
+
+    # Details come from the synced catalogue snapshot when there is one, not just the index metadata
+    snapshot = catalogue_snapshots.get(shop)
+    products = []
+    for metadata in results:
+        record = snapshot.get(metadata.get("id", "")) if snapshot is not None else None
+        products.append(format_product(metadata, record))
+
+    await search_cache.aput(shop, cache_query, products, embedding=embedding if filters.is_empty else None)
+    return products
+
+
+def format_product(metadata: dict[str, Any], record: CatalogueRecord | None = None) -> dict[str, Any]:
+    """A search result as shown to the shopper, preferring the catalogue snapshot over index metadata."""
+    product = {
+        "title": metadata.get("title", "Unknown Product"),
+        "price": metadata.get("price", "0.00"),
+        "id": metadata.get("id", ""),
+        "image_url": metadata.get("image_url", ""),
+        "handle": metadata.get("handle", ""),
+        "category": metadata.get("category", "General")
+    }
+    if record is not None:
+        product.update({
+            "title": record.title or product["title"],
+            "price": f"{record.price:.2f}" if record.price == record.price else product["price"],
+            "currency": record.currency,
+            "image_url": record.image_url or product["image_url"],
+            "handle": record.handle or product["handle"],
+            "available": record.available,
+            "inventory": record.inventory,
+            "variant_id": record.variant_id,
+        })
+    return product
+
+
+async def apply_cart_operations(shop_domain: str, cart_id: str, operations: list[CartOperation]) -> list[dict[str, Any]]:
+    """One tool output per operation: its message, plus the cart as it stands afterwards."""
+    outcome = await cart_service.apply(shop_domain, cart_id, operations)
+    return [{"message": message, "cart": outcome.cart} for message in outcome.messages]
 
 @tool
-def add_to_cart(product_id: str, quantity: int = 1):
+async def add_to_cart(product_id: str, quantity: int = 1, cart_id: Annotated[str, InjectedToolArg] = "", shop_domain: Annotated[str, InjectedToolArg] = ""):
     """
-    Add a product to the Shopify cart.
-    Returns the cart URL.
+    Add a product to the shopper's cart, by the product's ID.
+    Call once per product when adding several. Returns the cart and its checkout URL.
     """
     logger.info(f"Adding {product_id} x{quantity} to cart")
-    # Here we would use ShopifyClient to interact with Storefront API
-    return "https://my-shop.myshopify.com/cart/c/123456"
+    return (await apply_cart_operations(shop_domain, cart_id, [CartOperation("add", product_id, quantity)]))[0]
+
+@tool
+async def update_cart_item(product_id: str, quantity: int, cart_id: Annotated[str, InjectedToolArg] = "", shop_domain: Annotated[str, InjectedToolArg] = ""):
+    """
+    Change the quantity of a product already in the shopper's cart (0 removes it).
+    Returns the updated cart.
+    """
+    logger.info(f"Setting {product_id} to x{quantity} in cart")
+    return (await apply_cart_operations(shop_domain, cart_id, [CartOperation("update", product_id, quantity)]))[0]
+
+@tool
+async def remove_from_cart(product_id: str, cart_id: Annotated[str, InjectedToolArg] = "", shop_domain: Annotated[str, InjectedToolArg] = ""):
+    """
+    Remove a product from the shopper's cart.
+    Returns the updated cart.
+    """
+    logger.info(f"Removing {product_id} from cart")
+    return (await apply_cart_operations(shop_domain, cart_id, [CartOperation("remove", product_id, 0)]))[0]
 
 # --- Nodes ---
 
-llm = ChatVertexAI(model_name=MODEL_NAME, temperature=0)
+_llm = None
 
-def supervisor_node(state: AgentState):
+def get_llm():
     """
-    The Supervisor (Router) analyzes the last message and decides which agent to call.
+    Return the shared chat model, creating it on first use.
     """
-    messages = state['messages']
-    last_message = messages[-1]
-    
-    system_prompt = """
+    global _llm
+    if _llm is None:
+        # langchain_google_vertexai takes seconds to import, so it is loaded with the first model
+        from langchain_google_vertexai import ChatVertexAI
+        _llm = ChatVertexAI(model_name=MODEL_NAME, temperature=0)
+    return _llm
+
+def set_llm(llm):
+    """
+    Replace the chat model, e.g. with a local stub for benchmarks.
+    """
+    global _llm
+    _llm = llm
+
+async def call_llm(node: str, llm, prompt: list[BaseMessage]) -> AIMessage:
+    """
+    One model call, traced as llm.<node> with its token counts (reported by
+    the model, else estimated) recorded for /metrics.
+    """
+    with span(f"llm.{node}", node=node, model=MODEL_NAME) as llm_span:
+        response = await llm.ainvoke(prompt)
+        record_llm_tokens(llm_span, node, *usage_tokens(prompt, response))
+    return response
+
+ROUTER_PROMPT = """
     You are a helpful shopping assistant. Your goal is to help users find products and buy them.
     
     If the user asks for a product, use the 'search_agent'.
-    If the user wants to buy or add to cart, use the 'cart_agent'.
+    If the user wants to buy, add to cart, or change what is in their cart, use the 'cart_agent'.
     If the user is just chatting, use the 'general_chat'.
     
     Respond with ONLY the name of the next agent: 'search_agent', 'cart_agent', or 'general_chat'.
     """
+
+# Fraction of fast-routed messages also sent to the LLM router to measure agreement
+FAST_ROUTER_SHADOW_RATE = float(os.getenv("FAST_ROUTER_SHADOW_RATE", "0"))
+# Shadow routing calls still running; the event loop only keeps weak references to tasks
+_shadow_tasks: set[asyncio.Task] = set()
+
+async def llm_route(message: BaseMessage) -> str:
+    """
+    Ask the LLM which agent should handle the message.
+    """
+    response = await call_llm("supervisor", get_llm(), [SystemMessage(content=ROUTER_PROMPT), message])
     
-    # Simple routing logic using LLM
-    response = llm.invoke([
-        {"role": "system", "content": system_prompt},
-        last_message
-    ])
-    
-    route = response.content.strip().lower()
+    route = message_text(response).strip().lower()
     if "search" in route:
-        return {"next_node": "search_agent"}
+        return "search_agent"
     elif "cart" in route:
-        return {"next_node": "cart_agent"}
+        return "cart_agent"
     else:
-        return {"next_node": "general_chat"}
+        return "general_chat"
+
+async def _shadow_route(message: BaseMessage, fast_route: str):
+    try:
+        intent_router.metrics.record_shadow(fast_route, await llm_route(message))
+    except Exception as e:
+        logger.warning(f"Shadow routing failed: {e}", exc_info=True)
 
-def search_agent_node(state: AgentState):
+async def supervisor_node(state: AgentState):
     """
-    Product Search Agent.
+    The Supervisor (Router) analyzes the last message and decides which agent to call.
+    Confident rule-based matches skip the LLM round trip.
     """
     messages = state['messages']
     last_message = messages[-1]
     
-    # Bind tools to the LLM
-    tools = [search_products]
-    llm_with_tools = llm.bind_tools(tools)
-    
-    response = llm_with_tools.invoke(messages)
+    decision = intent_router.route(str(last_message.content))
+    if decision is not None and decision.route is not None:
+        logger.info(f"Fast-routed to {decision.route} (confidence {decision.confidence:.2f})")
+        if FAST_ROUTER_SHADOW_RATE and random.random() < FAST_ROUTER_SHADOW_RATE:
+            task = asyncio.create_task(_shadow_route(last_message, decision.route))
+            _shadow_tasks.add(task)
+            task.add_done_callback(_shadow_tasks.discard)
+        return {"next_node": decision.route}
     
-    # If tool call is generated
-    if response.tool_calls:
-        # Execute tool
-        # For simplicity in this node, we just execute the first tool call
-        # In a real ReAct loop, we'd have a prebuilt node for this.
-        tool_call = response.tool_calls[0]
-        if tool_call['name'] == 'search_products':
-            result = search_products.invoke(tool_call['args'])
-            return {
-                "messages": [response, AIMessage(content=f"Found these products: {result}")],
-                "products_found": result,
-                "next_node": "end"
-            }
+    # Not sure: fall back to routing with the LLM
+    return {"next_node": await llm_route(last_message)}
+
+def render_products(products: list[dict[str, Any]]) -> str:
+    """The reply for a search, filled in from the results without another model call."""
+    if not products:
+        return "I couldn't find any products matching that. Could you describe it differently?"
+    count = len(products)
+    lines = [f"Here {'is' if count == 1 else 'are'} {count} product{'' if count == 1 else 's'} I found:"]
+    for i, product in enumerate(products, start=1):
+        price = f"{product.get('price', '')} {product.get('currency', '')}".strip()
+        stock = "" if product.get("available", True) else " (out of stock)"
+        lines.append(f"{i}. {product.get('title', 'Unknown Product')} - {price}{stock}")
+    return "\n".join(lines)
+
+def shown_products_prompt(state: AgentState) -> list[BaseMessage]:
+    """
+    The products shown most recently, with their IDs, so the model can resolve
+    "add the second one"; the templated replies it sees don't include IDs.
+    """
+    products = state.get('products_found') or []
+    if not products:
+        return []
+    listing = "; ".join(f"{i}. {product.get('title', '')} (ID: {product.get('id', '')})" for i, product in enumerate(products, start=1))
+    return [SystemMessage(content=f"Products last shown to the shopper: {listing}")]
+
+async def categories_prompt(shop: str) -> list[BaseMessage]:
+    # Tell the model what this shop sells, so it can pick a category filter
+    context = await shop_registry.get(shop)
+    if not context.config.categories:
+        return []
+    return [SystemMessage(content=f"This store's product categories: {', '.join(context.config.categories)}.")]
+
+class ToolResult(NamedTuple):
+    call: ToolCall
+    output: Any = None
+    error: str | None = None
+
+TOOLS = {tool.name: tool for tool in (search_products, add_to_cart, update_cart_item, remove_from_cart)}
+CART_TOOLS = ["add_to_cart", "update_cart_item", "remove_from_cart"]
+CART_ACTIONS = {"add_to_cart": "add", "update_cart_item": "update", "remove_from_cart": "remove"}
+
+def cart_operation(call: ToolCall) -> CartOperation:
+    args = call['args']
+    return CartOperation(CART_ACTIONS[call['name']], str(args['product_id']), int(args.get('quantity', 0 if call['name'] == "remove_from_cart" else 1)))
+
+async def execute_tool_calls(state: AgentState, tool_calls: list[ToolCall], allowed: list[str]) -> list[ToolResult]:
+    """
+    Run every tool call from one model response concurrently, capped at
+    TOOL_CONCURRENCY and TOOL_TIMEOUT_SECONDS each. Cart calls are applied
+    together as one batch, so adding several items costs one mutation.
+    Failures become error results rather than failing the turn.
+    """
+    shop = normalize_shop_domain(state.get('shop_domain', ""))
+    semaphore = asyncio.Semaphore(TOOL_CONCURRENCY)
+
+    async def guarded(name: str, run: Callable[[], Awaitable[Any]]) -> tuple[Any, str | None]:
+        async with semaphore:
+            try:
+                with span(f"tool.{name}", tool=name):
+                    return await asyncio.wait_for(run(), TOOL_TIMEOUT_SECONDS), None
+            except TimeoutError:
+                logger.warning(f"Tool {name} timed out after {TOOL_TIMEOUT_SECONDS}s")
+                return None, "timed out"
+            except Exception as e:
+                logger.warning(f"Tool {name} failed: {e}", exc_info=True)
+                return None, str(e)
+
+    async def run(call: ToolCall) -> ToolResult:
+        if call['name'] not in allowed:
+            return ToolResult(call, error=f"Unknown tool {call['name']}")
+        output, error = await guarded(call['name'], lambda: TOOLS[call['name']].ainvoke({**call['args'], "shop_domain": shop}))
+        return ToolResult(call, output, error)
+
+    async def run_cart(calls: list[ToolCall]) -> list[ToolResult]:
+        operations, results = [], []
+        for call in calls:
+            try:
+                operations.append((call, cart_operation(call)))
+            except (KeyError, TypeError, ValueError) as e:
+                results.append(ToolResult(call, error=f"Invalid arguments: {e}"))
+        if operations:
+            logger.info(f"Applying {len(operations)} cart operation(s) as one batch")
+            outputs, error = await guarded("cart", lambda: apply_cart_operations(shop, state.get('cart_id', ""), [operation for _, operation in operations]))
+            results.extend(ToolResult(call, outputs[i] if outputs else None, error) for i, (call, _) in enumerate(operations))
+        return results
+
+    # Split by name, not by comparing calls: two identical calls are still two calls
+    batched = [call['name'] in CART_TOOLS and call['name'] in allowed for call in tool_calls]
+    cart_calls = [call for call, in_batch in zip(tool_calls, batched) if in_batch]
+    single_calls = [call for call, in_batch in zip(tool_calls, batched) if not in_batch]
+    singles, cart_results = await asyncio.gather(asyncio.gather(*(run(call) for call in single_calls)), run_cart(cart_calls))
+    by_call = {id(result.call): result for result in singles + cart_results}
+    return [by_call[id(call)] for call in tool_calls]
+
+def latest_cart(results: list[ToolResult]) -> dict[str, Any] | None:
+    """The cart as left by the last cart call that reached Shopify."""
+    carts = [result.output["cart"] for result in results if result.call['name'] in CART_TOOLS and result.output and result.output.get("cart")]
+    return carts[-1] if carts else None
+
+def merge_products(results: list[ToolResult]) -> list[dict[str, Any]]:
+    """
+    Products from every search, deduplicated by ID. Lists are interleaved, so
+    "compare X and Y" shows the best match for each before the runners-up.
+    """
+    lists = [result.output for result in results if result.call['name'] == "search_products" and result.output]
+    products: list[dict[str, Any]] = []
+    seen = set()
+    for rank in range(max((len(found) for found in lists), default=0)):
+        for found in lists:
+            if rank < len(found) and found[rank].get("id") not in seen:
+                seen.add(found[rank].get("id"))
+                products.append(found[rank])
+    return products
+
+def render_tool_results(results: list[ToolResult], products: list[dict[str, Any]]) -> str:
+    """The reply for a round of tool calls, filled in from their results without another model call."""
+    parts = []
+    searches = [result for result in results if result.call['name'] == "search_products"]
+    if searches and not products and any(result.error is not None for result in searches):
+        parts.append("Sorry, I couldn't search the catalogue just now. Please try again.")
+    elif searches:
+        parts.append(render_products(products))
+    cart_messages = []
+    for result in results:
+        if result.call['name'] not in CART_TOOLS:
+            continue
+        if result.error is not None:
+            cart_messages.append("Sorry, I couldn't update your cart right now.")
+        elif result.output.get("message"):
+            cart_messages.append(result.output["message"])
+    cart = latest_cart(results)
+    if cart and cart.get("total_quantity"):
+        count = cart["total_quantity"]
+        cart_messages.append(f"Your cart has {count} item{'' if count == 1 else 's'} ({cart['total']}). Checkout here: {cart['checkout_url']}")
+    if cart_messages:
+        parts.append("\n".join(cart_messages))
+    return "\n\n".join(parts) or "Sorry, something went wrong. Please try again."
+
+def tool_message(result: ToolResult) -> ToolMessage:
+    content = f"Error: {result.error}" if result.error is not None else json.dumps(result.output, default=str)
+    return ToolMessage(content=content, tool_call_id=result.call['id'], name=result.call['name'])
+
+async def run_tool_loop(node: str, state: AgentState, llm_with_tools, prompt: list[BaseMessage], allowed: list[str]) -> dict[str, Any]:
+    """
+    Call the model and run the tools it asks for, feeding results back until
+    it stops asking or AGENT_MAX_TOOL_STEPS rounds have run. The reply is the
+    model's own answer when it had the results to write one, and templated
+    otherwise. Tool results are not stored in the conversation.
+    """
+    response = await call_llm(node, llm_with_tools, prompt)
+    memory_metrics.record_prompt(prompt, response)
+
+    messages: list[BaseMessage] = []
+    results: list[ToolResult] = []
+    step = 0
+    while response.tool_calls and step < AGENT_MAX_TOOL_STEPS:
+        step += 1
+        logger.info(f"Running {len(response.tool_calls)} tool call(s), step {step}")
+        step_results = await execute_tool_calls(state, response.tool_calls, allowed)
+        results.extend(step_results)
+        cart = latest_cart(step_results)
+        if cart and cart.get("id") and cart["id"] != state.get('cart_id'):
+            # Later steps add to the cart this one created
+            state = {**state, "cart_id": cart["id"]}
+        messages.append(response)
+        if step == AGENT_MAX_TOOL_STEPS:
+            if AGENT_MAX_TOOL_STEPS > 1:
+                logger.warning(f"{node} reached AGENT_MAX_TOOL_STEPS ({AGENT_MAX_TOOL_STEPS}); replying from the tool results so far")
+            break
+        prompt = prompt + [response] + [tool_message(result) for result in step_results]
+        response = await call_llm(node, llm_with_tools, prompt)
+        memory_metrics.record_prompt(prompt, response)
+
+    if not results:
+        return {"messages": [response], "next_node": "end"}
+
+    products = merge_products(results)
+    model_answered = not response.tool_calls and bool(response.content)
+    reply = response if model_answered else AIMessage(content=render_tool_results(results, products))
+    update: dict[str, Any] = {"messages": messages + [reply], "next_node": "end"}
+    if any(result.call['name'] == "search_products" for result in results):
+        update["products_found"] = products
+    if latest_cart(results) and state.get('cart_id'):
+        update["cart_id"] = state['cart_id']
+    return update
+
+async def search_agent_node(state: AgentState):
+    """
+    Product Search Agent.
+    """
+    shop = normalize_shop_domain(state.get('shop_domain', ""))
     
-    return {"messages": [response], "next_node": "end"}
+    # Bind tools to the LLM
+    tools = [search_products]
+    llm_with_tools = get_llm().bind_tools(tools)
+
+    prompt = await categories_prompt(shop) + prompt_window(state)
+    # Every search the model asks for runs, e.g. one per product in "compare X and Y"
+    return await run_tool_loop("search_agent", state, llm_with_tools, prompt, ["search_products"])
 
-def cart_agent_node(state: AgentState):
+async def cart_agent_node(state: AgentState):
     """
     Cart Manager Agent.
     """
-    messages = state['messages']
-    
-    tools = [add_to_cart]
-    llm_with_tools = llm.bind_tools(tools)
+    tools = [TOOLS[name] for name in CART_TOOLS]
+    llm_with_tools = get_llm().bind_tools(tools)
     
-    response = llm_with_tools.invoke(messages)
-    
-    if response.tool_calls:
-        tool_call = response.tool_calls[0]
-        if tool_call['name'] == 'add_to_cart':
-            result = add_to_cart.invoke(tool_call['args'])
-            return {
-                "messages": [response, AIMessage(content=f"Added to cart. Checkout here: {result}")],
-                "next_node": "end"
-            }
-
-    return {"messages": [response], "next_node": "end"}
+    prompt = shown_products_prompt(state) + prompt_window(state)
+    # Every cart change the model asks for in one response goes to Shopify as one batch
+    return await run_tool_loop("cart_agent", state, llm_with_tools, prompt, CART_TOOLS)
 
-def general_chat_node(state: AgentState):
+async def general_chat_node(state: AgentState):
     """
     General Chat Agent.
     """
-    messages = state['messages']
-    response = llm.invoke(messages)
+    prompt = prompt_window(state)
+    response = await call_llm("general_chat", get_llm(), prompt)
+    memory_metrics.record_prompt(prompt, response)
     return {"messages": [response], "next_node": "end"}
 
+ASSISTANT_PROMPT = """
+    You are a helpful shopping assistant. Your goal is to help users find products and buy them.
+    
+    If the user asks for a product, call search_products.
+    If the user wants to buy or add to cart, call add_to_cart with the product's ID, once per product.
+    To change a quantity in the cart call update_cart_item; to take something out call remove_from_cart.
+    If the user is just chatting, answer briefly without calling a tool.
+    """
+
+async def assistant_node(state: AgentState):
+    """
+    Single-call agent: one tool-enabled model call both routes the message
+    and picks the tool, which runs straight away; tool results are turned
+    into the reply by a template rather than another model call.
+    """
+    shop = normalize_shop_domain(state.get('shop_domain', ""))
+    
+    llm_with_tools = get_llm().bind_tools([search_products] + [TOOLS[name] for name in CART_TOOLS])
+    prompt = [SystemMessage(content=ASSISTANT_PROMPT)] + await categories_prompt(shop) + shown_products_prompt(state) + prompt_window(state)
+    return await run_tool_loop("assistant", state, llm_with_tools, prompt, ["search_products"] + CART_TOOLS)
+
 # --- Graph Construction ---
 
+# routed: a supervisor picks a specialist node, which makes its own model call
 workflow = StateGraph(AgentState)
 
-workflow.add_node("supervisor", supervisor_node)
-workflow.add_node("search_agent", search_agent_node)
-workflow.add_node("cart_agent", cart_agent_node)
-workflow.add_node("general_chat", general_chat_node)
+workflow.add_node("supervisor", traced("node.supervisor")(supervisor_node))
+workflow.add_node("search_agent", traced("node.search_agent")(search_agent_node))
+workflow.add_node("cart_agent", traced("node.cart_agent")(cart_agent_node))
+workflow.add_node("general_chat", traced("node.general_chat")(general_chat_node))
 
 workflow.set_entry_point("supervisor")
 
@@ -210,4 +556,39 @@ workflow.add_edge("search_agent", END)
 workflow.add_edge("cart_agent", END)
 workflow.add_edge("general_chat", END)
 
-app = workflow.compile()
+# single: one model call per turn
+single_call_workflow = StateGraph(AgentState)
+single_call_workflow.add_node("assistant", traced("node.assistant")(assistant_node))
+single_call_workflow.set_entry_point("assistant")
+single_call_workflow.add_edge("assistant", END)
+
+WORKFLOWS = {"routed": workflow, "single": single_call_workflow}
+
+# routed or single; SINGLE_CALL_FRACTION, when set, splits conversations between them for A/B tests
+AGENT_MODE = os.getenv("AGENT_MODE", "routed")
+SINGLE_CALL_FRACTION = float(os.getenv("SINGLE_CALL_FRACTION", "1" if AGENT_MODE == "single" else "0"))
+
+def agent_mode(session_id: str = "") -> str:
+    """
+    The mode a conversation runs in. Sessions are bucketed by a hash of their
+    id, so a conversation keeps its mode across turns; requests without a
+    session are bucketed at random.
+    """
+    if SINGLE_CALL_FRACTION <= 0:
+        return "routed"
+    if SINGLE_CALL_FRACTION >= 1:
+        return "single"
+    bucket = zlib.crc32(session_id.encode("utf-8")) % 10000 / 10000 if session_id else random.random()
+    return "single" if bucket < SINGLE_CALL_FRACTION else "routed"
+
+def compile_agent(checkpointer=None, mode: str = "routed"):
+    """
+    The agent graph for `mode` with conversations persisted in `checkpointer`,
+    keyed by the `thread_id` in each invocation's config (see memory.thread_config).
+    Without a checkpointer the graph is stateless: every invocation starts
+    from the messages it is given.
+    """
+    return WORKFLOWS[mode].compile(checkpointer=checkpointer)
+
+# Rolls turns that left the prompt window into the running summary, after the reply is sent
+summarizer = ConversationSummarizer(lambda: get_llm())
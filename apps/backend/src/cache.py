@@ -0,0 +1,372 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+
+from .concurrency import run_blocking
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_BACKEND = os.getenv("SEARCH_CACHE_BACKEND", "memory")
+SEARCH_CACHE_DIR = os.getenv("SEARCH_CACHE_DIR", "/tmp/shop-agent-cache")
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "900"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+# How long the file backend gathers changes before writing them out
+SEARCH_CACHE_FLUSH_SECONDS = float(os.getenv("SEARCH_CACHE_FLUSH_SECONDS", "1.0"))
+
+_PUNCTUATION = re.compile(r"[^\w\s]|_")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Canonical form of a shopper query for exact-match caching: case-folded,
+    punctuation removed and whitespace collapsed. Words are kept, in order,
+    since "shirt over jacket" and "jacket over shirt" are different searches.
+    "Red dresses, under $50!" becomes "red dresses under 50".
+    """
+    return " ".join(_PUNCTUATION.sub(" ", text.casefold()).split())
+
+
+class MemoryCacheBackend:
+    """
+    In-process cache with per-namespace LRU eviction and per-entry TTL.
+    Namespaces keep shops apart and can be dropped in one call.
+    """
+
+    # Whether calls may touch the disk, and so must stay off the event loop
+    blocking = False
+
+    def __init__(self, max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._namespaces: dict[str, OrderedDict[str, tuple[float, Any]]] = {}
+
+    def _namespace(self, namespace: str) -> "OrderedDict[str, tuple[float, Any]]":
+        return self._namespaces.setdefault(namespace, OrderedDict())
+
+    def get(self, namespace: str, key: str) -> Any | None:
+        with self._lock:
+            entries = self._namespace(namespace)
+            item = entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del entries[key]
+                return None
+            entries.move_to_end(key)
+            return value
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float):
+        with self._lock:
+            entries = self._namespace(namespace)
+            entries[key] = (time.time() + ttl, value)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            self._changed(namespace)
+
+    def items(self, namespace: str) -> list[tuple[str, Any]]:
+        """Live (unexpired) entries of a namespace, oldest first."""
+        now = time.time()
+        with self._lock:
+            entries = self._namespace(namespace)
+            expired = [key for key, (expires_at, _) in entries.items() if expires_at < now]
+            for key in expired:
+                del entries[key]
+            return [(key, value) for key, (_, value) in entries.items()]
+
+    def touch(self, namespace: str, key: str):
+        """Mark an entry as recently used."""
+        with self._lock:
+            entries = self._namespace(namespace)
+            if key in entries:
+                entries.move_to_end(key)
+
+    def clear(self, namespace: str):
+        with self._lock:
+            self._namespaces.pop(namespace, None)
+            self._changed(namespace)
+
+    def _changed(self, namespace: str):
+        """Hook for persistent subclasses; called with the lock held."""
+
+
+class FileCacheBackend(MemoryCacheBackend):
+    """
+    Memory cache backed by one JSON file per namespace, so cached results
+    survive restarts and can be shared by workers on the same host. Changes
+    are written in batches by a background thread at most every
+    `flush_seconds`, never by the caller; each write merges in what other
+    workers wrote to the file since. Values must be JSON-serialisable.
+    A namespace is read from its file on first use, so async callers go
+    through SearchCache's a* methods, which run it in the blocking pool.
+    """
+
+    blocking = True
+
+    def __init__(self, directory: str = SEARCH_CACHE_DIR, max_entries: int = SEARCH_CACHE_MAX_ENTRIES, flush_seconds: float = SEARCH_CACHE_FLUSH_SECONDS):
+        super().__init__(max_entries=max_entries)
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        os.makedirs(directory, exist_ok=True)
+        # Namespaces changed since the last flush, and those cleared (whose file must not be merged back in)
+        self._dirty: set = set()
+        self._cleared: set = set()
+        self._flush_lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+        atexit.register(self.flush)
+
+    def _path(self, namespace: str) -> str:
+        name = hashlib.sha1(namespace.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.json")
+
+    def _namespace(self, namespace: str) -> "OrderedDict[str, tuple[float, Any]]":
+        entries = self._namespaces.get(namespace)
+        if entries is None:
+            entries = OrderedDict(self._read(namespace))
+            self._namespaces[namespace] = entries
+        return entries
+
+    def _read(self, namespace: str) -> list[tuple[str, tuple[float, Any]]]:
+        path = self._path(namespace)
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path) as f:
+                return [(key, (expires_at, value)) for key, expires_at, value in json.load(f)]
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache file {path}: {e}")
+            return []
+
+    def _changed(self, namespace: str):
+        self._dirty.add(namespace)
+        if namespace not in self._namespaces:
+            self._cleared.add(namespace)
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_seconds, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write every changed namespace now, merged with the entries other workers wrote meanwhile."""
+        with self._flush_lock:
+            with self._lock:
+                self._timer = None
+                dirty, self._dirty = self._dirty, set()
+                cleared, self._cleared = self._cleared, set()
+            for namespace in dirty:
+                try:
+                    self._write(namespace, merge=namespace not in cleared)
+                except OSError as e:
+                    logger.warning(f"Writing cache file for {namespace} failed: {e}")
+
+    def _write(self, namespace: str, merge: bool):
+        path = self._path(namespace)
+        now = time.time()
+        on_disk = self._read(namespace) if merge else []
+        with self._lock:
+            entries = self._namespaces.get(namespace)
+            if entries is None:
+                entries = OrderedDict()
+            for key, (expires_at, value) in on_disk:
+                # Entries only another worker has go in as the least recently used
+                if expires_at >= now and key not in entries:
+                    entries[key] = (expires_at, value)
+                    entries.move_to_end(key, last=False)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            if namespace in self._namespaces:
+                self._namespaces[namespace] = entries
+            snapshot = [[key, expires_at, value] for key, (expires_at, value) in entries.items()]
+        if not snapshot:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+
+def create_backend(kind: str = SEARCH_CACHE_BACKEND) -> MemoryCacheBackend:
+    if kind == "file":
+        return FileCacheBackend()
+    if kind != "memory":
+        logger.warning(f"Unknown cache backend '{kind}', using memory")
+    return MemoryCacheBackend()
+
+
+class SemanticIndex:
+    """
+    Unit-length embeddings of one shop's cached queries in a preallocated
+    matrix, grown by doubling, so a lookup is a single matrix-vector product.
+    Rows are removed by moving the last row into their place.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.matrix: np.ndarray | None = None
+        self.keys: list[str] = []
+        self.rows: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key: str, embedding: list[float]):
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) + 1e-12)
+        matrix = self.matrix
+        if matrix is None:
+            matrix = np.empty((self.capacity, len(vector)), dtype=np.float32)
+        row = self.rows.get(key)
+        if row is None:
+            if len(self.keys) == len(matrix):
+                grown = np.empty((len(matrix) * 2, matrix.shape[1]), dtype=np.float32)
+                grown[:len(self.keys)] = matrix
+                matrix = grown
+            row = len(self.keys)
+            self.keys.append(key)
+            self.rows[key] = row
+        matrix[row] = vector
+        self.matrix = matrix
+
+    def remove(self, key: str):
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        last = len(self.keys) - 1
+        if row != last and self.matrix is not None:
+            self.matrix[row] = self.matrix[last]
+            self.keys[row] = self.keys[last]
+            self.rows[self.keys[row]] = row
+        self.keys.pop()
+
+    def nearest(self, embedding: list[float], threshold: float) -> list[str]:
+        """Keys whose cosine similarity with `embedding` is at least `threshold`, most similar first."""
+        if not self.keys or self.matrix is None:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = self.matrix[:len(self.keys)] @ (query / (np.linalg.norm(query) + 1e-12))
+        matches = np.flatnonzero(scores >= threshold)
+        return [self.keys[row] for row in matches[np.argsort(-scores[matches])]]
+
+
+class SearchCache:
+    """
+    Two-level cache for product search results, scoped per shop:
+
+    1. exact: normalized query text -> results
+    2. semantic: query embedding -> results, when cosine similarity with a
+       cached query is at least `threshold`
+
+    Both levels share the backend's TTL and LRU limits. `invalidate` drops
+    everything cached for a shop, e.g. after a reindex.
+
+    A search lookup is get_exact, then get_semantic if that missed, and
+    counts as one hit or one miss: get_exact counts the miss, and a
+    semantic hit turns it into a hit. Async callers use aget_exact,
+    aget_semantic and aput, which keep a file backend's reads off the loop.
+    """
+
+    def __init__(self, backend: MemoryCacheBackend | None = None, ttl: float = SEARCH_CACHE_TTL, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.backend = backend or create_backend()
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        # Per shop, built from the backend's semantic entries on first use
+        self._indexes: dict[str, SemanticIndex] = {}
+        self._index_lock = threading.Lock()
+
+    def _count(self, name: str, undo: str | None = None):
+        with self._lock:
+            self.counters[name] += 1
+            if undo is not None:
+                self.counters[undo] -= 1
+
+    def get_exact(self, shop: str, query: str) -> Any | None:
+        value = self.backend.get(f"{shop}:exact", normalize_query(query))
+        self._count("exact_hits" if value is not None else "misses")
+        return value
+
+    def _index(self, shop: str) -> SemanticIndex:
+        # Called with _index_lock held
+        index = self._indexes.get(shop)
+        if index is None:
+            index = SemanticIndex()
+            for key, entry in self.backend.items(f"{shop}:semantic"):
+                index.add(key, entry["embedding"])
+            self._indexes[shop] = index
+        return index
+
+    def get_semantic(self, shop: str, embedding: list[float]) -> Any | None:
+        """The results cached for the most similar query, after get_exact missed for this one."""
+        namespace = f"{shop}:semantic"
+        with self._index_lock:
+            index = self._index(shop)
+            for key in index.nearest(embedding, self.threshold):
+                entry = self.backend.get(namespace, key)
+                if entry is None:
+                    # Expired or evicted from the backend since it was indexed
+                    index.remove(key)
+                    continue
+                self._count("semantic_hits", undo="misses")
+                return entry["value"]
+        return None
+
+    def put(self, shop: str, query: str, value: Any, embedding: list[float] | None = None):
+        key = normalize_query(query)
+        self.backend.set(f"{shop}:exact", key, value, self.ttl)
+        if embedding is not None:
+            namespace = f"{shop}:semantic"
+            self.backend.set(namespace, key, {"embedding": list(embedding), "value": value}, self.ttl)
+            with self._index_lock:
+                index = self._index(shop)
+                if key not in index.rows and len(index) >= self.backend.max_entries:
+                    # Drop rows the backend has evicted, keeping the matrix within its LRU limit
+                    live = {live_key for live_key, _ in self.backend.items(namespace)}
+                    for stale in [indexed for indexed in index.keys if indexed not in live]:
+                        index.remove(stale)
+                index.add(key, embedding)
+
+    async def _call(self, method: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        if self.backend.blocking:
+            return await run_blocking(method, *args, **kwargs)
+        return method(*args, **kwargs)
+
+    async def aget_exact(self, shop: str, query: str) -> Any | None:
+        return await self._call(self.get_exact, shop, query)
+
+    async def aget_semantic(self, shop: str, embedding: list[float]) -> Any | None:
+        return await self._call(self.get_semantic, shop, embedding)
+
+    async def aput(self, shop: str, query: str, value: Any, embedding: list[float] | None = None):
+        await self._call(self.put, shop, query, value, embedding=embedding)
+
+    def invalidate(self, shop: str):
+        self.backend.clear(f"{shop}:exact")
+        self.backend.clear(f"{shop}:semantic")
+        with self._index_lock:
+            self._indexes.pop(shop, None)
+        logger.info(f"Search cache invalidated for {shop or 'default shop'}")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            counters: dict[str, Any] = dict(self.counters)
+        lookups = counters["exact_hits"] + counters["semantic_hits"] + counters["misses"]
+        counters["hit_rate"] = (counters["exact_hits"] + counters["semantic_hits"]) / lookups if lookups else 0.0
+        return counters
+
+
+search_cache = SearchCache()
@@ -0,0 +1,208 @@
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any, NamedTuple
+
+from .catalogue import catalogue_snapshots
+from .shopify_client import (
+    CartNotFoundError,
+    ShopifyAPIError,
+    ShopifyClient,
+    normalize_shop_domain,
+)
+
+logger = logging.getLogger(__name__)
+
+_VARIANT_PREFIX = "gid://shopify/ProductVariant/"
+
+
+class CartOperation(NamedTuple):
+    # add, update (set the quantity; 0 removes) or remove
+    action: str
+    product_id: str
+    quantity: int = 1
+
+
+class CartOutcome(NamedTuple):
+    cart: dict[str, Any] | None
+    # One message per operation, in order
+    messages: list[str]
+
+
+def summarize_cart(cart: dict[str, Any]) -> dict[str, Any]:
+    """The parts of a Storefront cart the agent needs, with lines flattened."""
+    total = (cart.get("cost") or {}).get("totalAmount") or {}
+    lines = []
+    for edge in (cart.get("lines") or {}).get("edges", []):
+        node = edge["node"]
+        merchandise = node.get("merchandise") or {}
+        product = merchandise.get("product") or {}
+        lines.append({
+            "id": node["id"],
+            "quantity": node.get("quantity", 0),
+            "variant_id": merchandise.get("id", ""),
+            "product_id": product.get("id", ""),
+            "title": product.get("title") or merchandise.get("title", ""),
+        })
+    return {
+        "id": cart.get("id", ""),
+        "checkout_url": cart.get("checkoutUrl", ""),
+        "total_quantity": cart.get("totalQuantity", 0),
+        "total": f"{total.get('amount', '')} {total.get('currencyCode', '')}".strip(),
+        "lines": lines,
+    }
+
+
+async def _registry_client(shop: str) -> ShopifyClient | None:
+    from .tenants import shop_registry
+    return (await shop_registry.get(shop)).client
+
+
+class CartService:
+    """
+    Cart operations through the Storefront API, reusing the shop's pooled
+    ShopifyClient connection. Operations requested together (e.g. every cart
+    tool call from one model response) are batched: all adds go out as one
+    cartCreate or cartLinesAdd, quantity changes as one cartLinesUpdate and
+    removals as one cartLinesRemove. Products are mapped to the variant to
+    add from the catalogue snapshot written at sync time, so no lookup
+    request is needed.
+    """
+
+    def __init__(self, get_client: Callable[[str], Awaitable[ShopifyClient | None]] | None = None):
+        self.get_client = get_client or _registry_client
+
+    def resolve_variant(self, shop: str, product_id: str) -> tuple[str | None, str, str | None]:
+        """(variant id, title, reason it can't be added) for a product or variant ID."""
+        if product_id.startswith(_VARIANT_PREFIX):
+            return product_id, "that item", None
+        snapshot = catalogue_snapshots.get(shop)
+        record = snapshot.get(product_id) if snapshot is not None else None
+        if record is None or record.variant_id is None:
+            return None, "that product", "Sorry, I couldn't find that product in the store."
+        if not record.available:
+            return None, record.title, f"Sorry, {record.title} is out of stock."
+        return record.variant_id, record.title, None
+
+    async def apply(self, shop_domain: str, cart_id: str, operations: list[CartOperation]) -> CartOutcome:
+        """
+        Apply `operations` to the cart `cart_id` (a new cart is created if it is
+        empty) with at most one mutation per kind. A failed mutation only fails
+        the operations it carried.
+        """
+        shop = normalize_shop_domain(shop_domain)
+        messages: list[str | None] = [None] * len(operations)
+        client = await self.get_client(shop)
+        if client is None:
+            return CartOutcome(None, ["Sorry, the cart isn't available for this store yet."] * len(operations))
+
+        cart: dict[str, Any] | None = None
+        adds: dict[str, int] = {}
+        add_indexes: list[tuple[int, str, int]] = []
+        changes: list[int] = []
+        for i, operation in enumerate(operations):
+            if operation.action == "add":
+                if operation.quantity < 1:
+                    messages[i] = "Please tell me how many you'd like to add."
+                    continue
+                variant_id, title, reason = self.resolve_variant(shop, operation.product_id)
+                if variant_id is None:
+                    messages[i] = reason
+                    continue
+                # The same variant twice in one batch becomes one line
+                adds[variant_id] = adds.get(variant_id, 0) + operation.quantity
+                add_indexes.append((i, title, operation.quantity))
+            elif operation.action in ("update", "remove"):
+                changes.append(i)
+            else:
+                messages[i] = f"Sorry, I can't {operation.action} cart items."
+
+        if adds:
+            lines = [{"merchandiseId": variant_id, "quantity": quantity} for variant_id, quantity in adds.items()]
+            try:
+                cart = await self._add_lines(client, cart_id, lines)
+                cart_id = cart.get("id", cart_id)
+                for i, title, quantity in add_indexes:
+                    messages[i] = f"Added {quantity} x {title} to your cart."
+            except ShopifyAPIError as e:
+                logger.warning(f"Adding {len(lines)} line(s) to cart failed: {e}")
+                for i, _, _ in add_indexes:
+                    messages[i] = "Sorry, I couldn't add that to your cart right now."
+
+        if changes:
+            cart = await self._change_lines(client, cart_id, cart, [(i, operations[i]) for i in changes], messages)
+
+        return CartOutcome(summarize_cart(cart) if cart else None, [message or "" for message in messages])
+
+    async def _add_lines(self, client: ShopifyClient, cart_id: str, lines: list[dict[str, Any]]) -> dict[str, Any]:
+        if cart_id:
+            try:
+                return await client.cart_lines_add(cart_id, lines)
+            except CartNotFoundError:
+                # The shopper's cart expired or was checked out: start a new one with these lines
+                logger.info(f"Cart {cart_id} no longer exists, creating a new one")
+        return await client.cart_create(lines)
+
+    async def _change_lines(self, client: ShopifyClient, cart_id: str, cart: dict[str, Any] | None,
+                            changes: list[tuple[int, CartOperation]], messages: list[str | None]) -> dict[str, Any] | None:
+        if not cart_id:
+            for i, _ in changes:
+                messages[i] = "Your cart is empty."
+            return cart
+        try:
+            if cart is None:
+                cart = await client.fetch_cart(cart_id)
+        except ShopifyAPIError as e:
+            logger.warning(f"Fetching cart failed: {e}")
+            for i, _ in changes:
+                messages[i] = "Sorry, I couldn't update your cart right now."
+            return cart
+        if cart is None:
+            for i, _ in changes:
+                messages[i] = "Your cart has expired. Add the items again to start a new one."
+            return cart
+
+        lines = summarize_cart(cart)["lines"]
+        updates: dict[str, int] = {}
+        removals: dict[str, str] = {}
+        # (operation index, line id, message if the update succeeds)
+        pending: list[tuple[int, str, str]] = []
+        for i, operation in changes:
+            line = next((line for line in lines if operation.product_id in (line["product_id"], line["variant_id"], line["id"])), None)
+            if line is None:
+                messages[i] = "That item isn't in your cart."
+            elif operation.action == "remove" or operation.quantity <= 0:
+                removals[line["id"]] = line["title"]
+                pending.append((i, line["id"], ""))
+            else:
+                updates[line["id"]] = operation.quantity
+                pending.append((i, line["id"], f"Updated {line['title']} to {operation.quantity} in your cart."))
+
+        # A line both updated and removed in one batch is just removed
+        updates = {line_id: quantity for line_id, quantity in updates.items() if line_id not in removals}
+        mutations: list[tuple[str, Callable[[str, Any], Awaitable[dict[str, Any]]], list[Any]]] = [
+            ("update", client.cart_lines_update, [{"id": line_id, "quantity": quantity} for line_id, quantity in updates.items()]),
+            ("remove", client.cart_lines_remove, list(removals)),
+        ]
+        for kind, mutation, arguments in mutations:
+            if not arguments:
+                continue
+            line_ids = updates if kind == "update" else removals
+            try:
+                cart = await mutation(cart_id, arguments)
+                for i, line_id, message in pending:
+                    if line_id in line_ids:
+                        messages[i] = message if kind == "update" else f"Removed {removals[line_id]} from your cart."
+            except CartNotFoundError:
+                for i, line_id, _ in pending:
+                    if line_id in line_ids:
+                        messages[i] = "Your cart has expired. Add the items again to start a new one."
+            except ShopifyAPIError as e:
+                logger.warning(f"Cart {kind} failed: {e}")
+                for i, line_id, _ in pending:
+                    if line_id in line_ids:
+                        messages[i] = "Sorry, I couldn't update your cart right now."
+        return cart
+
+
+# Shared by every request handled by this process
+cart_service = CartService()
@@ -0,0 +1,316 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import zlib
+from collections.abc import Iterable
+from typing import Any, Optional
+
+import numpy as np
+
+from .shopify_client import shop_file_name
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_DIR = os.getenv("CATALOGUE_DIR", "/tmp/shop-agent-catalogue")
+# How often a cached snapshot checks for a newer version written by another process
+CATALOGUE_REFRESH_SECONDS = float(os.getenv("CATALOGUE_REFRESH_SECONDS", "5"))
+
+_CURRENT = "CURRENT"
+_EMPTY_SLOT = -1
+
+_PRODUCT_STRINGS = ("ids", "handles", "titles", "currencies", "image_urls")
+_VARIANT_STRINGS = ("variant_ids", "variant_titles", "variant_skus")
+
+
+class VariantRecord:
+    __slots__ = ("available", "id", "price", "sku", "title")
+
+    def __init__(self, id: str, title: str = "", price: float = float("nan"), sku: str = "", available: bool = True):
+        self.id = id
+        self.title = title
+        self.price = price
+        self.sku = sku
+        self.available = available
+
+    def to_dict(self) -> dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "VariantRecord":
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+
+class CatalogueRecord:
+    """What the agent shows about a product, as of the last sync."""
+
+    __slots__ = ("available", "currency", "handle", "id", "image_url", "inventory", "price", "title", "variants")
+
+    def __init__(self, id: str, handle: str = "", title: str = "", price: float = float("nan"), currency: str = "",
+                 inventory: int = 0, available: bool = True, image_url: str = "", variants: list[VariantRecord] | None = None):
+        self.id = id
+        self.handle = handle
+        self.title = title
+        self.price = price
+        self.currency = currency
+        self.inventory = inventory
+        self.available = available
+        self.image_url = image_url
+        self.variants = variants or []
+
+    @property
+    def variant_id(self) -> str | None:
+        """The variant to add to a cart by default: the first one for sale."""
+        for variant in self.variants:
+            if variant.available:
+                return variant.id
+        return self.variants[0].id if self.variants else None
+
+    def to_dict(self) -> dict[str, Any]:
+        data = {name: getattr(self, name) for name in self.__slots__ if name != "variants"}
+        data["variants"] = [variant.to_dict() for variant in self.variants]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "CatalogueRecord":
+        fields = {name: data[name] for name in cls.__slots__ if name in data and name != "variants"}
+        return cls(**fields, variants=[VariantRecord.from_dict(variant) for variant in data.get("variants", [])])
+
+
+def _string_column(values: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """UTF-8 strings packed into one byte buffer, string i being `buffer[offsets[i]:offsets[i + 1]]`."""
+    encoded = [(value or "").encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _hash(product_id: bytes) -> int:
+    return zlib.crc32(product_id)
+
+
+class CatalogueSnapshot:
+    """
+    Read-only, memory-mapped product catalogue for one shop.
+
+    Each field is a column: numbers as typed arrays, strings packed into a
+    byte buffer plus offsets, and variants stored CSR-style (the variants of
+    product i are rows `variant_offsets[i]:variant_offsets[i + 1]` of the
+    variant columns). An open-addressing hash table over the product ids,
+    saved with the columns, finds a product's row in O(1) without reading
+    the rest of the snapshot, so opening one costs a few mmaps regardless of
+    catalogue size and only the pages of products actually shown get read.
+    """
+
+    def __init__(self, path: str, columns: dict[str, np.ndarray]):
+        self.path = path
+        # Plain views of the maps: indexing np.memmap itself costs several times more per access
+        self._columns = {name: np.asarray(column) for name, column in columns.items()}
+        self._buffers = {name: self._columns[name].data for name in _PRODUCT_STRINGS + _VARIANT_STRINGS}
+        self._slots = self._columns["slots"]
+        self._mask = len(self._slots) - 1
+
+    def __len__(self) -> int:
+        return len(self._columns["prices"])
+
+    def _string(self, name: str, row: int) -> str:
+        offsets = self._columns[f"{name}_offsets"]
+        return str(self._buffers[name][offsets[row]:offsets[row + 1]], "utf-8")
+
+    def _row(self, product_id: str) -> int | None:
+        if not len(self):
+            return None
+        key = product_id.encode("utf-8")
+        ids, offsets = self._buffers["ids"], self._columns["ids_offsets"]
+        slot = _hash(key) & self._mask
+        while True:
+            row = int(self._slots[slot])
+            if row == _EMPTY_SLOT:
+                return None
+            if ids[offsets[row]:offsets[row + 1]] == key:
+                return row
+            slot = (slot + 1) & self._mask
+
+    def _record(self, row: int) -> CatalogueRecord:
+        columns = self._columns
+        variants = [
+            VariantRecord(
+                self._string("variant_ids", v),
+                self._string("variant_titles", v),
+                float(columns["variant_prices"][v]),
+                self._string("variant_skus", v),
+                bool(columns["variant_available"][v]),
+            )
+            for v in range(int(columns["variant_offsets"][row]), int(columns["variant_offsets"][row + 1]))
+        ]
+        return CatalogueRecord(
+            self._string("ids", row),
+            self._string("handles", row),
+            self._string("titles", row),
+            float(columns["prices"][row]),
+            self._string("currencies", row),
+            int(columns["inventory"][row]),
+            bool(columns["available"][row]),
+            self._string("image_urls", row),
+            variants,
+        )
+
+    def get(self, product_id: str) -> CatalogueRecord | None:
+        row = self._row(product_id)
+        return None if row is None else self._record(row)
+
+    def get_many(self, product_ids: Iterable[str]) -> dict[str, CatalogueRecord]:
+        records = {}
+        for product_id in product_ids:
+            record = self.get(product_id)
+            if record is not None:
+                records[product_id] = record
+        return records
+
+    def records(self) -> dict[str, CatalogueRecord]:
+        """Every record, decoded; for rebuilding the snapshot, not for serving."""
+        return {record.id: record for record in (self._record(row) for row in range(len(self)))}
+
+    @staticmethod
+    def current_version(directory: str) -> str | None:
+        try:
+            with open(os.path.join(directory, _CURRENT)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def open(cls, directory: str) -> Optional["CatalogueSnapshot"]:
+        """Memory-map the current version in `directory`, or None if nothing was written yet."""
+        version = cls.current_version(directory)
+        if version is None:
+            return None
+        return cls.load(os.path.join(directory, version))
+
+    @classmethod
+    def load(cls, path: str) -> "CatalogueSnapshot":
+        """Memory-map the version written to `path`."""
+        columns = {
+            name[:-4]: np.load(os.path.join(path, name), mmap_mode="r")
+            for name in os.listdir(path) if name.endswith(".npy")
+        }
+        return cls(path, columns)
+
+    @staticmethod
+    def write(directory: str, records: Iterable[CatalogueRecord]) -> str:
+        """Write `records` as a new version and point CURRENT at it. Returns the version's path."""
+        records = sorted(records, key=lambda record: record.id)
+        variants = [variant for record in records for variant in record.variants]
+        variant_offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        variant_offsets[1:] = np.cumsum([len(record.variants) for record in records])
+
+        columns: dict[str, np.ndarray] = {
+            "prices": np.array([record.price for record in records], dtype=np.float64),
+            "inventory": np.array([record.inventory for record in records], dtype=np.int32),
+            "available": np.array([record.available for record in records], dtype=bool),
+            "variant_offsets": variant_offsets,
+            "variant_prices": np.array([variant.price for variant in variants], dtype=np.float64),
+            "variant_available": np.array([variant.available for variant in variants], dtype=bool),
+        }
+        for name, field in zip(_PRODUCT_STRINGS, ("id", "handle", "title", "currency", "image_url")):
+            columns[name], columns[f"{name}_offsets"] = _string_column([getattr(record, field) for record in records])
+        for name, field in zip(_VARIANT_STRINGS, ("id", "title", "sku")):
+            columns[name], columns[f"{name}_offsets"] = _string_column([getattr(variant, field) for variant in variants])
+
+        # Linear probing at a load factor of at most 0.5
+        size = 1
+        while size < 2 * len(records):
+            size *= 2
+        slots = [_EMPTY_SLOT] * size
+        for row, record in enumerate(records):
+            slot = _hash(record.id.encode("utf-8")) & (size - 1)
+            while slots[slot] != _EMPTY_SLOT:
+                slot = (slot + 1) & (size - 1)
+            slots[slot] = row
+        columns["slots"] = np.array(slots, dtype=np.int32)
+
+        version = f"v{time.time_ns()}"
+        path = os.path.join(directory, version)
+        os.makedirs(path)
+        for name, column in columns.items():
+            np.save(os.path.join(path, f"{name}.npy"), column)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"products": len(records), "variants": len(variants), "created_at": time.time()}, f)
+
+        previous = CatalogueSnapshot.current_version(directory)
+        pointer = os.path.join(directory, f"{_CURRENT}.tmp")
+        with open(pointer, "w") as f:
+            f.write(version)
+        os.replace(pointer, os.path.join(directory, _CURRENT))
+
+        # Keep the previous version for readers that have not switched yet
+        for name in os.listdir(directory):
+            if name.startswith("v") and name not in (version, previous):
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+        return path
+
+
+class CatalogueStore:
+    """
+    One catalogue snapshot per shop on local disk, written at sync time and
+    memory-mapped by search and the cart. A cached snapshot checks for a
+    newer version at most every CATALOGUE_REFRESH_SECONDS, so lookups do no
+    file I/O beyond reading mapped pages.
+    """
+
+    def __init__(self, directory: str = CATALOGUE_DIR, refresh_seconds: float = CATALOGUE_REFRESH_SECONDS):
+        self.directory = directory
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        # shop -> (time of last check, snapshot or None)
+        self._snapshots: dict[str, tuple[float, CatalogueSnapshot | None]] = {}
+
+    def _path(self, shop: str) -> str:
+        return os.path.join(self.directory, shop_file_name(shop))
+
+    def get(self, shop: str) -> CatalogueSnapshot | None:
+        cached = self._snapshots.get(shop)
+        now = time.monotonic()
+        if cached is not None and now - cached[0] < self.refresh_seconds:
+            return cached[1]
+
+        with self._lock:
+            cached = self._snapshots.get(shop)
+            if cached is not None and now - cached[0] < self.refresh_seconds:
+                return cached[1]
+            snapshot = cached[1] if cached is not None else None
+            directory = self._path(shop)
+            version = CatalogueSnapshot.current_version(directory)
+            if version is None:
+                snapshot = None
+            elif snapshot is None or os.path.basename(snapshot.path) != version:
+                start_time = time.perf_counter()
+                snapshot = CatalogueSnapshot.load(os.path.join(directory, version))
+                logger.info(f"Opened catalogue snapshot for {shop or 'default'} ({len(snapshot)} products) in {time.perf_counter() - start_time:.3f}s")
+            self._snapshots[shop] = (now, snapshot)
+            return snapshot
+
+    def evict(self, shop: str):
+        with self._lock:
+            self._snapshots.pop(shop, None)
+
+    def load_records(self, shop: str) -> dict[str, CatalogueRecord]:
+        """The shop's current records, for incremental updates."""
+        snapshot = CatalogueSnapshot.open(self._path(shop))
+        return snapshot.records() if snapshot is not None else {}
+
+    def save(self, shop: str, records: dict[str, CatalogueRecord]) -> CatalogueSnapshot:
+        start_time = time.perf_counter()
+        directory = self._path(shop)
+        os.makedirs(directory, exist_ok=True)
+        snapshot = CatalogueSnapshot.load(CatalogueSnapshot.write(directory, records.values()))
+        with self._lock:
+            self._snapshots[shop] = (time.monotonic(), snapshot)
+        logger.info(f"Wrote catalogue snapshot for {shop or 'default'} ({len(snapshot)} products) in {time.perf_counter() - start_time:.2f}s")
+        return snapshot
+
+
+# Shared by every request handled by this process
+catalogue_snapshots = CatalogueStore()
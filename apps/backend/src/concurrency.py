@@ -0,0 +1,93 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+from collections.abc import Awaitable, Callable, Hashable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
+
+from .telemetry import stage_metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Upper bound on threads used for calls that have no async client
+# (Vertex embeddings, Vector Search queries, Firestore).
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "16"))
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the process-wide bounded thread pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
+        logger.info(f"Blocking thread pool started with {BLOCKING_POOL_SIZE} workers")
+    return _executor
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run a synchronous call in the bounded pool without blocking the event loop.
+    The call sees the caller's context variables, so spans it opens nest under the caller's.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, func, *args, **kwargs))
+
+
+def install_default_executor():
+    """
+    Make the bounded pool the loop's default executor, so libraries that fall
+    back to `run_in_executor(None, ...)` share the same limit.
+    """
+    asyncio.get_running_loop().set_default_executor(get_executor())
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is in
+    flight, later calls with the same key wait on its result instead of
+    making their own. Nothing is kept once the call finishes, so this
+    complements caching rather than replacing it.
+
+    The call runs as its own task, so a caller that gives up (e.g. a client
+    disconnecting) does not cancel it for the others waiting on it.
+    Executed and coalesced calls are counted per `group` in /metrics.
+    """
+
+    def __init__(self, group: str):
+        self.group = group
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> tuple[T, bool]:
+        """Result of `await func(*args, **kwargs)`, shared by callers passing the same key; (result, coalesced)."""
+        task = self._calls.get(key)
+        # A task left over from another event loop (e.g. an earlier asyncio.run) cannot be awaited here
+        coalesced = task is not None and task.get_loop() is asyncio.get_running_loop()
+        if task is None or not coalesced:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(functools.partial(self._finished, key))
+        stage_metrics.record_flight(self.group, coalesced)
+        return await asyncio.shield(task), coalesced
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the outcome as retrieved when every caller has gone, so it is not logged as unhandled
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
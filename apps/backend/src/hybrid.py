@@ -0,0 +1,173 @@
+import logging
+import os
+import re
+from collections.abc import Iterable
+from typing import Any, Optional
+
+from .lexical import LexicalIndex, SearchFilters, normalize_label
+from .retrieval import RetrievalConfig, retrieval
+from .telemetry import span
+
+logger = logging.getLogger(__name__)
+
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+# Candidates taken from each ranking before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# "50", "19.99", "1,500" or "1,500.00"
+_NUMBER = r"(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?(?!\d|[.,]\d)"
+# An amount marked as money: "$50", "€ 20", "usd 30", "50 dollars", "20 bucks"
+_MONEY = rf"(?:[$€£]\s*{_NUMBER}|(?:usd|eur|gbp)\s*{_NUMBER}|{_NUMBER}\s*(?:[$€£]|(?:dollars?|bucks|euros?|pounds|usd|eur|gbp)\b))"
+# A bare amount, only read as a price right after a price word ("price under 50"); never one followed by a unit
+_BARE = rf"{_NUMBER}(?!\s*(?:%|\"|''|(?:inch(?:es)?|in|cm|mm|ft|gb|tb|oz|ml|kg|lbs?|pack|pcs|pieces?|years?|x)\b))"
+_AMOUNT = rf"(?:{_MONEY}|{_BARE})"
+_MAX_WORDS = r"(?:under|below|less than|cheaper than|up to|at most|no more than|max(?:imum)?)"
+_MIN_WORDS = r"(?:over|above|more than|at least|min(?:imum)?|from)"
+_MAX_PRICE = re.compile(rf"\b{_MAX_WORDS}\s*{_AMOUNT}", re.IGNORECASE)
+_MIN_PRICE = re.compile(rf"\b{_MIN_WORDS}\s*{_AMOUNT}(?!\s*(?:to|-)\s*\d)", re.IGNORECASE)
+# "between $20 and $50", "from $20 to $50", "$20-$50", "30-40 dollars" or "price 20 - 40";
+# like single limits, only taken when marked as money or after a price word, since "12-0" is more likely part of a SKU
+_PRICE_RANGE = re.compile(rf"\b(?:between|from)\s*{_AMOUNT}\s*(?:-|to|and)\s*{_AMOUNT}|{_AMOUNT}\s*(?:-|to)\s*{_AMOUNT}", re.IGNORECASE)
+# "budget of 50", "budget is $50": a maximum without a comparison word
+_BUDGET = re.compile(rf"\bbudget(?:\s+(?:of|is))?\s*{_AMOUNT}", re.IGNORECASE)
+_MONEY_MARKER = re.compile(r"[$€£]|\b(?:usd|eur|gbp|dollars?|bucks|euros?|pounds)\b", re.IGNORECASE)
+# A price word within two words before a limit: "price under 50", "priced at most 30", "costs over 20"
+_PRICE_CONTEXT = re.compile(r"\b(?:price[ds]?|pricing|budget|cost(?:s|ing)?|spend|pay)\b(?:\s+\w+){0,2}\s*$", re.IGNORECASE)
+_IN_STOCK = re.compile(r"\b(?:in stock|available(?: now)?|ready to ship)\b", re.IGNORECASE)
+
+
+def _find_price(pattern: "re.Pattern[str]", text: str) -> Optional["re.Match[str]"]:
+    """
+    The first match of `pattern` that is clearly about price: the amount is
+    marked as money, or a price word comes right before it. Anything else
+    ("from 2023", "over 40 inch", "at least 3") stays in the query.
+    """
+    for match in pattern.finditer(text):
+        if pattern is _BUDGET or _MONEY_MARKER.search(match.group(0)) or _PRICE_CONTEXT.search(text[:match.start()]):
+            return match
+    return None
+
+
+def _amounts(match: "re.Match[str]") -> list[float]:
+    return [float(value.replace(",", "")) for value in re.findall(_NUMBER, match.group(0))]
+
+
+def parse_filters(query: str, index: LexicalIndex | None = None) -> tuple[SearchFilters, str, SearchFilters]:
+    """
+    Pull structured constraints out of a shopper query: price limits and
+    "in stock". Returns the filters, the query with those phrases removed,
+    and the category or vendor names the shop actually has that the query
+    mentions, which only boost matching products: "red dress shoes" must
+    still find shoes when "dress" is also a category. Numbers that are not
+    clearly prices stay in the query, where they count as search terms.
+    """
+    min_price: float | None = None
+    max_price: float | None = None
+    text = query
+
+    match = _find_price(_PRICE_RANGE, text)
+    if match:
+        min_price, max_price = sorted(_amounts(match))
+        text = text.replace(match.group(0), " ")
+    else:
+        match = _find_price(_MAX_PRICE, text) or _find_price(_BUDGET, text)
+        if match:
+            max_price = _amounts(match)[0]
+            text = text.replace(match.group(0), " ")
+        match = _find_price(_MIN_PRICE, text)
+        if match:
+            min_price = _amounts(match)[0]
+            text = text.replace(match.group(0), " ")
+        if min_price is not None and max_price is not None and min_price > max_price:
+            # "under $50 over $100" matches nothing; search without a price rather than return no results
+            logger.info(f"Ignoring contradictory price limits in {query!r}: min {min_price} > max {max_price}")
+            min_price = max_price = None
+
+    available_only = bool(_IN_STOCK.search(text))
+    if available_only:
+        text = _IN_STOCK.sub(" ", text)
+
+    boosts: dict[str, str | None] = {"category": None, "vendor": None}
+    if index is not None:
+        normalized = f" {normalize_label(text)} "
+        for field, labels in (("category", index.category_labels), ("vendor", index.vendor_labels)):
+            # Prefer the longest name, so "evening dress" wins over "dress"
+            for label in sorted(labels, key=len, reverse=True):
+                if label and f" {label} " in normalized:
+                    boosts[field] = label
+                    break
+
+    filters = SearchFilters(min_price=min_price, max_price=max_price, available_only=available_only)
+    return filters, " ".join(text.split()), SearchFilters(category=boosts["category"], vendor=boosts["vendor"])
+
+
+def merge_filters(parsed: SearchFilters, explicit: SearchFilters) -> SearchFilters:
+    """Explicit filters (e.g. tool arguments from the LLM) take precedence over parsed ones."""
+    return SearchFilters._make(
+        explicit_value if explicit_value not in (None, False) else parsed_value
+        for parsed_value, explicit_value in zip(parsed, explicit)
+    )
+
+
+def reciprocal_rank_fusion(rankings: Iterable[list[str]], k: int = RRF_K) -> list[tuple[str, float]]:
+    """Fuse ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, product_id in enumerate(ranking, start=1):
+            scores[product_id] = scores.get(product_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+async def hybrid_search(shop: str, query: str, embedding: list[float] | None, filters: SearchFilters, index: LexicalIndex | None,
+                        config: RetrievalConfig | None = None, k: int = 5, boosts: SearchFilters | None = None) -> list[dict[str, Any]]:
+    """
+    Metadata of the top-k products, fusing the BM25 ranking for `query`
+    (with filter phrases already removed) and the vector ranking for
+    `embedding` with RRF. Products matching an identifier in the query
+    exactly (a SKU) are pinned first. Filters are applied before either
+    ranking when the shop has a lexical `index`, and to the vector results otherwise.
+    Candidates matching `boosts` (a category or vendor named in the query)
+    get one more ranking in the fusion, so they rise without excluding the rest.
+    Works lexical-only when there is no embedding, vector-only when there
+    is no lexical index.
+    """
+    mask = None
+    allowed_ids = None
+    if index is not None and not filters.is_empty:
+        mask = index.mask(filters)
+        allowed_ids = {index.ids[doc] for doc in mask.nonzero()[0]}
+        logger.info(f"Filters {filters.cache_key()} leave {len(allowed_ids)} of {len(index)} products")
+        if not allowed_ids:
+            return []
+
+    metadata: dict[str, dict[str, Any]] = {}
+    rankings: list[list[str]] = []
+    pinned: list[str] = []
+
+    if embedding is not None:
+        documents = await retrieval.asimilarity_search_by_vector(embedding, k=HYBRID_CANDIDATES, shop=shop, allowed_ids=allowed_ids, config=config)
+        if index is None and not filters.is_empty:
+            documents = [doc for doc in documents if filters.matches(doc.metadata)]
+        ranking = []
+        for doc in documents:
+            product_id = doc.metadata.get("id", "")
+            metadata.setdefault(product_id, doc.metadata)
+            ranking.append(product_id)
+        rankings.append(ranking)
+
+    if index is not None:
+        with span("lexical.search"):
+            pinned = index.exact_matches(query, mask)
+            hits = index.search(query, k=HYBRID_CANDIDATES, mask=mask)
+        for product_id in pinned + [product_id for product_id, _ in hits]:
+            # The lexical index also knows availability, so prefer its metadata
+            metadata[product_id] = index.metadatas[index.rows[product_id]]
+        rankings.append([product_id for product_id, _ in hits])
+
+    fused_scores = reciprocal_rank_fusion(rankings)
+    if boosts is not None and not boosts.is_empty:
+        rankings.append([product_id for product_id, _ in fused_scores if boosts.matches(metadata[product_id])])
+        fused_scores = reciprocal_rank_fusion(rankings)
+    fused = pinned + [product_id for product_id, _ in fused_scores if product_id not in pinned]
+    return [metadata[product_id] for product_id in fused[:k]]
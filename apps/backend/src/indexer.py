@@ -1,161 +1,222 @@
-import os
 import logging
-import re
-from typing import List, Dict, Any, Set
-from langchain_google_vertexai import VertexAIEmbeddings
+import os
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime
+from typing import Any
+
 from google.cloud import aiplatform
-from google.cloud import firestore
+from langchain_google_vertexai import VertexAIEmbeddings
+
+from .catalogue import CatalogueRecord, catalogue_snapshots
+from .concurrency import run_blocking
+from .lexical import lexical_indexes
+from .manifest import content_hash, create_manifest_store
+from .normalize import prepare_page
+from .pipeline import EmbeddingPipeline, ProductRecord
+from .retrieval import RetrievalConfig, local_index_path
 from .shopify_client import ShopifyClient
+from .telemetry import span
+from .tenants import shop_registry
+from .vector_index import LocalVectorStore
 
 logger = logging.getLogger(__name__)
 
-# Initialize Vertex AI
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
 REGION = os.getenv("GOOGLE_CLOUD_REGION", "us-central1")
-aiplatform.init(project=PROJECT_ID, location=REGION)
+
+_vertex_initialized = False
+
+
+def init_vertex():
+    """
+    Initialize Vertex AI for our project and region. Done when a Vertex client
+    is first needed rather than at import, so the module loads without cloud
+    access (e.g. with fakes injected in benchmarks).
+    """
+    global _vertex_initialized
+    if not _vertex_initialized:
+        aiplatform.init(project=PROJECT_ID, location=REGION)
+        _vertex_initialized = True
 
 
 class ProductIndexer:
-    def __init__(self, shopify_client: ShopifyClient):
+    def __init__(self, shopify_client: ShopifyClient, manifest_store=None, embeddings_model=None, db=None):
         self.shopify_client = shopify_client
-        # Use default VertexAI embeddings (768 dimensions)
-        self.embeddings_model = VertexAIEmbeddings(model_name="text-embedding-004")
-        self.db = firestore.Client()
-
-    def clean_html(self, raw_html: str) -> str:
-        """Remove HTML tags from a string."""
-        if not raw_html:
-            return ""
-        cleanr = re.compile('<.*?>')
-        cleantext = re.sub(cleanr, '', raw_html)
-        return cleantext.strip()
-
-    def create_context_string(self, product: Dict[str, Any]) -> str:
-        """Concatenate product details into a single context string with category emphasis."""
-        title = product.get("title", "")
-        description = self.clean_html(product.get("descriptionHtml", ""))
-        tags = ", ".join(product.get("tags", []))
-        vendor = product.get("vendor", "")
-        product_type = product.get("productType", "")
-        
-        # Get price from the first variant or price range
-        price = "N/A"
-        variants = product.get("variants", {}).get("edges", [])
-        if variants:
-            price = variants[0]["node"].get("price", "N/A")
-        
-        # Enhanced context with category prominence
-        context = f"Category: {product_type}\nTitle: {title}\nDescription: {description}\nTags: {tags}\nVendor: {vendor}\nPrice: {price}"
-        return context
-
-    def extract_categories(self, products: List[Dict[str, Any]]) -> Set[str]:
-        """Extract unique product categories/types from products."""
-        categories = set()
-        for product in products:
-            product_type = product.get("productType", "").strip()
-            if product_type:
-                categories.add(product_type)
-        return categories
-
-    async def ingest_products(self, index_endpoint_name: str, index_id: str):
+        if embeddings_model is None:
+            # Use default VertexAI embeddings (768 dimensions)
+            init_vertex()
+            embeddings_model = VertexAIEmbeddings(model_name="text-embedding-004")
+        self.embeddings_model = embeddings_model
+        # Firestore is only connected to when the manifest is kept there
+        self.db = db
+        self.manifest_store = manifest_store or create_manifest_store(db)
+
+    async def ingest_products(self, index_endpoint_name: str, index_id: str, full_rebuild: bool = False, progress=None) -> dict[str, int]:
         """
-        Fetch products, generate embeddings, and upload to Vector Search with upsert logic.
-        Uses delete-all + add pattern for simplicity (avoids duplicates).
+        Fetch products, generate embeddings, and upsert them to Vector Search.
+
+        Incremental by default: only products updated since the last sync are
+        fetched, only those whose content hash changed are re-embedded, and
+        products removed from the store are deleted from the index.
+        Pass full_rebuild=True to fetch and re-embed the whole catalogue.
+
+        With `progress` (a jobs.SyncProgress) the sync is resumable: products
+        are checkpointed as they reach the index, and a sync whose progress
+        holds a checkpoint from an interrupted attempt continues after the
+        last fully indexed page without re-embedding finished products.
         """
-        logger.info("Starting product ingestion...")
-        products = await self.shopify_client.fetch_all_products()
-        
-        if not products:
+        shop = self.shopify_client.shop_url
+        manifest = await run_blocking(self.manifest_store.load, shop)
+        resume = dict(progress.checkpoint) if progress is not None else {}
+        if resume:
+            sync_started_at, incremental, updated_since = resume["sync_started_at"], resume["incremental"], resume["updated_since"]
+        else:
+            sync_started_at = datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+            incremental = not full_rebuild and manifest.last_synced_at is not None
+            updated_since = manifest.last_synced_at if incremental else None
+
+        # The lexical index and catalogue snapshot need every product, not just changed ones
+        documents = {} if full_rebuild else await run_blocking(lexical_indexes.load_documents, shop)
+        catalogue = {} if full_rebuild else await run_blocking(catalogue_snapshots.load_records, shop)
+        if not resume and incremental and not (documents and catalogue):
+            logger.info("No lexical index or catalogue snapshot yet: fetching the whole catalogue, re-embedding only changed products")
+            updated_since = None
+
+        if resume:
+            logger.info(f"Resuming product ingestion after cursor {resume.get('cursor')} ({len(progress.done)} products already done)...")
+        elif updated_since:
+            logger.info(f"Starting incremental product ingestion (changes since {updated_since})...")
+        else:
+            logger.info("Starting full product ingestion...")
+        if progress is not None and not resume:
+            progress.start(sync_started_at=sync_started_at, incremental=incremental, updated_since=updated_since)
+
+        # The full ID list tells us which products were deleted since the last sync
+        if progress is not None:
+            progress.set_stage("listing")
+        with span("sync.listing", shop=shop):
+            current_ids = set(await self.shopify_client.fetch_product_ids())
+
+        entries = dict(manifest.products) if incremental else {}
+        # Products an interrupted attempt already indexed
+        done = progress.done if progress is not None else {}
+        for product_id, item in done.items():
+            entries[product_id] = item["entry"]
+            documents[product_id] = item["document"]
+            catalogue[product_id] = CatalogueRecord.from_dict(item["record"])
+        counts = {"fetched": 0, "indexed": 0, "resumed": len(done)}
+
+        def product_done(product_id: str):
+            if progress is not None:
+                progress.product_done(product_id, entries[product_id], documents[product_id], catalogue[product_id].to_dict())
+
+        async def changed_records():
+            # Products are processed page by page and dropped once queued for
+            # embedding, so memory does not grow with the catalogue.
+            # Full syncs of large catalogues go through a bulk export; changes since the last sync are paginated
+            expected_count = None if updated_since else len(current_ids)
+            async for page in self.shopify_client.iter_products(updated_since=updated_since, expected_count=expected_count, after=resume.get("cursor")):
+                if progress is not None:
+                    progress.page_fetched(page.cursor, [product.get("id") for product in page])
+                for prepared in await prepare_page(page):
+                    counts["fetched"] += 1
+                    product_id = prepared.id
+                    digest = content_hash(prepared.context, prepared.metadata)
+                    documents[product_id] = prepared.document
+                    catalogue[product_id] = prepared.record
+
+                    previous = manifest.products.get(product_id, {})
+                    finished = done.get(product_id, {}).get("entry", {})
+                    entries[product_id] = {"hash": digest, "category": prepared.category}
+                    if (not full_rebuild and previous.get("hash") == digest) or finished.get("hash") == digest:
+                        product_done(product_id)
+                        continue
+
+                    counts["indexed"] += 1
+                    yield ProductRecord(product_id, prepared.context, prepared.metadata)
+                if progress is not None:
+                    progress.update_counts(counts)
+                    await progress.flush()
+
+        # Only connect to the vector store once there is something to write
+        if progress is not None:
+            progress.set_stage("indexing")
+        with span("sync.indexing", shop=shop, incremental=bool(updated_since)) as indexing_span:
+            records = changed_records()
+            first_record = await anext(records, None)
+            vector_store = None
+            if first_record is not None:
+                vector_store = self._create_vector_store(index_endpoint_name, index_id)
+                await self._embed_and_upsert(vector_store, _prepend(first_record, records),
+                                             on_upserted=lambda chunk: [product_done(record.id) for record in chunk])
+            indexing_span.set_attribute("sync.fetched", counts["fetched"])
+            indexing_span.set_attribute("sync.indexed", counts["indexed"])
+
+        removed_ids = [product_id for product_id in manifest.products if product_id not in current_ids]
+        for product_id in removed_ids:
+            entries.pop(product_id, None)
+            documents.pop(product_id, None)
+            catalogue.pop(product_id, None)
+
+        fetched, indexed = counts["fetched"], counts["indexed"]
+        logger.info(f"Fetched {fetched} products: {indexed} new or changed, {len(removed_ids)} removed, {fetched - indexed} unchanged")
+        if progress is not None:
+            progress.update_counts({**counts, "removed": len(removed_ids)})
+            progress.set_stage("saving")
+            await progress.flush(force=True)
+
+        if not entries:
             logger.warning("No products found.")
-            return
 
-        # Extract and store categories in Firestore for agent context
-        categories = self.extract_categories(products)
+        # Extract and store categories in the shop's registry entry for agent context
+        categories = {entry["category"] for entry in entries.values() if entry.get("category")}
         logger.info(f"Found {len(categories)} unique product categories: {', '.join(sorted(categories))}")
         
-        # Store categories in Firestore for agent access
         try:
-            categories_ref = self.db.collection('metadata').document('product_categories')
-            categories_ref.set({
-                'categories': list(sorted(categories)),
-                'updated_at': firestore.SERVER_TIMESTAMP
-            })
-            logger.info("Product categories stored in Firestore")
+            await shop_registry.update(shop, categories=sorted(categories))
+            logger.info("Product categories stored in the shop registry")
         except Exception as e:
-            logger.warning(f"Failed to store categories in Firestore: {e}")
-
-        texts = []
-        metadatas = []
-        ids = []
-
-        for product in products:
-            context = self.create_context_string(product)
-            product_id = product.get("id")
-            product_type = product.get("productType", "")
-            
-            texts.append(context)
-            ids.append(product_id)
-            
-            # Enhanced metadata with category/type
-            image_url = ""
-            images = product.get("images", {}).get("edges", [])
-            if images:
-                image_url = images[0]["node"].get("url", "")
-            
-            # Get price for metadata
-            price = "N/A"
-            variants = product.get("variants", {}).get("edges", [])
-            if variants:
-                price = variants[0]["node"].get("price", "N/A")
-
-            metadatas.append({
-                "id": product_id,
-                "title": product.get("title"),
-                "handle": product.get("handle"),
-                "category": product_type,  # Added for filtering
-                "product_type": product_type,  # Redundant but explicit
-                "vendor": product.get("vendor", ""),
-                "price": price,
-                "image_url": image_url,
-            })
-
-        logger.info(f"Generating embeddings for {len(texts)} products...")
-        
-        # Generate embeddings in batches to respect:
-        # 1. Vertex AI's 250 instances/prediction limit
-        # 2. text-embedding-004's 20K token/request limit
-        # 3. Timeouts (smaller batches = faster per-request processing)
-        BATCH_SIZE = 20  # Reduced to 20 to avoid timeouts
-        embeddings = []
-        
-        import time
-        
-        for i in range(0, len(texts), BATCH_SIZE):
-            batch_texts = texts[i:i+BATCH_SIZE]
-            logger.info(f"Processing batch {i//BATCH_SIZE + 1} ({len(batch_texts)} products)...")
-            
-            start_time = time.time()
-            try:
-                batch_embeddings = self.embeddings_model.embed_documents(batch_texts)
-                embeddings.extend(batch_embeddings)
-                elapsed = time.time() - start_time
-                logger.info(f"Batch {i//BATCH_SIZE + 1} processed in {elapsed:.2f}s")
-            except Exception as e:
-                logger.error(f"Error embedding batch {i//BATCH_SIZE + 1}: {e}")
-                raise e
+            logger.warning(f"Failed to store categories: {e}", exc_info=True)
+
+        with span("sync.saving", shop=shop, removed=len(removed_ids)):
+            if removed_ids:
+                logger.info(f"Deleting {len(removed_ids)} removed products from vector store...")
+                if vector_store is None:
+                    vector_store = self._create_vector_store(index_endpoint_name, index_id)
+                await run_blocking(vector_store.delete, ids=removed_ids)
+            elif not indexed:
+                logger.info("Index is already up to date.")
+
+            # The local backend buffers writes in memory; persist before recording them in the manifest
+            if isinstance(vector_store, LocalVectorStore):
+                await run_blocking(vector_store.save)
+            await run_blocking(lexical_indexes.save, shop, documents)
+            await run_blocking(catalogue_snapshots.save, shop, catalogue)
+
+            manifest.products = entries
+            manifest.last_synced_at = sync_started_at
+            await run_blocking(self.manifest_store.save, shop, manifest)
         
-        logger.info(f"Generated {len(embeddings)} embeddings, first embedding has {len(embeddings[0])} dimensions")
+        logger.info(f"Ingestion complete. {indexed} products indexed, {len(removed_ids)} removed, {len(entries)} in catalogue across {len(categories)} categories.")
+        return {"fetched": fetched, "indexed": indexed, "resumed": counts["resumed"], "removed": len(removed_ids), "total": len(entries)}
+
+    def _create_vector_store(self, index_endpoint_name: str, index_id: str):
+        config = RetrievalConfig.from_env()
+        if config.is_local:
+            path = local_index_path(config.local_dir, self.shopify_client.shop_url)
+            logger.info(f"Using local vector index at {path}")
+            return LocalVectorStore(path, embedding=self.embeddings_model)
 
-        logger.info("Uploading to Vector Search...")
         logger.info(f"Using Project: {PROJECT_ID}, Region: {REGION}")
         logger.info(f"Using Index ID: {index_id}")
         logger.info(f"Using Endpoint ID: {index_endpoint_name}")
         
         from langchain_google_vertexai import VectorSearchVectorStore
-        
+
+        init_vertex()
         # Use passed arguments instead of env vars
         # Note: endpoint_id in VectorSearchVectorStore expects the Endpoint ID, not the name
-        vector_store = VectorSearchVectorStore.from_components(
+        return VectorSearchVectorStore.from_components(
             project_id=PROJECT_ID,
             region=REGION,
             gcs_bucket_name=os.getenv("GCS_BUCKET_NAME"),
@@ -163,14 +224,18 @@ class ProductIndexer:
             endpoint_id=index_endpoint_name,
             embedding=self.embeddings_model
         )
-        
-        # UPSERT LOGIC: Add products in batches
-        logger.info(f"Adding {len(products)} products to vector store in batches...")
-        for i in range(0, len(texts), BATCH_SIZE):
-            batch_texts = texts[i:i+BATCH_SIZE]
-            batch_metadatas = metadatas[i:i+BATCH_SIZE]
-            batch_ids = ids[i:i+BATCH_SIZE]
-            logger.info(f"Uploading batch {i//BATCH_SIZE + 1} ({len(batch_texts)} products)...")
-            vector_store.add_texts(texts=batch_texts, metadatas=batch_metadatas, ids=batch_ids)
-        
-        logger.info(f"Ingestion complete. {len(products)} products indexed across {len(categories)} categories.")
+
+    async def _embed_and_upsert(self, vector_store, records: AsyncIterator[ProductRecord], on_upserted=None) -> dict[str, Any]:
+        """
+        Embed and upsert through the concurrent pipeline; existing IDs are overwritten.
+        Batching, concurrency and quota backoff are configured in `pipeline.py`.
+        """
+        logger.info("Embedding and uploading changed products...")
+        pipeline = EmbeddingPipeline(self.embeddings_model, vector_store, on_upserted=on_upserted)
+        return await pipeline.run(records)
+
+
+async def _prepend(first: ProductRecord, rest: AsyncIterator[ProductRecord]) -> AsyncIterator[ProductRecord]:
+    yield first
+    async for record in rest:
+        yield record
@@ -0,0 +1,629 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from typing import Any, NamedTuple
+
+from .concurrency import install_default_executor, run_blocking, shutdown_executor
+from .normalize import shutdown_pool
+from .shopify_client import close_connections, normalize_shop_domain
+from .telemetry import configure_tracing, shutdown_tracing, span
+
+logger = logging.getLogger(__name__)
+
+# The queue must outlive the process to be of use. On Cloud Run (K_SERVICE is set) /tmp is in-memory and per
+# instance: a job queued on one instance is invisible to the others and lost on a restart. There the store
+# refuses to open under /tmp, and /sync answers 503, until SYNC_JOBS_PATH points at storage every instance
+# mounts (e.g. a Filestore volume). SYNC_JOBS_ALLOW_EPHEMERAL=true accepts the loss instead, for a service
+# pinned to one instance.
+SYNC_JOBS_PATH = os.getenv("SYNC_JOBS_PATH", "/tmp/shop-agent-jobs.sqlite")
+SYNC_JOBS_ALLOW_EPHEMERAL = os.getenv("SYNC_JOBS_ALLOW_EPHEMERAL", "false").lower() == "true"
+# Worker processes the web app starts for sync jobs. Set to 0 where workers
+# run as their own service (python -m src.jobs --workers N).
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "1"))
+# A running job belongs to its worker while the lease is renewed; a job whose
+# lease ran out (the worker died) is picked up again and resumed
+SYNC_JOB_LEASE_SECONDS = float(os.getenv("SYNC_JOB_LEASE_SECONDS", "60"))
+SYNC_JOB_MAX_ATTEMPTS = int(os.getenv("SYNC_JOB_MAX_ATTEMPTS", "3"))
+# A failed job waits this long before its next attempt, doubling with each attempt up to the maximum
+SYNC_JOB_RETRY_SECONDS = float(os.getenv("SYNC_JOB_RETRY_SECONDS", "30"))
+SYNC_JOB_RETRY_MAX_SECONDS = float(os.getenv("SYNC_JOB_RETRY_MAX_SECONDS", "600"))
+# How often progress is written to the job store while a sync runs
+SYNC_CHECKPOINT_SECONDS = float(os.getenv("SYNC_CHECKPOINT_SECONDS", "5"))
+SYNC_POLL_SECONDS = float(os.getenv("SYNC_POLL_SECONDS", "1"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_jobs (
+    id TEXT PRIMARY KEY,
+    shop TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    full_rebuild INTEGER NOT NULL DEFAULT 0,
+    counts TEXT NOT NULL DEFAULT '{}',
+    checkpoint TEXT NOT NULL DEFAULT '{}',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    worker TEXT,
+    lease_expires_at REAL,
+    -- A job re-queued after a failure is not claimed before this time
+    run_after REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+-- At most one queued or running sync per shop: this is the per-shop lock
+CREATE UNIQUE INDEX IF NOT EXISTS sync_jobs_active_shop ON sync_jobs (shop) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS sync_jobs_status ON sync_jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS sync_job_products (
+    job_id TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (job_id, product_id)
+);
+"""
+
+
+class JobLeaseLost(Exception):
+    """The job was taken over by another worker after this one stopped renewing its lease."""
+
+
+class JobStoreUnavailable(RuntimeError):
+    """The job store is not on storage that outlives this instance (see SYNC_JOBS_PATH)."""
+
+
+def _timestamp(value: float | None) -> str | None:
+    return datetime.fromtimestamp(value, UTC).strftime("%Y-%m-%dT%H:%M:%SZ") if value else None
+
+
+class SyncJob(NamedTuple):
+    id: str
+    shop: str
+    # queued, running, succeeded or failed
+    status: str
+    # queued, listing, indexing, saving or done
+    stage: str
+    full_rebuild: bool
+    counts: dict[str, int]
+    checkpoint: dict[str, Any]
+    attempts: int
+    error: str | None
+    created_at: float
+    started_at: float | None
+    updated_at: float
+    finished_at: float | None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "SyncJob":
+        return cls(
+            row["id"], row["shop"], row["status"], row["stage"], bool(row["full_rebuild"]),
+            json.loads(row["counts"]), json.loads(row["checkpoint"]), row["attempts"], row["error"],
+            row["created_at"], row["started_at"], row["updated_at"], row["finished_at"],
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        """The job as reported by /sync/{job_id}, with its throughput so far."""
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        processed = self.counts.get("fetched", 0) + self.counts.get("resumed", 0)
+        return {
+            "job_id": self.id,
+            "shop": self.shop,
+            "status": self.status,
+            "stage": self.stage,
+            "full_rebuild": self.full_rebuild,
+            "counts": self.counts,
+            "attempts": self.attempts,
+            "error": self.error,
+            "created_at": _timestamp(self.created_at),
+            "started_at": _timestamp(self.started_at),
+            "finished_at": _timestamp(self.finished_at),
+            "elapsed_seconds": round(elapsed, 1),
+            "products_per_second": round(processed / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+class JobStore:
+    """
+    Sync jobs in SQLite, shared by the web app (which enqueues them) and the
+    worker processes (which claim and run them). A worker holds a job
+    through a lease it renews with every checkpoint; checkpoints also store
+    the products the job has finished, so a job picked up again after its
+    worker died resumes instead of starting over.
+    """
+
+    def __init__(self, path: str = SYNC_JOBS_PATH, max_attempts: int = SYNC_JOB_MAX_ATTEMPTS,
+                 retry_seconds: float = SYNC_JOB_RETRY_SECONDS, retry_max_seconds: float = SYNC_JOB_RETRY_MAX_SECONDS,
+                 allow_ephemeral: bool = SYNC_JOBS_ALLOW_EPHEMERAL):
+        self.path = path
+        self.allow_ephemeral = allow_ephemeral
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+
+    def unavailable_reason(self) -> str | None:
+        """Why the store must not be used here, or None if it can be."""
+        if os.getenv("K_SERVICE") and os.path.abspath(self.path).startswith("/tmp/") and not self.allow_ephemeral:
+            return (f"Sync jobs would be kept in {self.path}, which is per instance and lost on a Cloud Run restart; "
+                    "set SYNC_JOBS_PATH to storage shared by every instance")
+        return None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            reason = self.unavailable_reason()
+            if reason is not None:
+                raise JobStoreUnavailable(reason)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+            db.row_factory = sqlite3.Row
+            # Readers don't block the writer, and several processes share the file
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+            # Stores created before run_after existed
+            if "run_after" not in {row["name"] for row in db.execute("PRAGMA table_info(sync_jobs)")}:
+                db.execute("ALTER TABLE sync_jobs ADD COLUMN run_after REAL")
+            self._db = db
+        return self._db
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def _get(self, db: sqlite3.Connection, job_id: str) -> SyncJob | None:
+        row = db.execute("SELECT * FROM sync_jobs WHERE id = ?", (job_id,)).fetchone()
+        return SyncJob.from_row(row) if row is not None else None
+
+    def get(self, job_id: str) -> SyncJob | None:
+        with self._lock:
+            return self._get(self._connect(), job_id)
+
+    def enqueue(self, shop: str, full_rebuild: bool = False) -> tuple[SyncJob, bool]:
+        """
+        Queue a sync of `shop`, unless one is already queued or running, in
+        which case that job is returned instead. Returns (job, created).
+        """
+        shop = normalize_shop_domain(shop)
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT * FROM sync_jobs WHERE shop = ? AND status IN ('queued', 'running')", (shop,)).fetchone()
+            if row is not None:
+                # A queued incremental sync can still become a full rebuild
+                if full_rebuild and row["status"] == "queued" and not row["full_rebuild"]:
+                    db.execute("UPDATE sync_jobs SET full_rebuild = 1, updated_at = ? WHERE id = ?", (now, row["id"]))
+                    row = db.execute("SELECT * FROM sync_jobs WHERE id = ?", (row["id"],)).fetchone()
+                return SyncJob.from_row(row), False
+            job_id = uuid.uuid4().hex
+            db.execute(
+                "INSERT INTO sync_jobs (id, shop, status, stage, full_rebuild, created_at, updated_at) VALUES (?, ?, 'queued', 'queued', ?, ?, ?)",
+                (job_id, shop, int(full_rebuild), now, now),
+            )
+            row = db.execute("SELECT * FROM sync_jobs WHERE id = ?", (job_id,)).fetchone()
+            return SyncJob.from_row(row), True
+
+    def claim(self, worker: str, lease_seconds: float = SYNC_JOB_LEASE_SECONDS) -> SyncJob | None:
+        """
+        The oldest job that is queued (and past its retry backoff) or whose
+        worker stopped renewing its lease, now leased to `worker`.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            while True:
+                row = db.execute(
+                    "SELECT * FROM sync_jobs WHERE (status = 'queued' AND (run_after IS NULL OR run_after <= ?)) "
+                    "OR (status = 'running' AND lease_expires_at < ?) ORDER BY created_at LIMIT 1",
+                    (now, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row["attempts"] >= self.max_attempts:
+                    self._finish(db, row["id"], "failed", error=row["error"] or "Worker stopped responding")
+                    continue
+                if row["status"] == "running":
+                    logger.warning(f"Sync job {row['id']} for {row['shop']} lost its worker {row['worker']}, resuming")
+                db.execute(
+                    "UPDATE sync_jobs SET status = 'running', worker = ?, lease_expires_at = ?, run_after = NULL, attempts = attempts + 1, "
+                    "started_at = COALESCE(started_at, ?), updated_at = ? WHERE id = ?",
+                    (worker, now + lease_seconds, now, now, row["id"]),
+                )
+                return self._get(db, row["id"])
+
+    def checkpoint(self, job_id: str, worker: str, stage: str, counts: dict[str, int], checkpoint: dict[str, Any],
+                   products: dict[str, dict[str, Any]], lease_seconds: float = SYNC_JOB_LEASE_SECONDS) -> bool:
+        """Record progress and renew the lease. Returns False if `worker` no longer holds the job."""
+        now = time.time()
+        with self._transaction() as db:
+            updated = db.execute(
+                "UPDATE sync_jobs SET stage = ?, counts = ?, checkpoint = ?, lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (stage, json.dumps(counts), json.dumps(checkpoint), now + lease_seconds, now, job_id, worker),
+            ).rowcount
+            if not updated:
+                return False
+            db.executemany(
+                "INSERT OR REPLACE INTO sync_job_products (job_id, product_id, data) VALUES (?, ?, ?)",
+                ((job_id, product_id, zlib.compress(json.dumps(item).encode("utf-8"))) for product_id, item in products.items()),
+            )
+            return True
+
+    def load_products(self, job_id: str) -> dict[str, dict[str, Any]]:
+        """The products a job has checkpointed as done."""
+        with self._lock:
+            rows = self._connect().execute("SELECT product_id, data FROM sync_job_products WHERE job_id = ?", (job_id,)).fetchall()
+        return {row["product_id"]: json.loads(zlib.decompress(row["data"])) for row in rows}
+
+    def _finish(self, db: sqlite3.Connection, job_id: str, status: str, counts: dict[str, int] | None = None, error: str | None = None):
+        now = time.time()
+        db.execute(
+            "UPDATE sync_jobs SET status = ?, stage = CASE WHEN ? = 'succeeded' THEN 'done' ELSE stage END, "
+            "counts = COALESCE(?, counts), error = ?, worker = NULL, lease_expires_at = NULL, updated_at = ?, finished_at = ? WHERE id = ?",
+            (status, status, json.dumps(counts) if counts is not None else None, error, now, now, job_id),
+        )
+        db.execute("DELETE FROM sync_job_products WHERE job_id = ?", (job_id,))
+
+    def complete(self, job_id: str, worker: str, counts: dict[str, int]) -> bool:
+        with self._transaction() as db:
+            row = db.execute("SELECT worker FROM sync_jobs WHERE id = ? AND status = 'running'", (job_id,)).fetchone()
+            if row is None or row["worker"] != worker:
+                return False
+            self._finish(db, job_id, "succeeded", counts=counts)
+            return True
+
+    def fail(self, job_id: str, worker: str, error: str) -> str | None:
+        """
+        Put a failed job back in the queue, keeping its progress, to be retried
+        after a backoff that doubles with each attempt; or fail it for good
+        after its last attempt.
+        """
+        with self._transaction() as db:
+            row = db.execute("SELECT worker, attempts FROM sync_jobs WHERE id = ? AND status = 'running'", (job_id,)).fetchone()
+            if row is None or row["worker"] != worker:
+                return None
+            if row["attempts"] >= self.max_attempts:
+                self._finish(db, job_id, "failed", error=error)
+                return "failed"
+            now = time.time()
+            delay = min(self.retry_seconds * 2 ** (row["attempts"] - 1), self.retry_max_seconds)
+            db.execute(
+                "UPDATE sync_jobs SET status = 'queued', error = ?, worker = NULL, lease_expires_at = NULL, run_after = ?, updated_at = ? WHERE id = ?",
+                (error, now + delay, now, job_id),
+            )
+            return "queued"
+
+    def release(self, job_id: str, worker: str):
+        """Hand a job back to the queue when its worker shuts down; the attempt does not count."""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE sync_jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), worker = NULL, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time(), job_id, worker),
+            )
+
+    def finished_since(self, since: float) -> list[SyncJob]:
+        """Jobs that succeeded after `since`, oldest first."""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT * FROM sync_jobs WHERE status = 'succeeded' AND finished_at > ? ORDER BY finished_at", (since,)
+            ).fetchall()
+        return [SyncJob.from_row(row) for row in rows]
+
+
+class SyncProgress:
+    """
+    Progress of one sync attempt, as reported to ProductIndexer.ingest_products
+    and checkpointed to the job store at most every SYNC_CHECKPOINT_SECONDS.
+
+    Products are done once they are in the index (or needed no indexing).
+    Pages are fetched in order but indexed concurrently, so the checkpointed
+    cursor is that of the last page whose products, and those of every page
+    before it, are all done; a resumed sync fetches from there.
+    """
+
+    def __init__(self, store: JobStore, job: SyncJob, worker: str, checkpoint_seconds: float = SYNC_CHECKPOINT_SECONDS,
+                 lease_seconds: float = SYNC_JOB_LEASE_SECONDS):
+        self.store = store
+        self.job = job
+        self.worker = worker
+        self.checkpoint_seconds = checkpoint_seconds
+        self.lease_seconds = lease_seconds
+        self.checkpoint: dict[str, Any] = dict(job.checkpoint)
+        self.stage = job.stage
+        self.counts: dict[str, int] = dict(job.counts)
+        # Done in an earlier attempt (see load) and done since the last flush
+        self.done: dict[str, dict[str, Any]] = {}
+        self._unsaved: dict[str, dict[str, Any]] = {}
+        # (cursor, products of that page not done yet), oldest first
+        self._pages: deque = deque()
+        self._page_of: dict[str, set] = {}
+        self._last_flush = time.monotonic()
+        self._flush_lock = asyncio.Lock()
+
+    async def load(self):
+        if self.checkpoint:
+            self.done = await run_blocking(self.store.load_products, self.job.id)
+
+    def start(self, **checkpoint):
+        """Record how this sync selects products, so a resumed attempt selects the same ones."""
+        self.checkpoint = {**checkpoint, "cursor": None}
+
+    def set_stage(self, stage: str):
+        self.stage = stage
+
+    def update_counts(self, counts: dict[str, int]):
+        self.counts.update(counts)
+
+    def page_fetched(self, cursor: str | None, product_ids: list[str]):
+        pending = set(product_ids)
+        self._pages.append((cursor, pending))
+        for product_id in product_ids:
+            self._page_of[product_id] = pending
+
+    def product_done(self, product_id: str, entry: dict[str, str], document: dict[str, Any], record: dict[str, Any]):
+        self._unsaved[product_id] = {"entry": entry, "document": document, "record": record}
+        pending = self._page_of.pop(product_id, None)
+        if pending is not None:
+            pending.discard(product_id)
+        while self._pages and not self._pages[0][1]:
+            cursor, _ = self._pages.popleft()
+            # Bulk export pages have no cursor to resume from
+            if cursor is not None:
+                self.checkpoint["cursor"] = cursor
+
+    async def flush(self, force: bool = False):
+        """Write progress and renew the lease; raises JobLeaseLost if another worker has the job."""
+        if not force and time.monotonic() - self._last_flush < self.checkpoint_seconds:
+            return
+        async with self._flush_lock:
+            products, self._unsaved = self._unsaved, {}
+            self._last_flush = time.monotonic()
+            held = await run_blocking(
+                self.store.checkpoint, self.job.id, self.worker, self.stage, self.counts, dict(self.checkpoint), products, self.lease_seconds
+            )
+        if not held:
+            raise JobLeaseLost(f"Sync job {self.job.id} is no longer held by {self.worker}")
+
+
+async def run_sync(job: SyncJob, progress: SyncProgress, indexer_factory: Callable[[Any], Any] | None = None) -> dict[str, int]:
+    """Sync one shop's catalogue into its indexes."""
+    from .indexer import ProductIndexer
+    from .tenants import shop_registry
+
+    logger.info(f"Starting sync for {job.shop} (job {job.id}, attempt {job.attempts})")
+    # The shop's credentials and index come from the shop store, falling back to env vars. Reloaded for every
+    # job: the token may have changed in /sync since this worker last cached the shop.
+    context = await shop_registry.update(job.shop)
+    client = context.client
+    if client is None or not context.config.access_token:
+        raise ValueError(f"No Admin API token stored for {job.shop}")
+    indexer = (indexer_factory or ProductIndexer)(client)
+
+    config = context.retrieval_config
+    index_endpoint_name = config.endpoint_id or ""
+    deployed_index_id = config.index_id or ""
+    if not config.is_local and (not index_endpoint_name or not deployed_index_id):
+        logger.warning("VERTEX_ENDPOINT_ID or VERTEX_INDEX_ID not set. Skipping vector upload.")
+        # We could still fetch products to verify Shopify connection
+        products = await client.fetch_all_products()
+        logger.info(f"Fetched {len(products)} products from Shopify (but skipped indexing).")
+        return {"fetched": len(products)}
+
+    return await indexer.ingest_products(index_endpoint_name, deployed_index_id, full_rebuild=job.full_rebuild, progress=progress)
+
+
+class SyncWorker:
+    """
+    Claims sync jobs from the store and runs them one at a time, renewing
+    the job's lease in the background while it runs. A failed job goes back
+    to the queue with its progress until SYNC_JOB_MAX_ATTEMPTS; stopping the
+    worker hands the current job back so another worker resumes it.
+    """
+
+    def __init__(self, store: JobStore | None = None, worker_id: str | None = None, lease_seconds: float = SYNC_JOB_LEASE_SECONDS,
+                 checkpoint_seconds: float = SYNC_CHECKPOINT_SECONDS, indexer_factory: Callable[[Any], Any] | None = None):
+        self.store = store or sync_jobs
+        self.worker_id = worker_id or f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        self.checkpoint_seconds = checkpoint_seconds
+        self.indexer_factory = indexer_factory
+
+    async def run(self, stop: asyncio.Event):
+        logger.info(f"Sync worker {self.worker_id} started")
+        while not stop.is_set():
+            job = await run_blocking(self.store.claim, self.worker_id, self.lease_seconds)
+            if job is None:
+                try:
+                    await asyncio.wait_for(stop.wait(), SYNC_POLL_SECONDS)
+                except TimeoutError:
+                    pass
+                continue
+            await self.process(job, stop)
+        logger.info(f"Sync worker {self.worker_id} stopped")
+
+    async def _heartbeat(self, progress: SyncProgress, task: asyncio.Task):
+        # Stages without page boundaries (bulk exports, saving) still renew the lease
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await progress.flush(force=True)
+            except JobLeaseLost as e:
+                logger.error(str(e))
+                task.cancel()
+                return
+            except Exception as e:
+                logger.warning(f"Checkpointing sync job {progress.job.id} failed: {e}", exc_info=True)
+
+    async def process(self, job: SyncJob, stop: asyncio.Event | None = None) -> str | None:
+        """Run a claimed job. Returns its status afterwards, or None if this worker no longer holds it."""
+        progress = SyncProgress(self.store, job, self.worker_id, self.checkpoint_seconds, self.lease_seconds)
+        await progress.load()
+        start_time = time.perf_counter()
+
+        async def traced_sync() -> dict[str, int]:
+            # One trace per attempt, with the indexer's stages, Shopify requests and embedding batches under it
+            with span("sync.job", shop=job.shop, job_id=job.id, attempt=job.attempts, full_rebuild=job.full_rebuild):
+                return await run_sync(job, progress, self.indexer_factory)
+
+        task = asyncio.create_task(traced_sync())
+        heartbeat = asyncio.create_task(self._heartbeat(progress, task))
+        stopping = asyncio.create_task(stop.wait()) if stop is not None else None
+        try:
+            await asyncio.wait([t for t in (task, stopping) if t is not None], return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            # Killed: the job stays leased to this worker until the lease runs out
+            task.cancel()
+            raise
+        finally:
+            heartbeat.cancel()
+            if stopping is not None:
+                stopping.cancel()
+
+        if not task.done():
+            # Shutting down: save what is done and let another worker resume the job
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            try:
+                await progress.flush(force=True)
+            except Exception as e:
+                logger.warning(f"Saving progress of sync job {job.id} failed: {e}", exc_info=True)
+            await run_blocking(self.store.release, job.id, self.worker_id)
+            logger.info(f"Released sync job {job.id} for {job.shop}")
+            return "queued"
+
+        try:
+            result = task.result()
+        except (JobLeaseLost, asyncio.CancelledError):
+            logger.error(f"Sync job {job.id} for {job.shop} was taken over by another worker, abandoning it")
+            return None
+        except Exception as e:
+            logger.exception(f"Sync job {job.id} for {job.shop} failed")
+            try:
+                await progress.flush(force=True)
+            except Exception as flush_error:
+                # The retry redoes the unsaved products, so this only costs time
+                logger.warning(f"Saving progress of failed sync job {job.id} failed: {flush_error}", exc_info=True)
+            status = await run_blocking(self.store.fail, job.id, self.worker_id, str(e))
+            if status == "queued":
+                logger.info(f"Sync job {job.id} queued for another attempt after a backoff")
+            return status
+
+        counts = {**progress.counts, **result}
+        if not await run_blocking(self.store.complete, job.id, self.worker_id, counts):
+            return None
+        logger.info(f"Sync job {job.id} for {job.shop} completed in {time.perf_counter() - start_time:.1f}s: {counts}")
+        return "succeeded"
+
+
+async def watch_finished_jobs(on_finished: Callable[[SyncJob], Any], store: JobStore | None = None, interval: float = 2.0):
+    """
+    Call `on_finished` for every job that succeeds from now on; runs in the
+    web app, whose in-process caches predate what the workers wrote.
+    """
+    store = store or sync_jobs
+    if store.unavailable_reason() is not None:
+        # No syncs run here (see start_workers)
+        return
+    since = time.time()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            for job in await run_blocking(store.finished_since, since):
+                since = max(since, job.finished_at or since)
+                await on_finished(job)
+        except Exception as e:
+            logger.warning(f"Checking for finished sync jobs failed: {e}", exc_info=True)
+
+
+async def _serve(worker_id: str):
+    install_default_executor()
+    configure_tracing()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await SyncWorker(worker_id=worker_id).run(stop)
+    finally:
+        await close_connections()
+        shutdown_executor()
+        shutdown_pool()
+        shutdown_tracing()
+
+
+def worker_main(worker_id: str):
+    """Entry point of one worker process."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(_serve(worker_id))
+
+
+def start_workers(count: int = SYNC_WORKERS) -> list[multiprocessing.process.BaseProcess]:
+    reason = sync_jobs.unavailable_reason()
+    if count and reason is not None:
+        logger.error(f"Not starting sync workers: {reason}")
+        return []
+    # spawn, not fork: the parent has an event loop and threads that must not be copied
+    context = multiprocessing.get_context("spawn")
+    processes: list[multiprocessing.process.BaseProcess] = []
+    for i in range(count):
+        process = context.Process(target=worker_main, args=(f"{os.getpid()}-{i}",), name=f"sync-worker-{i}", daemon=True)
+        process.start()
+        processes.append(process)
+    if processes:
+        logger.info(f"Started {len(processes)} sync worker process(es)")
+    return processes
+
+
+def stop_workers(processes: list[multiprocessing.process.BaseProcess], timeout: float = 30.0):
+    """Ask workers to hand back their jobs and exit, killing those that don't in time."""
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+
+# Shared by every request handled by this process
+sync_jobs = JobStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run sync job workers.")
+    parser.add_argument("--workers", type=int, default=max(1, SYNC_WORKERS))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    processes = start_workers(args.workers)
+    # Workers exit on SIGTERM/SIGINT (delivered to the whole process group on Ctrl+C)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop_workers(processes)
+
+
+if __name__ == "__main__":
+    main()
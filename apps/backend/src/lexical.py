@@ -0,0 +1,310 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, NamedTuple
+
+import numpy as np
+
+from .shopify_client import shop_file_name
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "/tmp/shop-agent-lexical")
+
+# Standard BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words joined by -, _, / or . stay together as well ("sku-12-0", "t-shirt")
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_/.][a-z0-9]+)*")
+_PART = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {"a", "an", "and", "the", "for", "of", "with", "in", "on", "to", "me", "some", "any", "show", "find", "from", "i", "want", "need"}
+
+
+def stem_token(token: str) -> str:
+    """Naive plural stripping: "dresses" -> "dress", "shoes" -> "shoe"."""
+    if len(token) > 4 and token.endswith(("ses", "xes", "shes", "ches")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased, stemmed terms; compound tokens such as SKUs also yield their parts."""
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            terms.append(token)
+        terms.extend(stem_token(part) for part in parts if part not in _STOPWORDS)
+    return terms
+
+
+def identifier_terms(text: str) -> list[str]:
+    """Tokens that look like SKUs or model numbers: compound, or mixing letters and digits."""
+    return [
+        token for token in _TOKEN.findall(text.lower())
+        if any(c.isdigit() for c in token) and (len(_PART.findall(token)) > 1 or any(c.isalpha() for c in token))
+    ]
+
+
+def normalize_label(label: str) -> str:
+    """Case- and plural-insensitive form of a category or vendor name."""
+    return " ".join(stem_token(part) for part in _PART.findall((label or "").lower()))
+
+
+def parse_price(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class SearchFilters(NamedTuple):
+    """Structured constraints applied before ranking."""
+    category: str | None = None
+    vendor: str | None = None
+    min_price: float | None = None
+    max_price: float | None = None
+    available_only: bool = False
+
+    @property
+    def is_empty(self) -> bool:
+        return self == SearchFilters()
+
+    def cache_key(self) -> str:
+        return " ".join(f"{name}={value}" for name, value in self._asdict().items() if value not in (None, False))
+
+    def matches(self, metadata: dict[str, Any]) -> bool:
+        """Check one product's metadata; fields missing from the metadata do not exclude it."""
+        if self.category and normalize_label(metadata.get("category", "")) != normalize_label(self.category):
+            return False
+        if self.vendor and normalize_label(metadata.get("vendor", "")) != normalize_label(self.vendor):
+            return False
+        if self.min_price is not None or self.max_price is not None:
+            price = parse_price(metadata.get("price"))
+            if math.isnan(price):
+                return False
+            if self.min_price is not None and price < self.min_price:
+                return False
+            if self.max_price is not None and price > self.max_price:
+                return False
+        return not (self.available_only and metadata.get("available") is False)
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over product text, with the filterable fields kept as
+    columns so a filter becomes a boolean mask applied to postings before scoring.
+
+    Postings are stored CSR-style: the documents containing term t are
+    `doc_ids[offsets[t]:offsets[t + 1]]`, with matching term frequencies in `tfs`.
+    """
+
+    def __init__(self, ids: list[str], metadatas: list[dict[str, Any]], terms: dict[str, int], arrays: dict[str, np.ndarray]):
+        self.ids = ids
+        self.rows = {product_id: row for row, product_id in enumerate(ids)}
+        self.metadatas = metadatas
+        self.terms = terms
+        self.offsets = arrays["offsets"]
+        self.doc_ids = arrays["doc_ids"]
+        self.tfs = arrays["tfs"]
+        self.doc_lengths = arrays["doc_lengths"]
+        self.categories = arrays["categories"]
+        self.vendors = arrays["vendors"]
+        self.prices = arrays["prices"]
+        self.available = arrays["available"]
+        self.category_labels = list(arrays["category_labels"])
+        self.vendor_labels = list(arrays["vendor_labels"])
+        self.average_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+        self._arrays = arrays
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, documents: dict[str, dict[str, Any]]) -> "LexicalIndex":
+        """`documents` maps product id -> {"text", "metadata"}."""
+        ids = sorted(documents)
+        metadatas = [documents[product_id]["metadata"] for product_id in ids]
+
+        postings: dict[str, list[tuple[int, int]]] = {}
+        doc_lengths = np.zeros(len(ids), dtype=np.float32)
+        for doc, product_id in enumerate(ids):
+            counts = Counter(tokenize(documents[product_id]["text"]))
+            doc_lengths[doc] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc, tf))
+
+        terms = {term: i for i, term in enumerate(sorted(postings))}
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for term, i in terms.items():
+            offsets[i + 1] = len(postings[term])
+        offsets = np.cumsum(offsets)
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.float32)
+        for term, i in terms.items():
+            entries = np.array(postings[term], dtype=np.int64)
+            doc_ids[offsets[i]:offsets[i + 1]] = entries[:, 0]
+            tfs[offsets[i]:offsets[i + 1]] = entries[:, 1]
+
+        category_labels = sorted({normalize_label(m.get("category", "")) for m in metadatas})
+        vendor_labels = sorted({normalize_label(m.get("vendor", "")) for m in metadatas})
+        category_codes = {label: i for i, label in enumerate(category_labels)}
+        vendor_codes = {label: i for i, label in enumerate(vendor_labels)}
+
+        arrays = {
+            "offsets": offsets,
+            "doc_ids": doc_ids,
+            "tfs": tfs,
+            "doc_lengths": doc_lengths,
+            "categories": np.array([category_codes[normalize_label(m.get("category", ""))] for m in metadatas], dtype=np.int32),
+            "vendors": np.array([vendor_codes[normalize_label(m.get("vendor", ""))] for m in metadatas], dtype=np.int32),
+            "prices": np.array([parse_price(m.get("price")) for m in metadatas], dtype=np.float64),
+            "available": np.array([m.get("available") is not False for m in metadatas], dtype=bool),
+            "category_labels": np.array(category_labels, dtype=str),
+            "vendor_labels": np.array(vendor_labels, dtype=str),
+        }
+        return cls(ids, metadatas, terms, arrays)
+
+    def mask(self, filters: SearchFilters) -> np.ndarray:
+        """Boolean mask of the documents that satisfy `filters`."""
+        mask = np.ones(len(self.ids), dtype=bool)
+        if filters.category:
+            label = normalize_label(filters.category)
+            mask &= self.categories == (self.category_labels.index(label) if label in self.category_labels else -1)
+        if filters.vendor:
+            label = normalize_label(filters.vendor)
+            mask &= self.vendors == (self.vendor_labels.index(label) if label in self.vendor_labels else -1)
+        # NaN prices compare False, so unpriced products drop out of price filters
+        if filters.min_price is not None:
+            mask &= self.prices >= filters.min_price
+        if filters.max_price is not None:
+            mask &= self.prices <= filters.max_price
+        if filters.available_only:
+            mask &= self.available
+        return mask
+
+    def search(self, query: str, k: int = 20, mask: np.ndarray | None = None) -> list[tuple[str, float]]:
+        """Top-k (product id, BM25 score), scoring only documents allowed by `mask`."""
+        if not self.ids:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            i = self.terms.get(term)
+            if i is None:
+                continue
+            docs = self.doc_ids[self.offsets[i]:self.offsets[i + 1]]
+            tfs = self.tfs[self.offsets[i]:self.offsets[i + 1]]
+            df = len(docs)
+            if mask is not None:
+                keep = mask[docs]
+                docs, tfs = docs[keep], tfs[keep]
+            idf = math.log(1 + (len(self.ids) - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docs] / self.average_length)
+            scores[docs] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return [(self.ids[doc], float(scores[doc])) for doc in hits]
+
+    def exact_matches(self, query: str, mask: np.ndarray | None = None, max_documents: int = 3) -> list[str]:
+        """Products containing an identifier from the query (e.g. a SKU) shared by at most `max_documents` products."""
+        matches: list[str] = []
+        for term in identifier_terms(query):
+            i = self.terms.get(term)
+            if i is None or self.offsets[i + 1] - self.offsets[i] > max_documents:
+                continue
+            for doc in self.doc_ids[self.offsets[i]:self.offsets[i + 1]]:
+                if (mask is None or mask[doc]) and self.ids[doc] not in matches:
+                    matches.append(self.ids[doc])
+        return matches
+
+    def save(self, path: str, documents: dict[str, dict[str, Any]]):
+        """Write the compiled index and its source documents to a single file, atomically."""
+        payload = json.dumps({"documents": documents, "terms": sorted(self.terms, key=self.terms.__getitem__)}).encode("utf-8")
+        tmp_path = f"{path}.tmp"
+        arrays: dict[str, Any] = {"payload": np.frombuffer(payload, dtype=np.uint8), **self._arrays}
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> tuple["LexicalIndex", dict[str, dict[str, Any]]]:
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files if name != "payload"}
+            payload = json.loads(data["payload"].tobytes())
+        documents = payload["documents"]
+        ids = sorted(documents)
+        index = cls(ids, [documents[product_id]["metadata"] for product_id in ids], {term: i for i, term in enumerate(payload["terms"])}, arrays)
+        return index, documents
+
+
+class LexicalIndexStore:
+    """
+    One lexical index file per shop on local disk, built at sync time and
+    loaded lazily by search. A file rewritten by another process is picked up
+    on the next lookup.
+    """
+
+    def __init__(self, directory: str = LEXICAL_INDEX_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._indexes: dict[str, tuple[int, LexicalIndex]] = {}
+
+    def _path(self, shop: str) -> str:
+        return os.path.join(self.directory, f"{shop_file_name(shop)}.npz")
+
+    def get(self, shop: str) -> LexicalIndex | None:
+        path = self._path(shop)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self._indexes.get(shop)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        with self._lock:
+            cached = self._indexes.get(shop)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            start_time = time.perf_counter()
+            index, _ = LexicalIndex.load(path)
+            self._indexes[shop] = (mtime, index)
+            logger.info(f"Loaded lexical index for {shop or 'default'} ({len(index)} products) in {time.perf_counter() - start_time:.3f}s")
+            return index
+
+    def evict(self, shop: str):
+        with self._lock:
+            self._indexes.pop(shop, None)
+
+    def load_documents(self, shop: str) -> dict[str, dict[str, Any]]:
+        """The documents the shop's index was built from, for incremental updates."""
+        path = self._path(shop)
+        if not os.path.exists(path):
+            return {}
+        return LexicalIndex.load(path)[1]
+
+    def save(self, shop: str, documents: dict[str, dict[str, Any]]) -> LexicalIndex:
+        start_time = time.perf_counter()
+        index = LexicalIndex.build(documents)
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(shop)
+        index.save(path, documents)
+        with self._lock:
+            self._indexes[shop] = (os.stat(path).st_mtime_ns, index)
+        logger.info(f"Built lexical index for {shop or 'default'} ({len(index)} products, {len(index.terms)} terms) in {time.perf_counter() - start_time:.2f}s")
+        return index
+
+
+# Shared by every request handled by this process
+lexical_indexes = LexicalIndexStore()
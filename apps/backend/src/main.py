@@ -1,13 +1,37 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from pydantic import BaseModel
-from typing import List, Dict, Any
-from .agent import app as agent_app
-from langchain_core.messages import HumanMessage
-from .shopify_client import ShopifyClient
-from .indexer import ProductIndexer
-import os
+import asyncio
+import importlib
 import logging
+import os
 import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any
+
+from fastapi import FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from langchain_core.messages import HumanMessage
+from pydantic import BaseModel
+
+from .concurrency import (
+    SingleFlight,
+    install_default_executor,
+    run_blocking,
+    shutdown_executor,
+)
+from .jobs import (
+    SYNC_WORKERS,
+    start_workers,
+    stop_workers,
+    sync_jobs,
+    watch_finished_jobs,
+)
+from .memory import open_checkpointer, session_lock, thread_config
+from .retrieval import retrieval
+from .shopify_client import InvalidShopDomain, close_connections, normalize_shop_domain
+from .streaming import stream_chat_events
+from .telemetry import configure_tracing, shutdown_tracing, span, stage_metrics
+from .tenants import shop_registry
 
 # Configure logging to stdout
 logging.basicConfig(
@@ -18,9 +42,81 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-from fastapi.middleware.cors import CORSMiddleware
+# Load the agent, model client and vector store in the background at startup, so the first
+# /chat doesn't pay for them. Off, everything is still built on first use.
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+
+# The agent module pulls in LangGraph and the Vertex AI clients, which take seconds to
+# import. It is loaded on first use (or by the warm-up), not with this module, so the
+# server starts answering, e.g. health checks, without waiting for it.
+_agent = None
+# Compiled agent graphs by (mode, with conversation memory); see agent.agent_mode
+agent_graphs: dict[tuple[str, bool], Any] = {}
+# Opened at startup; None when conversation memory is off
+conversation_checkpointer = None
 
-app = FastAPI()
+async def get_agent():
+    """The agent module, imported in the blocking pool on first use so the event loop keeps serving."""
+    global _agent
+    if _agent is None:
+        _agent = await run_blocking(importlib.import_module, ".agent", __package__)
+    return _agent
+
+def agent_graph(agent, mode: str, with_memory: bool):
+    """The agent graph for `mode`, compiled on first use."""
+    graph = agent_graphs.get((mode, with_memory))
+    if graph is None:
+        graph = agent.compile_agent(conversation_checkpointer if with_memory else None, mode)
+        agent_graphs[(mode, with_memory)] = graph
+    return graph
+
+async def warm_up():
+    start_time = time.perf_counter()
+    try:
+        agent = await get_agent()
+        for mode in agent.WORKFLOWS:
+            agent_graph(agent, mode, False)
+            if conversation_checkpointer is not None:
+                agent_graph(agent, mode, True)
+        await run_blocking(agent.get_llm)
+    except Exception as e:
+        logger.warning(f"Agent warm-up failed, will retry on first use: {e}", exc_info=True)
+    try:
+        await run_blocking(retrieval.warm)
+    except Exception as e:
+        logger.warning(f"Retrieval warm-up failed, will retry on first use: {e}", exc_info=True)
+    logger.info(f"Warm-up finished in {time.perf_counter() - start_time:.2f}s")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global conversation_checkpointer
+    # Any library falling back to run_in_executor(None, ...) shares our bounded pool
+    install_default_executor()
+    # Export spans if a collector or trace file is configured; /metrics works either way
+    configure_tracing()
+
+    # Load the warm pool of shops: configs, vector stores and lexical indexes
+    warm_shops = asyncio.create_task(shop_registry.warm())
+    # Catalogue syncs run in worker processes, off the request path
+    sync_workers = start_workers(SYNC_WORKERS)
+    # A finished sync leaves this process with a stale vector store and cached searches for the shop
+    synced_shops = asyncio.create_task(watch_finished_jobs(lambda job: shop_registry.refresh(job.shop)))
+    async with open_checkpointer() as checkpointer:
+        conversation_checkpointer = checkpointer
+        warmup = asyncio.create_task(warm_up()) if STARTUP_WARMUP else None
+        yield
+        if warmup is not None:
+            warmup.cancel()
+        agent_graphs.clear()
+        conversation_checkpointer = None
+    warm_shops.cancel()
+    synced_shops.cancel()
+    await asyncio.to_thread(stop_workers, sync_workers)
+    await close_connections()
+    shutdown_executor()
+    shutdown_tracing()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,49 +130,63 @@ class ChatRequest(BaseModel):
     message: str
     cart_id: str = ""
     shop_domain: str = ""
+    # Conversation to continue; defaults to the cart id. Without either, the request has no memory.
+    session_id: str = ""
 
 class SyncRequest(BaseModel):
     shop_url: str
     api_token: str
+    # Storefront API token used for cart operations; left unchanged when not given
+    storefront_token: str | None = None
+    full_rebuild: bool = False
 
-async def sync_products_task(shop_url: str, api_token: str):
-    logger.info(f"Starting sync for {shop_url}")
+def require_shop_domain(shop_url: str) -> str:
+    """The normalized shop domain, or a 400 for anything that is not a *.myshopify.com domain."""
     try:
-        client = ShopifyClient(shop_url=shop_url, access_token=api_token)
-        indexer = ProductIndexer(shopify_client=client)
-        
-        # Use env vars or defaults
-        index_endpoint_name = os.getenv("VERTEX_ENDPOINT_ID", "")
-        deployed_index_id = os.getenv("VERTEX_INDEX_ID", "")
-        
-        if not index_endpoint_name or not deployed_index_id:
-            logger.warning("VERTEX_ENDPOINT_ID or VERTEX_INDEX_ID not set. Skipping vector upload.")
-            # We could still fetch products to verify Shopify connection
-            products = await client.fetch_all_products()
-            logger.info(f"Fetched {len(products)} products from Shopify (but skipped indexing).")
-            return
-
-        await indexer.ingest_products(index_endpoint_name, deployed_index_id)
-        logger.info("Sync completed successfully.")
-    except Exception as e:
-        logger.error(f"Sync failed: {e}")
+        return normalize_shop_domain(shop_url)
+    except InvalidShopDomain as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def build_agent_inputs(request: ChatRequest) -> dict[str, Any]:
+    return {
+        "messages": [HumanMessage(content=request.message)],
+        "cart_id": request.cart_id,
+        "shop_domain": request.shop_domain,
+    }
+
+async def resolve_agent(request: ChatRequest) -> tuple[str, Any, dict[str, Any] | None]:
+    """The agent mode, graph and config to run: the checkpointed graph for requests that belong to a session."""
+    agent = await get_agent()
+    session_id = request.session_id or request.cart_id
+    mode = agent.agent_mode(session_id)
+    if conversation_checkpointer is None or not session_id:
+        return mode, agent_graph(agent, mode, False), None
+    return mode, agent_graph(agent, mode, True), thread_config(normalize_shop_domain(request.shop_domain), session_id)
 
 @app.post("/chat")
 async def chat_endpoint(request: ChatRequest):
     """
     Chat endpoint that invokes the LangGraph agent.
     """
-    inputs = {
-        "messages": [HumanMessage(content=request.message)],
-        "cart_id": request.cart_id,
-        "shop_domain": request.shop_domain,
-        "products_found": []
-    }
+    request.shop_domain = require_shop_domain(request.shop_domain)
+    inputs = build_agent_inputs(request)
+    start_time = time.perf_counter()
     
     try:
+        mode, graph, config = await resolve_agent(request)
         # Invoke the graph
         # We iterate to get the final state
-        final_state = agent_app.invoke(inputs)
+        with span("request.chat", mode=mode, shop=request.shop_domain or None):
+            if config is None:
+                final_state = await graph.ainvoke(inputs)
+            else:
+                # One turn at a time per conversation, so concurrent turns don't overwrite each other's checkpoints
+                async with session_lock(config):
+                    final_state = await graph.ainvoke(inputs, config=config)
+                    # Scheduled before the next turn can start, so it sees this turn's checkpoint
+                    (await get_agent()).summarizer.schedule(graph, config)
+        # Tagged by mode so the routed and single-call agents can be compared
+        logger.info(f"Chat turn ({mode} mode) took {time.perf_counter() - start_time:.3f}s")
         
         # Extract the last message content
         messages = final_state.get("messages", [])
@@ -84,18 +194,101 @@ async def chat_endpoint(request: ChatRequest):
             return {"response": "I'm sorry, I didn't get that."}
             
         last_message = messages[-1]
-        return {"response": last_message.content}
+        # The cart created on this turn, for the client to send back as cart_id
+        return {"response": last_message.content, "cart_id": final_state.get("cart_id") or request.cart_id}
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Streaming chat endpoint. Sends node transitions, tool results and model
+    tokens as Server-Sent Events while the agent runs.
+    """
+    request.shop_domain = require_shop_domain(request.shop_domain)
+    try:
+        mode, graph, config = await resolve_agent(request)
+    except Exception as e:
+        logger.exception("Loading the agent failed")
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+    async def events():
+        with span("request.chat_stream", mode=mode, shop=request.shop_domain or None):
+            if config is None:
+                async for event in stream_chat_events(graph, build_agent_inputs(request)):
+                    yield event
+                return
+            async with session_lock(config):
+                async for event in stream_chat_events(graph, build_agent_inputs(request), config=config):
+                    yield event
+                (await get_agent()).summarizer.schedule(graph, config)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def require_job_store():
+    """503 where queued syncs would be lost, before the shop's credentials are stored for one."""
+    reason = sync_jobs.unavailable_reason()
+    if reason is not None:
+        raise HTTPException(status_code=503, detail=reason)
+
+# Sync requests being queued, keyed by shop and kind of sync; tokens are secrets and stay out of the key
+sync_flights = SingleFlight("sync")
+
+async def queue_sync(request: SyncRequest):
+    # Remember the shop's credentials; the worker reads them from the registry, carts use the storefront token
+    credentials = {"access_token": request.api_token}
+    if request.storefront_token:
+        credentials["storefront_token"] = request.storefront_token
+    await shop_registry.update(request.shop_url, **credentials)
+    return await run_blocking(sync_jobs.enqueue, request.shop_url, request.full_rebuild)
+
+@app.post("/sync", status_code=202)
+async def sync_endpoint(request: SyncRequest):
+    """
+    Queue a product sync, run by a sync worker process. A shop has at most one
+    sync queued or running; asking again returns that job. Identical requests
+    arriving together share one registry update and enqueue.
+    """
+    request.shop_url = require_shop_domain(request.shop_url)
+    if not request.shop_url:
+        raise HTTPException(status_code=400, detail="shop_url is required")
+    require_job_store()
+    # Requests for the same shop arriving together store the first one's credentials
+    (job, created), coalesced = await sync_flights.do((request.shop_url, request.full_rebuild), queue_sync, request)
+    # Only the request that queued the job reports it as new
+    created = created and not coalesced
+    if created:
+        logger.info(f"Queued sync job {job.id} for {job.shop}")
+    return {
+        "status": "accepted" if created else "already_queued",
+        "job_id": job.id,
+        "message": "Sync queued" if created else f"A sync of this shop is already {job.status}",
+    }
+
+@app.get("/sync/{job_id}")
+async def sync_status_endpoint(job_id: str):
+    """
+    Status of a sync job: stage, product counts and throughput so far.
+    """
+    require_job_store()
+    job = await run_blocking(sync_jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown sync job")
+    return job.to_dict()
 
-@app.post("/sync")
-async def sync_endpoint(request: SyncRequest, background_tasks: BackgroundTasks):
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
     """
-    Trigger product synchronization in the background.
+    Prometheus metrics: p50/p95/p99 latency per stage (request, graph node,
+    model call, tool, Shopify operation, embedding, vector search) and
+    tokens per model call, for this process.
     """
-    background_tasks.add_task(sync_products_task, request.shop_url, request.api_token)
-    return {"status": "accepted", "message": "Sync started in background"}
+    return PlainTextResponse(stage_metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 def read_root():
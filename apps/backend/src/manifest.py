@@ -0,0 +1,112 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Any
+
+from .shopify_client import shop_file_name
+
+logger = logging.getLogger(__name__)
+
+SYNC_MANIFEST_BACKEND = os.getenv("SYNC_MANIFEST_BACKEND", "local")
+SYNC_MANIFEST_DIR = os.getenv("SYNC_MANIFEST_DIR", "/tmp/shop-agent-manifests")
+
+# Firestore documents are capped at 1 MiB, so large manifests are split
+FIRESTORE_CHUNK_SIZE = 5000
+
+
+def content_hash(context: str, metadata: dict[str, Any]) -> str:
+    """Stable hash of everything we write to the index for one product."""
+    payload = context + "\n" + json.dumps(metadata, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SyncManifest:
+    """
+    What the index currently holds for one shop: product id -> {"hash", "category"},
+    plus the time the last successful sync started.
+    """
+
+    def __init__(self, products: dict[str, dict[str, str]] | None = None, last_synced_at: str | None = None):
+        self.products = products or {}
+        self.last_synced_at = last_synced_at
+
+    def categories(self):
+        return {entry["category"] for entry in self.products.values() if entry.get("category")}
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"products": self.products, "last_synced_at": self.last_synced_at}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "SyncManifest":
+        return cls(products=data.get("products", {}), last_synced_at=data.get("last_synced_at"))
+
+
+class LocalManifestStore:
+    """Keeps one JSON manifest file per shop on local disk."""
+
+    def __init__(self, directory: str = SYNC_MANIFEST_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, shop: str) -> str:
+        return os.path.join(self.directory, f"{shop_file_name(shop)}.json")
+
+    def load(self, shop: str) -> SyncManifest:
+        path = self._path(shop)
+        if not os.path.exists(path):
+            return SyncManifest()
+        with open(path) as f:
+            return SyncManifest.from_dict(json.load(f))
+
+    def save(self, shop: str, manifest: SyncManifest):
+        path = self._path(shop)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest.to_dict(), f)
+        os.replace(tmp_path, path)
+
+
+class FirestoreManifestStore:
+    """
+    Keeps manifests in Firestore under sync_manifests/{shop}, with the product
+    hashes split across a `chunks` subcollection.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def _doc(self, shop: str):
+        return self.db.collection("sync_manifests").document(shop_file_name(shop))
+
+    def load(self, shop: str) -> SyncManifest:
+        doc = self._doc(shop)
+        snapshot = doc.get()
+        if not snapshot.exists:
+            return SyncManifest()
+        products: dict[str, dict[str, str]] = {}
+        for chunk in doc.collection("chunks").stream():
+            products.update(chunk.to_dict().get("products", {}))
+        return SyncManifest(products=products, last_synced_at=snapshot.to_dict().get("last_synced_at"))
+
+    def save(self, shop: str, manifest: SyncManifest):
+        doc = self._doc(shop)
+        items = sorted(manifest.products.items())
+        chunk_count = 0
+        for i in range(0, len(items), FIRESTORE_CHUNK_SIZE):
+            doc.collection("chunks").document(str(chunk_count)).set({"products": dict(items[i:i + FIRESTORE_CHUNK_SIZE])})
+            chunk_count += 1
+        # Remove chunks left over from a previously larger catalogue
+        for chunk in doc.collection("chunks").stream():
+            if int(chunk.id) >= chunk_count:
+                chunk.reference.delete()
+        doc.set({"last_synced_at": manifest.last_synced_at, "product_count": len(items), "chunk_count": chunk_count})
+
+
+def create_manifest_store(db=None):
+    if SYNC_MANIFEST_BACKEND == "firestore":
+        if db is None:
+            from google.cloud import firestore
+            db = firestore.Client()
+        return FirestoreManifestStore(db)
+    return LocalManifestStore()
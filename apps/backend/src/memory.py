@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Mapping, Sequence
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+)
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+
+from .telemetry import record_llm_tokens, span
+
+logger = logging.getLogger(__name__)
+
+# memory (per process), sqlite (survives restarts), or none (every request starts fresh)
+CHAT_MEMORY_BACKEND = os.getenv("CHAT_MEMORY_BACKEND", "memory")
+CHAT_MEMORY_SQLITE_PATH = os.getenv("CHAT_MEMORY_SQLITE_PATH", "/tmp/shop-agent-memory.sqlite")
+# The most recent messages sent with each prompt, also capped by an estimated token budget
+MEMORY_WINDOW_MESSAGES = int(os.getenv("MEMORY_WINDOW_MESSAGES", "8"))
+MEMORY_WINDOW_TOKENS = int(os.getenv("MEMORY_WINDOW_TOKENS", "2000"))
+# Messages that fell out of the window are folded into the summary once this many have piled up
+MEMORY_SUMMARY_BATCH = int(os.getenv("MEMORY_SUMMARY_BATCH", "6"))
+
+SUMMARY_PROMPT = """
+    You maintain a running summary of a conversation between a shopper and a store's shopping assistant.
+    Update the summary with the new messages below. Keep what the shopper is looking for, their
+    preferences and budget, products they were shown or added to the cart, and open questions.
+    Reply with the updated summary only, in at most 150 words.
+    """
+
+
+def estimate_tokens(message: BaseMessage) -> int:
+    """Rough token count (~4 characters per token, plus per-message overhead)."""
+    return len(str(message.content)) // 4 + 4
+
+
+def usage_tokens(prompt: Sequence[BaseMessage], response: BaseMessage) -> tuple[int, int]:
+    """(input, output) tokens of a model call: as reported by the model when available, else estimated."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    return (
+        usage.get("input_tokens") or sum(estimate_tokens(message) for message in prompt),
+        usage.get("output_tokens") or estimate_tokens(response),
+    )
+
+
+def is_tool_request(message: BaseMessage) -> bool:
+    # Tool results are summed up by the plain AIMessage that follows, so calls and raw results are not replayed
+    return (isinstance(message, AIMessage) and bool(message.tool_calls)) or isinstance(message, ToolMessage)
+
+
+def prompt_window(state: Mapping[str, Any], max_messages: int = MEMORY_WINDOW_MESSAGES, max_tokens: int = MEMORY_WINDOW_TOKENS) -> list[BaseMessage]:
+    """
+    The messages to send to the model: the running summary, if any, then
+    the newest messages that fit in `max_messages` and `max_tokens`. The
+    latest message is always included.
+    """
+    window: list[BaseMessage] = []
+    tokens = 0
+    for message in reversed(state["messages"]):
+        if is_tool_request(message):
+            continue
+        tokens += estimate_tokens(message)
+        if window and (len(window) >= max_messages or tokens > max_tokens):
+            break
+        window.append(message)
+    window.reverse()
+    # Models expect the conversation to open with the shopper
+    while len(window) > 1 and not isinstance(window[0], HumanMessage):
+        window.pop(0)
+
+    summary = state.get("summary")
+    if summary:
+        return [SystemMessage(content=f"Summary of the conversation so far: {summary}")] + window
+    return window
+
+
+def thread_config(shop: str, session_id: str) -> dict[str, Any]:
+    """Checkpointer config for one conversation; sessions are scoped to their shop."""
+    return {"configurable": {"thread_id": f"{shop or 'default'}:{session_id}"}}
+
+
+_session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def session_lock(config: dict[str, Any]) -> asyncio.Lock:
+    """
+    Serializes writes to one conversation within this process. A checkpoint
+    written while a turn is running would be superseded by the turn's own
+    checkpoint, so turns hold the lock while they run and the summarizer
+    holds it only to apply its update.
+    """
+    thread_id = config["configurable"]["thread_id"]
+    lock = _session_locks.get(thread_id)
+    if lock is None:
+        lock = _session_locks[thread_id] = asyncio.Lock()
+    return lock
+
+
+@asynccontextmanager
+async def open_checkpointer(backend: str = CHAT_MEMORY_BACKEND, path: str = CHAT_MEMORY_SQLITE_PATH) -> AsyncIterator[Any | None]:
+    """The LangGraph checkpointer conversations are stored in, or None when memory is off."""
+    if backend == "sqlite":
+        # Optional dependency: langgraph-checkpoint-sqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        async with AsyncSqliteSaver.from_conn_string(path) as checkpointer:
+            await checkpointer.setup()
+            logger.info(f"Conversation memory in SQLite at {path}")
+            yield checkpointer
+    elif backend == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+        yield InMemorySaver()
+    else:
+        yield None
+
+
+class MemoryMetrics:
+    """Prompt size per turn (reported by the model when available, else estimated) and summarization counters."""
+
+    def __init__(self, recent: int = 1000):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.prompt_tokens_total = 0
+        self.prompt_tokens_recent: deque = deque(maxlen=recent)
+        self.summaries = 0
+        self.summary_failures = 0
+        self.summarized_messages = 0
+        self.summary_seconds = 0.0
+
+    def record_prompt(self, prompt: Sequence[BaseMessage], response: BaseMessage | None = None) -> int:
+        usage = getattr(response, "usage_metadata", None) or {}
+        tokens = usage.get("input_tokens") or sum(estimate_tokens(message) for message in prompt)
+        with self._lock:
+            self.turns += 1
+            self.prompt_tokens_total += tokens
+            self.prompt_tokens_recent.append(tokens)
+        return tokens
+
+    def record_summary(self, messages: int, seconds: float, ok: bool = True):
+        with self._lock:
+            if ok:
+                self.summaries += 1
+                self.summarized_messages += messages
+            else:
+                self.summary_failures += 1
+            self.summary_seconds += seconds
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            recent = sorted(self.prompt_tokens_recent)
+            return {
+                "turns": self.turns,
+                "prompt_tokens_mean": self.prompt_tokens_total / self.turns if self.turns else 0.0,
+                "prompt_tokens_p95": recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0,
+                "prompt_tokens_max": recent[-1] if recent else 0,
+                "summaries": self.summaries,
+                "summary_failures": self.summary_failures,
+                "summarized_messages": self.summarized_messages,
+                "summary_seconds": self.summary_seconds,
+            }
+
+
+class ConversationSummarizer:
+    """
+    Folds messages that have left the prompt window into the conversation's
+    running summary and removes them from the checkpoint, so stored history
+    stays bounded too. Runs as a background task after the reply has been
+    sent; at most one summary per conversation runs at a time.
+    """
+
+    def __init__(self, get_llm: Callable[[], Any], window: int = MEMORY_WINDOW_MESSAGES, batch: int = MEMORY_SUMMARY_BATCH, metrics: MemoryMetrics | None = None):
+        self.get_llm = get_llm
+        self.window = window
+        self.batch = batch
+        self.metrics = metrics or memory_metrics
+        self._running: dict[str, asyncio.Task] = {}
+
+    def schedule(self, graph, config: dict[str, Any]) -> asyncio.Task | None:
+        thread_id = config["configurable"]["thread_id"]
+        if thread_id in self._running:
+            return None
+        task = asyncio.create_task(self.summarize(graph, config))
+        self._running[thread_id] = task
+        task.add_done_callback(lambda _: self._running.pop(thread_id, None))
+        return task
+
+    async def summarize(self, graph, config: dict[str, Any]) -> bool:
+        """Summarize the conversation if enough messages have left the window. Returns whether it did."""
+        snapshot = await graph.aget_state(config)
+        messages = snapshot.values.get("messages", [])
+        old = messages[:-self.window] if len(messages) > self.window else []
+        if len(old) < self.batch:
+            return False
+
+        start_time = time.perf_counter()
+        try:
+            transcript = "\n".join(
+                f"{'Shopper' if isinstance(message, HumanMessage) else 'Assistant'}: {message.content}"
+                for message in old if not is_tool_request(message) and message.content
+            )
+            summary = snapshot.values.get("summary") or "(none yet)"
+            prompt = [
+                SystemMessage(content=SUMMARY_PROMPT),
+                HumanMessage(content=f"Current summary: {summary}\n\nNew messages:\n{transcript}"),
+            ]
+            with span("llm.summarizer", node="summarizer") as llm_span:
+                response = await self.get_llm().ainvoke(prompt)
+                record_llm_tokens(llm_span, "summarizer", *usage_tokens(prompt, response))
+            async with session_lock(config):
+                # A turn may have finished meanwhile; only apply the summary to the history it was built from
+                current = await graph.aget_state(config)
+                if current.values.get("summary") != snapshot.values.get("summary") or \
+                        {message.id for message in old} - {message.id for message in current.values.get("messages", [])}:
+                    logger.info(f"History of {config['configurable']['thread_id']} changed while summarizing, skipping")
+                    return False
+                await graph.aupdate_state(config, {
+                    "summary": str(response.content).strip(),
+                    "messages": [RemoveMessage(id=message.id) for message in old],
+                })
+        except Exception as e:
+            logger.warning(f"Summarizing {config['configurable']['thread_id']} failed: {e}", exc_info=True)
+            self.metrics.record_summary(len(old), time.perf_counter() - start_time, ok=False)
+            return False
+
+        self.metrics.record_summary(len(old), time.perf_counter() - start_time)
+        logger.info(f"Summarized {len(old)} messages of {config['configurable']['thread_id']} in {time.perf_counter() - start_time:.2f}s")
+        return True
+
+
+# Shared by every request handled by this process
+memory_metrics = MemoryMetrics()
@@ -0,0 +1,173 @@
+import asyncio
+import html
+import logging
+import multiprocessing
+import os
+import re
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+from .catalogue import CatalogueRecord, VariantRecord
+from .concurrency import run_blocking
+from .lexical import parse_price
+
+logger = logging.getLogger(__name__)
+
+# Descriptions are cut to about this many tokens (~4 characters each) before embedding
+DESCRIPTION_TOKEN_BUDGET = int(os.getenv("DESCRIPTION_TOKEN_BUDGET", "512"))
+# Worker processes that normalize pages of products during a sync; 0 normalizes them in the blocking thread pool
+NORMALIZE_PROCESSES = int(os.getenv("NORMALIZE_PROCESSES", "0"))
+# Smaller pages stay in this process even with NORMALIZE_PROCESSES set: pickling them costs more than it saves
+NORMALIZE_POOL_MIN_BATCH = int(os.getenv("NORMALIZE_POOL_MIN_BATCH", "200"))
+
+CHARS_PER_TOKEN = 4
+
+# Elements whose content is never product copy: scripts (review widgets, JSON-LD), styles, comments
+_HIDDEN = re.compile(r"<(script|style|noscript|template|iframe|svg)\b[^>]*>.*?</\1\s*>|<!--.*?-->", re.IGNORECASE | re.DOTALL)
+_TAG = re.compile(r"<[^>]*>")
+# Zero-width characters the storefront editor leaves behind; str.split() does not treat them as whitespace
+_ZERO_WIDTH = ("\u200b", "\ufeff")
+
+
+def html_to_text(raw_html: str | None) -> str:
+    """
+    Visible text of an HTML fragment: hidden elements dropped, every tag
+    replaced by a word break (so "<li>Cotton</li><li>Linen</li>" does not
+    read "CottonLinen"), entities decoded and whitespace collapsed to
+    single spaces.
+    """
+    if not raw_html:
+        return ""
+    text = raw_html
+    if "<" in text:
+        text = _TAG.sub(" ", _HIDDEN.sub(" ", text))
+    if "&" in text:
+        # &nbsp; is by far the most common entity; replacing it first leaves html.unescape little to do
+        text = html.unescape(text.replace("&nbsp;", " "))
+    for char in _ZERO_WIDTH:
+        if char in text:
+            text = text.replace(char, "")
+    return " ".join(text.split())
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    """Cut `text` to about `budget` tokens, at a word boundary."""
+    limit = budget * CHARS_PER_TOKEN
+    if budget <= 0 or len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit + 1)
+    return text[:cut if cut > 0 else limit].rstrip(" ,;:-") + "…"
+
+
+class PreparedProduct:
+    """Everything a sync derives from one Shopify product, parsed in one pass."""
+
+    __slots__ = ("category", "context", "document", "id", "metadata", "record")
+
+    def __init__(self, id: str, category: str, context: str, metadata: dict[str, Any], document: dict[str, Any], record: CatalogueRecord):
+        self.id = id
+        # productType, stripped, for the shop's category list
+        self.category = category
+        # Text that is embedded
+        self.context = context
+        # Stored with the product's vector
+        self.metadata = metadata
+        # Text and filter fields for the lexical index
+        self.document = document
+        # Entry in the catalogue snapshot used to render answers
+        self.record = record
+
+
+def prepare_product(product: dict[str, Any], description_budget: int = DESCRIPTION_TOKEN_BUDGET) -> PreparedProduct:
+    product_id = product.get("id", "")
+    title = product.get("title") or ""
+    product_type = product.get("productType") or ""
+    vendor = product.get("vendor") or ""
+    variants = [edge["node"] for edge in (product.get("variants") or {}).get("edges", [])]
+    images = (product.get("images") or {}).get("edges", [])
+    image_url = images[0]["node"].get("url", "") if images else ""
+
+    # Price of the first variant, as shown in the context and metadata
+    price = variants[0].get("price", "N/A") if variants else "N/A"
+    description = truncate_tokens(html_to_text(product.get("descriptionHtml")), description_budget)
+    tags = ", ".join(product.get("tags") or [])
+    # Category first, for category prominence in the embedding
+    context = f"Category: {product_type}\nTitle: {title}\nDescription: {description}\nTags: {tags}\nVendor: {vendor}\nPrice: {price}"
+
+    metadata = {
+        "id": product_id,
+        "title": product.get("title"),
+        "handle": product.get("handle"),
+        "category": product_type,  # For filtering
+        "product_type": product_type,
+        "vendor": vendor,
+        "price": price,
+        "image_url": image_url,
+    }
+
+    skus = []
+    variant_records = []
+    for node in variants:
+        sku = node.get("sku") or ""
+        if sku:
+            skus.append(sku)
+        variant_records.append(VariantRecord(node.get("id", ""), node.get("title", ""), parse_price(node.get("price")), sku, node.get("availableForSale", True)))
+    available = any(variant.available for variant in variant_records) if variant_records else True
+    document = {"text": context + ("\nSKU: " + ", ".join(skus) if skus else ""), "metadata": {**metadata, "available": available}}
+
+    min_price = (product.get("priceRangeV2") or {}).get("minVariantPrice", {})
+    record = CatalogueRecord(
+        product_id,
+        handle=product.get("handle") or "",
+        title=title,
+        price=parse_price(min_price.get("amount", price)),
+        currency=min_price.get("currencyCode", ""),
+        inventory=product.get("totalInventory") or 0,
+        available=available,
+        image_url=image_url,
+        variants=variant_records,
+    )
+    return PreparedProduct(product_id, product_type.strip(), context, metadata, document, record)
+
+
+def prepare_products(products: Sequence[dict[str, Any]], description_budget: int = DESCRIPTION_TOKEN_BUDGET) -> list[PreparedProduct]:
+    return [prepare_product(product, description_budget) for product in products]
+
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def get_pool(processes: int = NORMALIZE_PROCESSES) -> ProcessPoolExecutor:
+    """The process-wide normalization pool, started on first use."""
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the parent has an event loop and threads that must not be copied
+        _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+        logger.info(f"Normalization pool started with {processes} processes")
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def prepare_page(products: Sequence[dict[str, Any]], processes: int = NORMALIZE_PROCESSES) -> list[PreparedProduct]:
+    """
+    Prepare a page of products off the event loop: in the normalization
+    pool when `processes` is set and the page is large enough, else in the
+    blocking thread pool.
+    """
+    if processes > 0 and len(products) >= NORMALIZE_POOL_MIN_BATCH:
+        # One task per process, so every process gets a share of the page
+        size = -(-len(products) // processes)
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*(
+            loop.run_in_executor(get_pool(processes), prepare_products, products[start:start + size])
+            for start in range(0, len(products), size)
+        ))
+        return [prepared for chunk in chunks for prepared in chunk]
+    return await run_blocking(prepare_products, products)
@@ -0,0 +1,310 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections.abc import AsyncIterable, Callable, Iterable
+from typing import (
+    Any,
+    NamedTuple,
+)
+
+from google.api_core import exceptions as google_exceptions
+
+from .concurrency import run_blocking
+from .telemetry import span
+
+logger = logging.getLogger(__name__)
+
+# text-embedding-004 allows up to 250 instances and 20K tokens per request. Larger
+# requests took long enough to time out, so batches stay at 20 instances by default.
+EMBED_MAX_INSTANCES = int(os.getenv("EMBED_MAX_INSTANCES", "20"))
+EMBED_MAX_TOKENS = int(os.getenv("EMBED_MAX_TOKENS", "20000"))
+# The model truncates each input at 2048 tokens, so longer texts cost no more
+EMBED_MAX_TOKENS_PER_TEXT = 2048
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", "4"))
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+
+_QUEUE_DEPTH = 4
+_DONE = None
+
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+)
+
+
+class ProductRecord(NamedTuple):
+    id: str
+    text: str
+    metadata: dict[str, Any]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for request sizing."""
+    return min(len(text) // 4 + 1, EMBED_MAX_TOKENS_PER_TEXT)
+
+
+def is_quota_error(error: Exception) -> bool:
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "rate limit" in message
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Throttling, or a write that failed in a way worth repeating; upserts by id are safe to repeat."""
+    return is_quota_error(error) or isinstance(error, (google_exceptions.InternalServerError, google_exceptions.Aborted, ConnectionError, TimeoutError))
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter, capped at a minute."""
+    return min(60.0, 2 ** attempt) * (0.5 + random.random())
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.retries = 0
+
+    def to_dict(self, wall_seconds: float) -> dict[str, Any]:
+        return {
+            "items": self.items,
+            "batches": self.batches,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "retries": self.retries,
+            "items_per_second": round(self.items / wall_seconds, 1) if wall_seconds else 0.0,
+        }
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that halves when the backend reports throttling and
+    creeps back up by one after a run of successes (AIMD).
+    """
+
+    def __init__(self, limit: int):
+        self.max_limit = limit
+        self.limit = limit
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, throttled: bool = False):
+        async with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self._successes = 0
+                if self.limit > 1:
+                    self.limit = max(1, self.limit // 2)
+                    logger.warning(f"Embedding throttled, reducing concurrency to {self.limit}")
+            else:
+                self._successes += 1
+                if self.limit < self.max_limit and self._successes >= self.limit * 2:
+                    self._successes = 0
+                    self.limit += 1
+            self._condition.notify_all()
+
+
+class EmbeddingPipeline:
+    """
+    Streaming ingest: records -> token-aware batches -> parallel embedding ->
+    parallel upsert, connected by bounded queues so memory stays flat and a
+    slow stage applies backpressure to the ones before it.
+
+    `embedder` needs `embed_documents(texts)`; `vector_store` needs
+    `add_texts_with_embeddings(texts, embeddings, metadatas, ids)`. Both are
+    synchronous clients and run in the bounded blocking pool. `on_upserted`,
+    if given, is called with each chunk of records once it is written.
+    """
+
+    def __init__(
+        self,
+        embedder,
+        vector_store,
+        max_instances: int = EMBED_MAX_INSTANCES,
+        max_tokens: int = EMBED_MAX_TOKENS,
+        embed_concurrency: int = EMBED_CONCURRENCY,
+        upsert_concurrency: int = UPSERT_CONCURRENCY,
+        upsert_batch_size: int = UPSERT_BATCH_SIZE,
+        max_retries: int = MAX_RETRIES,
+        on_upserted: Callable[[list[ProductRecord]], None] | None = None,
+    ):
+        self.embedder = embedder
+        self.vector_store = vector_store
+        self.max_instances = max_instances
+        self.max_tokens = max_tokens
+        self.embed_concurrency = embed_concurrency
+        self.upsert_concurrency = upsert_concurrency
+        self.upsert_batch_size = upsert_batch_size
+        self.max_retries = max_retries
+        self.on_upserted = on_upserted
+        self.stats = {name: StageStats(name) for name in ("prepare", "embed", "upsert")}
+
+    async def run(self, records: Iterable[ProductRecord] | AsyncIterable[ProductRecord]) -> dict[str, Any]:
+        start_time = time.perf_counter()
+        embed_queue: asyncio.Queue = asyncio.Queue(maxsize=_QUEUE_DEPTH * self.embed_concurrency)
+        upsert_queue: asyncio.Queue = asyncio.Queue(maxsize=_QUEUE_DEPTH * self.upsert_concurrency)
+        limiter = AdaptiveLimiter(self.embed_concurrency)
+
+        embedders = [asyncio.create_task(self._embed_worker(embed_queue, upsert_queue, limiter)) for _ in range(self.embed_concurrency)]
+        upserters = [asyncio.create_task(self._upsert_worker(upsert_queue)) for _ in range(self.upsert_concurrency)]
+
+        async def drive():
+            await self._batch(records, embed_queue)
+            for _ in embedders:
+                await embed_queue.put(_DONE)
+            await asyncio.gather(*embedders)
+            for _ in upserters:
+                await upsert_queue.put(_DONE)
+            await asyncio.gather(*upserters)
+
+        # A failing worker stops draining its queue, so watch every task and
+        # abort the whole run on the first error instead of blocking on a full queue.
+        tasks = [asyncio.create_task(drive())] + embedders + upserters
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                error = task.exception()
+                if error is not None:
+                    raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        wall_seconds = time.perf_counter() - start_time
+        summary: dict[str, Any] = {name: stage.to_dict(wall_seconds) for name, stage in self.stats.items()}
+        summary["wall_seconds"] = round(wall_seconds, 3)
+        logger.info(f"Embedding pipeline finished in {wall_seconds:.2f}s: " + ", ".join(
+            f"{name} {stage['items']} items ({stage['items_per_second']}/s)" for name, stage in summary.items() if isinstance(stage, dict)
+        ))
+        return summary
+
+    async def _batch(self, records, embed_queue: asyncio.Queue):
+        """Group records into requests that fit the model's instance and token limits."""
+        stats = self.stats["prepare"]
+        batch: list[ProductRecord] = []
+        batch_tokens = 0
+
+        async for record in _aiter(records):
+            tokens = estimate_tokens(record.text)
+            if batch and (len(batch) >= self.max_instances or batch_tokens + tokens > self.max_tokens):
+                await embed_queue.put(batch)
+                stats.batches += 1
+                batch, batch_tokens = [], 0
+            batch.append(record)
+            batch_tokens += tokens
+            stats.items += 1
+
+        if batch:
+            await embed_queue.put(batch)
+            stats.batches += 1
+
+    async def _embed_worker(self, embed_queue: asyncio.Queue, upsert_queue: asyncio.Queue, limiter: AdaptiveLimiter):
+        stats = self.stats["embed"]
+        pending: list = []
+        while True:
+            batch = await embed_queue.get()
+            if batch is _DONE:
+                break
+
+            embeddings = await self._embed_with_backoff(batch, limiter)
+            stats.items += len(batch)
+            stats.batches += 1
+
+            # Re-chunk for the vector store, which prefers larger writes
+            pending.extend(zip(batch, embeddings))
+            while len(pending) >= self.upsert_batch_size:
+                await upsert_queue.put(pending[:self.upsert_batch_size])
+                pending = pending[self.upsert_batch_size:]
+
+        if pending:
+            await upsert_queue.put(pending)
+
+    async def _embed_with_backoff(self, batch: list[ProductRecord], limiter: AdaptiveLimiter) -> list[list[float]]:
+        stats = self.stats["embed"]
+        texts = [record.text for record in batch]
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            start_time = time.perf_counter()
+            try:
+                with span("embed.documents", products=len(batch), attempt=attempt + 1):
+                    embeddings = await run_blocking(self.embedder.embed_documents, texts)
+            except Exception as e:
+                stats.busy_seconds += time.perf_counter() - start_time
+                throttled = is_quota_error(e)
+                await limiter.release(throttled=throttled)
+                if not throttled or attempt == self.max_retries:
+                    logger.error(f"Error embedding batch of {len(batch)} products: {e}")
+                    raise
+                stats.retries += 1
+                delay = backoff_delay(attempt)
+                logger.warning(f"Embedding quota hit, retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+                continue
+
+            stats.busy_seconds += time.perf_counter() - start_time
+            await limiter.release()
+            return embeddings
+        raise RuntimeError("unreachable")
+
+    async def _upsert_worker(self, upsert_queue: asyncio.Queue):
+        stats = self.stats["upsert"]
+        while True:
+            chunk = await upsert_queue.get()
+            if chunk is _DONE:
+                break
+
+            records = [record for record, _ in chunk]
+            await self._upsert_with_backoff(chunk, records)
+            stats.items += len(records)
+            stats.batches += 1
+            if self.on_upserted is not None:
+                self.on_upserted(records)
+
+    async def _upsert_with_backoff(self, chunk: list, records: list[ProductRecord]):
+        stats = self.stats["upsert"]
+        for attempt in range(self.max_retries + 1):
+            start_time = time.perf_counter()
+            try:
+                with span("vector.upsert", products=len(records), attempt=attempt + 1):
+                    await run_blocking(
+                        self.vector_store.add_texts_with_embeddings,
+                        texts=[record.text for record in records],
+                        embeddings=[embedding for _, embedding in chunk],
+                        metadatas=[record.metadata for record in records],
+                        ids=[record.id for record in records],
+                    )
+            except Exception as e:
+                stats.busy_seconds += time.perf_counter() - start_time
+                if not is_transient_error(e) or attempt == self.max_retries:
+                    logger.error(f"Error upserting {len(records)} products: {e}")
+                    raise
+                stats.retries += 1
+                delay = backoff_delay(attempt)
+                logger.warning(f"Upsert failed ({e}), retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+                continue
+            stats.busy_seconds += time.perf_counter() - start_time
+            return
+
+
+async def _aiter(records):
+    if hasattr(records, "__aiter__"):
+        async for record in records:
+            yield record
+    else:
+        for record in records:
+            yield record
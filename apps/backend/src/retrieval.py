@@ -0,0 +1,264 @@
+import logging
+import os
+import threading
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    NamedTuple,
+    Union,
+)
+
+from langchain_core.documents import Document
+
+from .concurrency import SingleFlight, run_blocking
+from .shopify_client import shop_file_name
+from .telemetry import span
+from .vector_index import LOCAL_INDEX_DIR, LocalVectorStore
+
+if TYPE_CHECKING:
+    # Imported where first needed: langchain_google_vertexai takes seconds to load
+    from langchain_google_vertexai import VectorSearchVectorStore, VertexAIEmbeddings
+
+logger = logging.getLogger(__name__)
+
+# The local index stands in for Vertex Vector Search, with the same search methods
+VectorStore = Union["VectorSearchVectorStore", LocalVectorStore]
+
+EMBEDDING_MODEL = "text-embedding-004"
+# Vertex Vector Search cannot restrict by id, so filtered searches fetch extra and drop the rest
+FILTER_OVERFETCH = int(os.getenv("VECTOR_FILTER_OVERFETCH", "4"))
+
+
+def local_index_path(directory: str, shop: str) -> str:
+    """Directory holding one shop's local vector index."""
+    return os.path.join(directory, shop_file_name(shop))
+
+
+class RetrievalConfig(NamedTuple):
+    """
+    Everything needed to reach the vector index: a deployed Vector Search
+    index (`backend="vertex"`) or per-shop local indexes (`backend="local"`).
+    Two configs that compare equal can share the same vector store.
+    """
+    project_id: str | None
+    region: str
+    index_id: str | None
+    endpoint_id: str | None
+    bucket_name: str | None = None
+    backend: str = "vertex"
+    local_dir: str = LOCAL_INDEX_DIR
+
+    @classmethod
+    def from_env(cls) -> "RetrievalConfig":
+        return cls(
+            project_id=os.getenv("GOOGLE_CLOUD_PROJECT"),
+            region=os.getenv("GOOGLE_CLOUD_REGION", "us-central1"),
+            index_id=os.getenv("VERTEX_INDEX_ID"),
+            endpoint_id=os.getenv("VERTEX_ENDPOINT_ID"),
+            bucket_name=os.getenv("GCS_BUCKET_NAME"),
+            backend=os.getenv("VECTOR_BACKEND", "vertex"),
+            local_dir=os.getenv("LOCAL_INDEX_DIR", LOCAL_INDEX_DIR),
+        )
+
+    @property
+    def is_local(self) -> bool:
+        return self.backend == "local"
+
+    @property
+    def is_complete(self) -> bool:
+        return self.is_local or bool(self.index_id and self.endpoint_id)
+
+
+class RetrievalLayer:
+    """
+    Per-process holder for the embeddings client and vector stores.
+
+    Stores are built once on first use (or at startup via `warm`) and reused
+    by every search, keyed by configuration: shops sharing a Vertex index
+    share one store, and the local backend opens one memory-mapped index per
+    shop. `evict` drops a shop's store when it goes cold.
+    Initialisation time and query time are tracked separately.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stores: dict[tuple[RetrievalConfig, str], VectorStore] = {}
+        self._override: tuple[VectorStore, RetrievalConfig] | None = None
+        self._embeddings: VertexAIEmbeddings | None = None
+        self.init_count = 0
+        self.last_init_seconds = 0.0
+        self.query_count = 0
+        self.total_query_seconds = 0.0
+        self._embed_flights = SingleFlight("embed")
+
+    @staticmethod
+    def _key(config: RetrievalConfig, shop: str) -> tuple[RetrievalConfig, str]:
+        return (config, shop if config.is_local else "")
+
+    def get_store(self, config: RetrievalConfig | None = None, shop: str = "") -> VectorStore | None:
+        """
+        Return the vector store for `config` (defaults to the environment) and
+        `shop`, building it if it does not exist yet.
+        `shop` only matters for the local backend.
+        """
+        config = config or RetrievalConfig.from_env()
+        if not config.is_complete:
+            return None
+
+        store = self._cached(config, shop)
+        if store is not None:
+            return store
+
+        with self._lock:
+            store = self._cached(config, shop)
+            if store is not None:
+                return store
+
+            start_time = time.perf_counter()
+            from langchain_google_vertexai import (
+                VectorSearchVectorStore,
+                VertexAIEmbeddings,
+            )
+            if self._embeddings is None:
+                self._embeddings = VertexAIEmbeddings(model_name=EMBEDDING_MODEL)
+            if config.is_local:
+                store = LocalVectorStore(local_index_path(config.local_dir, shop), embedding=self._embeddings)
+            else:
+                store = VectorSearchVectorStore.from_components(
+                    project_id=config.project_id,
+                    region=config.region,
+                    gcs_bucket_name=config.bucket_name,
+                    index_id=config.index_id,
+                    endpoint_id=config.endpoint_id,
+                    embedding=self._embeddings
+                )
+            elapsed = time.perf_counter() - start_time
+
+            self._stores[self._key(config, shop)] = store
+            self.init_count += 1
+            self.last_init_seconds = elapsed
+            if isinstance(store, LocalVectorStore):
+                logger.info(f"Local vector index for {shop or 'default'} opened in {elapsed:.3f}s ({len(store)} vectors)")
+            else:
+                logger.info(f"Vector store initialised in {elapsed:.3f}s (index={config.index_id}, endpoint={config.endpoint_id})")
+            return store
+
+    def _cached(self, config: RetrievalConfig, shop: str = "") -> VectorStore | None:
+        # Lock-free read: entries are only added and removed under the lock.
+        override = self._override
+        if override is not None and override[1] == config:
+            return override[0]
+        return self._stores.get(self._key(config, shop))
+
+    async def aget_store(self, config: RetrievalConfig | None = None, shop: str = "") -> VectorStore | None:
+        """Async variant of `get_store`; construction runs in the blocking pool."""
+        config = config or RetrievalConfig.from_env()
+        if not config.is_complete:
+            return None
+        return self._cached(config, shop) or await run_blocking(self.get_store, config, shop)
+
+    def warm(self) -> bool:
+        """
+        Build the default store ahead of the first request. Returns True if a store is ready.
+        Per-shop stores are warmed by the shop registry.
+        """
+        return self.get_store() is not None
+
+    def set_store(self, store: VectorStore, config: RetrievalConfig | None = None):
+        """Install a prebuilt store for `config` (defaults to the environment) and every shop, e.g. a stand-in."""
+        with self._lock:
+            self._override = (store, config or RetrievalConfig.from_env())
+
+    def evict(self, shop: str):
+        """Drop a shop's own store; stores shared with other shops are kept."""
+        with self._lock:
+            for key in [key for key in self._stores if key[1] == shop and shop]:
+                del self._stores[key]
+
+    def reset(self):
+        """Drop the cached stores so the next call rebuilds them."""
+        with self._lock:
+            self._stores = {}
+            self._override = None
+
+    def similarity_search(self, query: str, k: int = 5, shop: str = "", config: RetrievalConfig | None = None) -> list[Document]:
+        store = self.get_store(config, shop=shop)
+        if store is None:
+            logger.warning("Vertex AI Index ID or Endpoint ID not set. Returning empty results.")
+            return []
+
+        start_time = time.perf_counter()
+        with span("vector.search", k=k):
+            results = store.similarity_search(query, k=k)
+        elapsed = time.perf_counter() - start_time
+
+        self.query_count += 1
+        self.total_query_seconds += elapsed
+        logger.info(f"Vector search took {elapsed:.3f}s (store init took {self.last_init_seconds:.3f}s)")
+        return results
+
+    async def asimilarity_search(self, query: str, k: int = 5, shop: str = "", config: RetrievalConfig | None = None) -> list[Document]:
+        """
+        Async search. The Vertex embedding and Vector Search clients are
+        synchronous, so the query runs in the bounded blocking pool.
+        """
+        store = await self.aget_store(config, shop=shop)
+        if store is None:
+            logger.warning("Vertex AI Index ID or Endpoint ID not set. Returning empty results.")
+            return []
+        return await self._timed_search(store.similarity_search, query, k)
+
+    async def aembed_query(self, query: str, shop: str = "", config: RetrievalConfig | None = None) -> list[float] | None:
+        """Embed a query with the store's embeddings client, or None if retrieval is not configured."""
+        store = await self.aget_store(config, shop=shop)
+        if store is None:
+            return None
+        # The same text embedded by the same client is the same vector, whichever search asked for it
+        embedding, _ = await self._embed_flights.do((id(store.embeddings), query), self._embed_query, store, query, shop)
+        return embedding
+
+    async def _embed_query(self, store, query: str, shop: str) -> list[float]:
+        with span("embed.query", shop=shop or None):
+            return await run_blocking(store.embeddings.embed_query, query)
+
+    async def asimilarity_search_by_vector(self, embedding: list[float], k: int = 5, shop: str = "", allowed_ids: set[str] | None = None, config: RetrievalConfig | None = None) -> list[Document]:
+        """
+        Async search with a precomputed query embedding. `allowed_ids`
+        restricts results to those products: the local index scores only
+        them, Vertex results are over-fetched and filtered.
+        """
+        store = await self.aget_store(config, shop=shop)
+        if store is None:
+            logger.warning("Vertex AI Index ID or Endpoint ID not set. Returning empty results.")
+            return []
+        if allowed_ids is None:
+            return await self._timed_search(store.similarity_search_by_vector, embedding, k)
+        if isinstance(store, LocalVectorStore):
+            return await self._timed_search(store.similarity_search_by_vector, embedding, k, allowed_ids=allowed_ids)
+        results = await self._timed_search(store.similarity_search_by_vector, embedding, k * FILTER_OVERFETCH)
+        return [doc for doc in results if doc.metadata.get("id") in allowed_ids][:k]
+
+    async def _timed_search(self, search, query, k: int, **kwargs) -> list[Document]:
+        start_time = time.perf_counter()
+        with span("vector.search", k=k, filtered="allowed_ids" in kwargs):
+            results = await run_blocking(search, query, k=k, **kwargs)
+        elapsed = time.perf_counter() - start_time
+
+        self.query_count += 1
+        self.total_query_seconds += elapsed
+        logger.info(f"Vector search took {elapsed:.3f}s (store init took {self.last_init_seconds:.3f}s)")
+        return results
+
+    def stats(self) -> dict[str, Any]:
+        avg_query = self.total_query_seconds / self.query_count if self.query_count else 0.0
+        return {
+            "init_count": self.init_count,
+            "last_init_seconds": self.last_init_seconds,
+            "query_count": self.query_count,
+            "avg_query_seconds": avg_query,
+        }
+
+
+# Shared by every request handled by this process
+retrieval = RetrievalLayer()
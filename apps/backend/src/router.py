@@ -0,0 +1,157 @@
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+ROUTES = ("search_agent", "cart_agent", "general_chat")
+
+# Minimum confidence for a rule-based decision to skip the LLM router
+FAST_ROUTER_THRESHOLD = float(os.getenv("FAST_ROUTER_THRESHOLD", "0.75"))
+FAST_ROUTER_ENABLED = os.getenv("FAST_ROUTER_ENABLED", "true").lower() == "true"
+
+
+class IntentRule(NamedTuple):
+    route: str
+    pattern: "re.Pattern[str]"
+    weight: float
+
+
+def _rule(route: str, pattern: str, weight: float) -> IntentRule:
+    return IntentRule(route, re.compile(pattern, re.IGNORECASE), weight)
+
+
+# Weights are the rule's standalone confidence; evidence for the same route is
+# combined as a noisy-or, and evidence for a competing route lowers confidence.
+DEFAULT_RULES: list[IntentRule] = [
+    # Cart
+    _rule("cart_agent", r"\b(add|put|throw|place)\b.{0,40}\b(cart|basket|bag)\b", 0.95),
+    _rule("cart_agent", r"\b(remove|delete|take)\b.{0,40}\b(from|out of)\b.{0,20}\b(cart|basket|bag)\b", 0.95),
+    _rule("cart_agent", r"\b(my|the)\s+(cart|basket|bag)\b", 0.8),
+    _rule("cart_agent", r"\b(check\s?out|buy|purchase)\b", 0.7),
+    # "order" only in cart phrasing: "order the black belt", "place an order", "I'd like to order it"; not "where is my order"
+    _rule("cart_agent", r"^\s*(please\s+)?order\b|\bplace\s+(an|my|the)\s+order\b|\b(i'?d like|i want|i'?ll)\s+to\s+order\b"
+                        r"|\border\s+(it|this|that|them|one)\s*(now|please)?[\s!.?]*$", 0.75),
+    _rule("cart_agent", r"\b(i'?ll|i will)\s+take\b", 0.8),
+    # Search
+    _rule("search_agent", r"\b(show|find|search|browse)\b", 0.8),
+    _rule("search_agent", r"\b(looking for|look for|searching for|in the market for)\b", 0.9),
+    _rule("search_agent", r"\bdo you (have|sell|carry|stock)\b", 0.9),
+    _rule("search_agent", r"\b(recommend|suggest|suggestions?|ideas?)\b", 0.75),
+    _rule("search_agent", r"\b(under|below|less than|cheaper than|up to|between)\s*\$?\d+", 0.85),
+    # Weak cues: together they stay under the threshold, so "I need some answers" goes to the LLM
+    _rule("search_agent", r"\b(any|some|a few)\s+\w+s\b", 0.35),
+    _rule("search_agent", r"\b(i need|i want|need a|want a|need some|want some)\b", 0.55),
+    # Asking after a variant: "can I order this in blue?", "does it come in a medium"
+    _rule("search_agent", r"\b(this|that|it|these|those|them|they|one)\s+(come\s+)?in\s+(a\s+)?(another|other|different|sizes?|xs|xl|xxl|small|medium|large"
+                          r"|black|white|red|blue|green|yellow|pink|purple|grey|gray|brown|navy|beige|orange|gold|silver)\b", 0.85),
+    # General chat
+    _rule("general_chat", r"^\s*(hi|hello|hey|hiya|yo|good (morning|afternoon|evening))\b[\s!.,]*(there)?[\s!.]*$", 0.95),
+    _rule("general_chat", r"^\s*(thanks|thank you|thx|cheers|bye|goodbye|ok|okay|cool|great)\b[\s!.]*$", 0.95),
+    _rule("general_chat", r"\b(who are you|what can you do|are you (a )?(bot|human|real))\b", 0.9),
+    _rule("general_chat", r"\b(return policy|refund policy|shipping (policy|times?|costs?)|opening hours|contact (you|support))\b", 0.7),
+    _rule("general_chat", r"\bhow are you\b", 0.9),
+    # How-to questions ("how do I buy a gift card") are about the store, not a cart change
+    _rule("general_chat", r"^\s*how\s+(do|can|should)\s+i\b", 0.6),
+    # Order status and support: an order already placed is not a cart change
+    _rule("general_chat", r"\b(where('?s| is| are)\s+my\s+(order|package|parcel|delivery)|track(ing)?\s+(my\s+|an?\s+|the\s+)?(order|package|parcel)"
+                          r"|order\s+(status|number|confirmation|history)|status of my order|cancel\s+(my|the|an)\s+order"
+                          r"|(my|the)\s+order\s+(hasn'?t|has not|didn'?t|did not|never|is late|arrived))\b", 0.9),
+]
+
+
+class RouteDecision(NamedTuple):
+    route: str | None
+    confidence: float
+    matched: tuple[str, ...] = ()
+
+
+class RouterMetrics:
+    """
+    Counters for the fast-path router. `accuracy` is measured on shadowed
+    messages, where the LLM router is also asked and its answer compared.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+        self.fast_hits = 0
+        self.fallbacks = 0
+        self.hits_by_route: Counter = Counter()
+        self.shadow_checked = 0
+        self.shadow_agreed = 0
+
+    def record(self, decision: RouteDecision, fast: bool):
+        with self._lock:
+            self.total += 1
+            if fast:
+                self.fast_hits += 1
+                self.hits_by_route[decision.route] += 1
+            else:
+                self.fallbacks += 1
+
+    def record_shadow(self, fast_route: str, llm_route: str):
+        with self._lock:
+            self.shadow_checked += 1
+            if fast_route == llm_route:
+                self.shadow_agreed += 1
+            else:
+                logger.info(f"Fast router disagreed with LLM: fast={fast_route} llm={llm_route}")
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "total": self.total,
+                "fast_hits": self.fast_hits,
+                "fallbacks": self.fallbacks,
+                "hit_rate": self.fast_hits / self.total if self.total else 0.0,
+                "hits_by_route": dict(self.hits_by_route),
+                "shadow_checked": self.shadow_checked,
+                "accuracy": self.shadow_agreed / self.shadow_checked if self.shadow_checked else None,
+            }
+
+
+class IntentRouter:
+    """
+    Keyword/regex intent classifier placed in front of the LLM supervisor.
+    Returns a route only when it is confident; otherwise the caller falls back
+    to the LLM.
+    """
+
+    def __init__(self, rules: list[IntentRule] | None = None, threshold: float = FAST_ROUTER_THRESHOLD):
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        self.threshold = threshold
+        self.metrics = RouterMetrics()
+
+    def classify(self, text: str) -> RouteDecision:
+        """Score every route and return the best one with its confidence."""
+        miss = {route: 1.0 for route in ROUTES}
+        matched = []
+        for rule in self.rules:
+            if rule.pattern.search(text):
+                miss[rule.route] *= (1.0 - rule.weight)
+                matched.append(rule.pattern.pattern)
+
+        scores = sorted(((1.0 - m, route) for route, m in miss.items()), reverse=True)
+        (best, route), (runner_up, _) = scores[0], scores[1]
+        if best == 0.0:
+            return RouteDecision(None, 0.0)
+        return RouteDecision(route, best * (1.0 - runner_up), tuple(matched))
+
+    def route(self, text: str) -> RouteDecision | None:
+        """
+        Return a confident decision, or None if the LLM router should decide.
+        Records hit-rate metrics either way.
+        """
+        if not FAST_ROUTER_ENABLED:
+            return None
+        decision = self.classify(text)
+        fast = decision.route is not None and decision.confidence >= self.threshold
+        self.metrics.record(decision, fast)
+        return decision if fast else None
+
+
+intent_router = IntentRouter()
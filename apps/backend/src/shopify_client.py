@@ -1,72 +1,731 @@
-import httpx
-import os
-from typing import List, Dict, Any, Optional
+import asyncio
+import json
 import logging
+import os
+import random
+import re
+import time
+from collections.abc import AsyncIterator, Iterable
+from contextlib import asynccontextmanager
+from datetime import UTC
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+import httpx
+
+from .telemetry import span
 
 logger = logging.getLogger(__name__)
 
+SHOPIFY_API_VERSION = "2024-01"
+SHOPIFY_MAX_RETRIES = int(os.getenv("SHOPIFY_MAX_RETRIES", "5"))
+SHOPIFY_MAX_CONNECTIONS = int(os.getenv("SHOPIFY_MAX_CONNECTIONS", "10"))
+# A shop's domain as Shopify issues it
+_SHOP_DOMAIN = re.compile(r"[a-z0-9][a-z0-9-]*\.myshopify\.com")
+# Cost assumed for a query we have not seen a cost report for yet
+DEFAULT_QUERY_COST = 100.0
+
+# "auto" uses a bulk export for catalogues of at least SHOPIFY_BULK_THRESHOLD products
+SHOPIFY_FETCH_MODE = os.getenv("SHOPIFY_FETCH_MODE", "auto")
+SHOPIFY_BULK_THRESHOLD = int(os.getenv("SHOPIFY_BULK_THRESHOLD", "5000"))
+BULK_POLL_TIMEOUT = float(os.getenv("SHOPIFY_BULK_POLL_TIMEOUT", "3600"))
+BULK_PAGE_SIZE = 250
+
+PRODUCTS_QUERY = """
+query ($cursor: String, $query: String) {
+  products(first: 50, after: $cursor, query: $query) {
+    edges {
+      node {
+        id
+        title
+        descriptionHtml
+        handle
+        tags
+        vendor
+        productType
+        totalInventory
+        priceRangeV2 {
+          minVariantPrice {
+            amount
+            currencyCode
+          }
+        }
+        images(first: 1) {
+          edges {
+            node {
+              url
+              altText
+            }
+          }
+        }
+        variants(first: 10) {
+          edges {
+            node {
+              id
+              title
+              price
+              sku
+              availableForSale
+            }
+          }
+        }
+      }
+      cursor
+    }
+    pageInfo {
+      hasNextPage
+    }
+  }
+}
+"""
+
+# Bulk exports ignore `first:` limits and return nested connections as
+# separate JSONL lines linked to their product by __parentId.
+BULK_PRODUCTS_QUERY = """
+{
+  products%s {
+    edges {
+      node {
+        id
+        title
+        descriptionHtml
+        handle
+        tags
+        vendor
+        productType
+        totalInventory
+        priceRangeV2 {
+          minVariantPrice {
+            amount
+            currencyCode
+          }
+        }
+        images {
+          edges {
+            node {
+              url
+              altText
+            }
+          }
+        }
+        variants {
+          edges {
+            node {
+              id
+              title
+              price
+              sku
+              availableForSale
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+BULK_RUN_MUTATION = """
+mutation ($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation {
+      id
+      status
+    }
+    userErrors {
+      field
+      message
+    }
+  }
+}
+"""
+
+BULK_STATUS_QUERY = """
+query {
+  currentBulkOperation {
+    id
+    status
+    errorCode
+    objectCount
+    url
+  }
+}
+"""
+
+# Storefront API cart operations. Every mutation returns the whole cart, so
+# the caller never needs a follow-up query to see the result.
+CART_FIELDS = """
+fragment CartFields on Cart {
+  id
+  checkoutUrl
+  totalQuantity
+  cost {
+    totalAmount {
+      amount
+      currencyCode
+    }
+  }
+  lines(first: 100) {
+    edges {
+      node {
+        id
+        quantity
+        merchandise {
+          ... on ProductVariant {
+            id
+            title
+            product {
+              id
+              title
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+CART_CREATE_MUTATION = """
+mutation ($lines: [CartLineInput!]) {
+  cartCreate(input: {lines: $lines}) {
+    cart { ...CartFields }
+    userErrors { field message }
+  }
+}
+""" + CART_FIELDS
+
+CART_LINES_ADD_MUTATION = """
+mutation ($cartId: ID!, $lines: [CartLineInput!]!) {
+  cartLinesAdd(cartId: $cartId, lines: $lines) {
+    cart { ...CartFields }
+    userErrors { field message }
+  }
+}
+""" + CART_FIELDS
+
+CART_LINES_UPDATE_MUTATION = """
+mutation ($cartId: ID!, $lines: [CartLineUpdateInput!]!) {
+  cartLinesUpdate(cartId: $cartId, lines: $lines) {
+    cart { ...CartFields }
+    userErrors { field message }
+  }
+}
+""" + CART_FIELDS
+
+CART_LINES_REMOVE_MUTATION = """
+mutation ($cartId: ID!, $lineIds: [ID!]!) {
+  cartLinesRemove(cartId: $cartId, lineIds: $lineIds) {
+    cart { ...CartFields }
+    userErrors { field message }
+  }
+}
+""" + CART_FIELDS
+
+CART_QUERY = """
+query ($cartId: ID!) {
+  cart(id: $cartId) { ...CartFields }
+}
+""" + CART_FIELDS
+
+class ProductPage(list):
+    """
+    One page of products. `cursor` is where pagination resumes after this
+    page; bulk export pages have none, as an export can only be re-run.
+    """
+
+    def __init__(self, products: Iterable[dict[str, Any]] = (), cursor: str | None = None):
+        super().__init__(products)
+        self.cursor = cursor
+
+
+_OPERATION = re.compile(r"\{\s*(\w+)")
+
+def operation_name(query: str) -> str:
+    """The top-level field a GraphQL document selects or mutates, e.g. products or cartCreate."""
+    match = _OPERATION.search(query)
+    return match.group(1) if match else "graphql"
+
+class InvalidShopDomain(ValueError):
+    """A shop URL that is not a *.myshopify.com domain."""
+
+def normalize_shop_domain(shop_url: str) -> str:
+    """
+    Reduce a shop URL to its bare domain, e.g. "https://My-Shop.myshopify.com/" -> "my-shop.myshopify.com".
+    An empty URL stays empty and means the default shop. Anything that is not
+    a *.myshopify.com hostname raises InvalidShopDomain: the domain names the
+    shop's files and API endpoints, so it must not carry a path.
+    """
+    shop = shop_url.strip().replace("https://", "").replace("http://", "").strip("/").lower()
+    if shop and not _SHOP_DOMAIN.fullmatch(shop):
+        raise InvalidShopDomain(f"Not a Shopify shop domain: {shop_url[:100]!r}")
+    return shop
+
+def shop_file_name(shop: str) -> str:
+    """The validated name a shop's files and directories are stored under; "default" for the default shop."""
+    return normalize_shop_domain(shop) or "default"
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Seconds to wait from a Retry-After header, given either as seconds or as
+    an HTTP date; None when it is missing or neither.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if retry_at.tzinfo is None:
+        # "-0000" dates come back naive; HTTP dates are always UTC
+        retry_at = retry_at.replace(tzinfo=UTC)
+    return max(0.0, retry_at.timestamp() - time.time())
+
+def json_body(response: httpx.Response) -> dict[str, Any] | None:
+    """The response's JSON object, or None if the body is not one."""
+    try:
+        body = response.json()
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+def updated_since_filter(updated_since: str) -> str:
+    """Product search syntax for products updated after an ISO 8601 timestamp, quoted so the value can't end the filter."""
+    escaped = updated_since.replace("\\", "\\\\").replace('"', '\\"')
+    return f'updated_at:>"{escaped}"'
+
+class ShopifyAPIError(Exception):
+    """Shopify returned GraphQL errors or a 4xx, or a request kept failing after retries."""
+
+class CartNotFoundError(ShopifyAPIError):
+    """A cart mutation targeted a cart that no longer exists (expired, checked out or unknown)."""
+
+class CostThrottle:
+    """
+    Client-side leaky bucket mirroring Shopify's GraphQL cost limit for one shop.
+
+    Each request reserves its expected cost and waits until the bucket has
+    restored enough points, so we never send a query Shopify would throttle.
+    The bucket is re-synchronised from the `throttleStatus` Shopify reports
+    with every response.
+    """
+
+    def __init__(self, maximum_available: float = 1000.0, restore_rate: float = 50.0):
+        self.maximum_available = maximum_available
+        self.currently_available = maximum_available
+        self.restore_rate = restore_rate
+        self.waited_seconds = 0.0
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        restored = (now - self._updated_at) * self.restore_rate
+        self.currently_available = min(self.maximum_available, self.currently_available + restored)
+        self._updated_at = now
+
+    async def acquire(self, cost: float):
+        # The lock makes waiters queue in order instead of racing for points
+        async with self._lock:
+            self._refill()
+            cost = min(cost, self.maximum_available)
+            if self.currently_available < cost:
+                wait = (cost - self.currently_available) / self.restore_rate
+                self.waited_seconds += wait
+                await asyncio.sleep(wait)
+                self._refill()
+            self.currently_available -= cost
+
+    def update(self, throttle_status: dict[str, Any]):
+        self.maximum_available = float(throttle_status.get("maximumAvailable", self.maximum_available))
+        self.currently_available = float(throttle_status.get("currentlyAvailable", self.currently_available))
+        self.restore_rate = float(throttle_status.get("restoreRate", self.restore_rate))
+        self._updated_at = time.monotonic()
+
+class ShopConnection:
+    """
+    Long-lived HTTP/2 client and cost throttle shared by every ShopifyClient
+    for the same shop in this process.
+    """
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            http2=_http2_available(),
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=SHOPIFY_MAX_CONNECTIONS, max_keepalive_connections=SHOPIFY_MAX_CONNECTIONS)
+        )
+        self.throttle = CostThrottle()
+        self.loop = asyncio.get_running_loop()
+        self.query_costs: dict[str, float] = {}
+        self.retries = 0
+        # Requests using the client, and whether it is to be closed once they finish
+        self.users = 0
+        self.closing = False
+
+    @asynccontextmanager
+    async def in_use(self) -> AsyncIterator[httpx.AsyncClient]:
+        """The client, kept open until the caller is done with it even if the shop is closed meanwhile."""
+        self.users += 1
+        try:
+            yield self.client
+        finally:
+            self.users -= 1
+            if self.closing and self.users == 0 and not self.client.is_closed:
+                await self.client.aclose()
+
+    async def close(self):
+        """Close the client now, or when the last request using it finishes."""
+        self.closing = True
+        if self.users == 0 and not self.client.is_closed:
+            await self.client.aclose()
+
+    def estimated_cost(self, query: str) -> float:
+        return self.query_costs.get(query, DEFAULT_QUERY_COST)
+
+    def record_cost(self, query: str, cost: dict[str, Any]):
+        if "requestedQueryCost" in cost:
+            self.query_costs[query] = float(cost["requestedQueryCost"])
+        if "throttleStatus" in cost:
+            self.throttle.update(cost["throttleStatus"])
+
+_connections: dict[str, ShopConnection] = {}
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def get_connection(shop_domain: str) -> ShopConnection:
+    """Return the pooled connection for a shop, creating it on first use (or if its event loop is gone)."""
+    connection = _connections.get(shop_domain)
+    if connection is None or connection.loop is not asyncio.get_running_loop():
+        connection = ShopConnection()
+        _connections[shop_domain] = connection
+    return connection
+
+async def close_connection(shop_domain: str):
+    """
+    Close one shop's pooled client, e.g. when the shop is evicted from memory.
+    Requests still using it finish first; new ones get a new client.
+    """
+    connection = _connections.pop(shop_domain, None)
+    if connection is not None and connection.loop is asyncio.get_running_loop():
+        await connection.close()
+
+async def close_connections():
+    """Close every pooled client, e.g. on application shutdown."""
+    connections = list(_connections.values())
+    _connections.clear()
+    for connection in connections:
+        await connection.client.aclose()
+
 class ShopifyClient:
-    def __init__(self, shop_url: str, access_token: str):
+    def __init__(self, shop_url: str, access_token: str, base_url: str | None = None, storefront_token: str | None = None, storefront_url: str | None = None):
         """
         Initialize the Shopify Client.
         
         :param shop_url: The URL of the Shopify store (e.g., "my-shop.myshopify.com").
         :param access_token: The Admin API access token.
+        :param base_url: Optional Admin GraphQL endpoint override, e.g. a local mock server.
+        :param storefront_token: Optional Storefront API access token, needed for cart operations.
+        :param storefront_url: Optional Storefront GraphQL endpoint override.
         """
-        self.shop_url = shop_url.replace("https://", "").replace("http://", "").strip("/")
+        self.shop_url = normalize_shop_domain(shop_url)
         self.access_token = access_token
-        self.base_url = f"https://{self.shop_url}/admin/api/2024-01/graphql.json"
+        self.base_url = base_url or f"https://{self.shop_url}/admin/api/{SHOPIFY_API_VERSION}/graphql.json"
         self.headers = {
             "X-Shopify-Access-Token": self.access_token,
             "Content-Type": "application/json"
         }
+        self.storefront_url = storefront_url or f"https://{self.shop_url}/api/{SHOPIFY_API_VERSION}/graphql.json"
+        self.storefront_headers = {
+            "X-Shopify-Storefront-Access-Token": storefront_token or "",
+            "Content-Type": "application/json"
+        }
+
+    async def graphql(self, query: str, variables: dict[str, Any] | None = None) -> dict[str, Any]:
+        """
+        Run an Admin API GraphQL query through the shop's pooled client and return its `data`.
 
-    async def fetch_all_products(self) -> List[Dict[str, Any]]:
+        Requests are paced by the shop's cost throttle. 429s, 5xx responses,
+        network errors and THROTTLED errors are retried with jittered
+        exponential backoff. Other GraphQL errors raise ShopifyAPIError.
+        """
+        return await self._request(self.base_url, self.headers, query, variables, paced=True)
+
+    async def storefront_graphql(self, query: str, variables: dict[str, Any] | None = None, idempotent: bool = True) -> dict[str, Any]:
+        """
+        Run a Storefront API query (e.g. cart mutations) through the same pooled client.
+        The Storefront API has no cost bucket, so requests are not paced, only retried.
+        Pass idempotent=False for mutations that must not be applied twice: they are
+        only retried when Shopify rejected them outright (429), not after a 5xx or a
+        dropped connection, where the first attempt may have gone through.
+        """
+        return await self._request(self.storefront_url, self.storefront_headers, query, variables, paced=False, idempotent=idempotent)
+
+    async def _request(self, url: str, headers: dict[str, str], query: str, variables: dict[str, Any] | None, paced: bool, idempotent: bool = True) -> dict[str, Any]:
+        # Traced per operation (products, cartCreate, ...), including throttle waits and retries
+        with span(f"shopify.{operation_name(query)}", shop=self.shop_url) as request_span:
+            return await self._send(request_span, url, headers, query, variables, paced, idempotent)
+
+    async def _send(self, request_span: Any, url: str, headers: dict[str, str], query: str, variables: dict[str, Any] | None, paced: bool, idempotent: bool) -> dict[str, Any]:
+        connection = get_connection(self.shop_url)
+        payload = {"query": query, "variables": variables or {}}
+
+        # Held for the whole request, retries included, so evicting the shop doesn't close the client under it
+        async with connection.in_use() as client:
+            for attempt in range(SHOPIFY_MAX_RETRIES + 1):
+                request_span.set_attribute("shopify.attempts", attempt + 1)
+                if paced:
+                    await connection.throttle.acquire(connection.estimated_cost(query))
+
+                retry_after = None
+                try:
+                    response = await client.post(url, json=payload, headers=headers)
+                except httpx.TransportError as e:
+                    error = f"{type(e).__name__}: {e}"
+                else:
+                    if response.status_code == 429 or response.status_code >= 500:
+                        error = f"HTTP {response.status_code}"
+                        retry_after = response.headers.get("Retry-After")
+                    elif response.status_code >= 400:
+                        # Bad or missing token, missing scope, unknown shop: retrying won't help
+                        raise ShopifyAPIError(f"Shopify rejected the request: HTTP {response.status_code} {response.text[:200]}")
+                    else:
+                        body = json_body(response)
+                        if body is None:
+                            # A proxy or load balancer page rather than Shopify's answer
+                            error = f"HTTP {response.status_code} with a non-JSON body"
+                        else:
+                            cost = body.get("extensions", {}).get("cost")
+                            if cost:
+                                connection.record_cost(query, cost)
+
+                            errors = body.get("errors")
+                            if not errors:
+                                return body.get("data") or {}
+                            if not any(e.get("extensions", {}).get("code") == "THROTTLED" for e in errors):
+                                raise ShopifyAPIError(f"Shopify GraphQL Errors: {errors}")
+                            # The throttle has just been re-synced, so the next acquire waits long enough
+                            error = "THROTTLED"
+
+                if attempt == SHOPIFY_MAX_RETRIES:
+                    raise ShopifyAPIError(f"Shopify request failed after {attempt + 1} attempts: {error}")
+                if not idempotent and error not in ("HTTP 429", "THROTTLED"):
+                    raise ShopifyAPIError(f"Shopify request failed and is not safe to retry: {error}")
+
+                connection.retries += 1
+                delay = parse_retry_after(retry_after)
+                if delay is None:
+                    delay = random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+                logger.warning(f"Shopify request failed ({error}), retrying in {delay:.2f}s (attempt {attempt + 1}/{SHOPIFY_MAX_RETRIES})")
+                await asyncio.sleep(delay)
+
+        raise ShopifyAPIError("unreachable")
+
+    async def _cart_mutation(self, name: str, mutation: str, variables: dict[str, Any]) -> dict[str, Any]:
+        data = await self.storefront_graphql(mutation, variables, idempotent=False)
+        result = data.get(name) or {}
+        errors = result.get("userErrors") or []
+        cart = result.get("cart")
+        # An unknown or expired cart comes back as no cart, with or without a userError on cartId
+        if not cart and "cartId" in variables and (not errors or any("cartId" in (error.get("field") or []) for error in errors)):
+            raise CartNotFoundError(f"{name} failed: cart {variables['cartId']} does not exist")
+        if errors:
+            raise ShopifyAPIError(f"{name} failed: {errors}")
+        if not cart:
+            raise ShopifyAPIError(f"{name} returned no cart")
+        return cart
+
+    async def cart_create(self, lines: list[dict[str, Any]]) -> dict[str, Any]:
+        """
+        Create a cart holding `lines` ({"merchandiseId": variant id, "quantity": n}) and return it.
+        """
+        return await self._cart_mutation("cartCreate", CART_CREATE_MUTATION, {"lines": lines})
+
+    async def cart_lines_add(self, cart_id: str, lines: list[dict[str, Any]]) -> dict[str, Any]:
+        """Add `lines` to a cart in one mutation and return the updated cart."""
+        return await self._cart_mutation("cartLinesAdd", CART_LINES_ADD_MUTATION, {"cartId": cart_id, "lines": lines})
+
+    async def cart_lines_update(self, cart_id: str, lines: list[dict[str, Any]]) -> dict[str, Any]:
+        """Set the quantity of cart lines ({"id": line id, "quantity": n}) and return the updated cart."""
+        return await self._cart_mutation("cartLinesUpdate", CART_LINES_UPDATE_MUTATION, {"cartId": cart_id, "lines": lines})
+
+    async def cart_lines_remove(self, cart_id: str, line_ids: list[str]) -> dict[str, Any]:
+        """Remove cart lines by line id and return the updated cart."""
+        return await self._cart_mutation("cartLinesRemove", CART_LINES_REMOVE_MUTATION, {"cartId": cart_id, "lineIds": line_ids})
+
+    async def fetch_cart(self, cart_id: str) -> dict[str, Any] | None:
+        """The cart, or None if it does not exist (e.g. it expired or was checked out)."""
+        data = await self.storefront_graphql(CART_QUERY, {"cartId": cart_id})
+        return data.get("cart")
+
+    async def fetch_all_products(self, updated_since: str | None = None) -> list[dict[str, Any]]:
         """
         Fetch all products from the Shopify store using cursor-based pagination.
+        Holds the whole catalogue in memory; prefer `iter_product_pages` for large stores.
+
+        :param updated_since: Optional ISO 8601 timestamp; only products updated after it are returned.
+        """
+        products: list[dict[str, Any]] = []
+        async for page in self.iter_product_pages(updated_since=updated_since):
+            products.extend(page)
+        return products
+
+    async def iter_product_pages(self, updated_since: str | None = None, after: str | None = None) -> AsyncIterator["ProductPage"]:
+        """
+        Yield products one page at a time, so callers can process the catalogue
+        in a constant-size window. Raises ShopifyAPIError if a page cannot be
+        fetched, rather than silently ending with a partial catalogue.
+
+        :param updated_since: Optional ISO 8601 timestamp; only products updated after it are returned.
+        :param after: Optional page cursor (see ProductPage.cursor) to resume from.
         """
-        products = []
+        has_next_page = True
+        cursor = after
+        fetched = 0
+        search_filter = updated_since_filter(updated_since) if updated_since else None
+
+        while has_next_page:
+            data = await self.graphql(PRODUCTS_QUERY, {"cursor": cursor, "query": search_filter})
+            products_data = data.get("products", {})
+            edges = products_data.get("edges", [])
+            if edges:
+                cursor = edges[-1]["cursor"]
+            has_next_page = products_data.get("pageInfo", {}).get("hasNextPage", False)
+
+            fetched += len(edges)
+            logger.info(f"Fetched {fetched} products so far...")
+            yield ProductPage((edge["node"] for edge in edges), cursor)
+
+    async def iter_products(self, updated_since: str | None = None, expected_count: int | None = None, after: str | None = None) -> AsyncIterator["ProductPage"]:
+        """
+        Yield product pages using the best fetch mode for the catalogue size:
+        a bulk export when `expected_count` reaches SHOPIFY_BULK_THRESHOLD,
+        cursor pagination otherwise. SHOPIFY_FETCH_MODE=paginate|bulk forces a mode.
+        Resuming from a page cursor (`after`) always paginates.
+        """
+        use_bulk = after is None and (SHOPIFY_FETCH_MODE == "bulk" or (
+            SHOPIFY_FETCH_MODE == "auto" and expected_count is not None and expected_count >= SHOPIFY_BULK_THRESHOLD
+        ))
+        pages = self.iter_product_pages_bulk(updated_since) if use_bulk else self.iter_product_pages(updated_since, after=after)
+        logger.info(f"Fetching products with {'bulk export' if use_bulk else 'pagination'} (expected: {expected_count})")
+        async for page in pages:
+            yield page
+
+    async def run_bulk_query(self, query: str) -> str | None:
+        """
+        Start a bulk operation and wait for it to finish.
+        Returns the URL of the JSONL result, or None if the query matched nothing.
+        Raises if Shopify rejects or fails the operation, so callers never
+        mistake a partial export for the full catalogue.
+        """
+        data = await self.graphql(BULK_RUN_MUTATION, {"query": query})
+        result = data["bulkOperationRunQuery"]
+        if result["userErrors"]:
+            raise ShopifyAPIError(f"Bulk operation rejected: {result['userErrors']}")
+        operation_id = result["bulkOperation"]["id"]
+        logger.info(f"Started bulk operation {operation_id}")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + BULK_POLL_TIMEOUT
+        delay = 1.0
+        while True:
+            await asyncio.sleep(delay)
+            delay = min(delay * 1.5, 10.0)
+
+            data = await self.graphql(BULK_STATUS_QUERY)
+            operation = data.get("currentBulkOperation") or {}
+            if operation.get("id") != operation_id:
+                raise ShopifyAPIError(f"Bulk operation {operation_id} is no longer the current operation")
+
+            status = operation.get("status")
+            logger.info(f"Bulk operation {operation_id}: {status} ({operation.get('objectCount')} objects)")
+            if status == "COMPLETED":
+                return operation.get("url")
+            if status in ("FAILED", "CANCELED", "EXPIRED"):
+                raise ShopifyAPIError(f"Bulk operation {operation_id} {status.lower()}: {operation.get('errorCode')}")
+            if loop.time() > deadline:
+                raise TimeoutError(f"Bulk operation {operation_id} did not finish within {BULK_POLL_TIMEOUT:.0f}s")
+
+    async def iter_product_pages_bulk(self, updated_since: str | None = None) -> AsyncIterator["ProductPage"]:
+        """
+        Export the catalogue with bulkOperationRunQuery and yield it in pages of
+        the same shape as `iter_product_pages`. The JSONL result is streamed,
+        and each product is rebuilt with its images and variants.
+        """
+        search_filter = ""
+        if updated_since:
+            # Embedded in the query document, so the filter becomes a GraphQL string literal (JSON's escapes are valid there)
+            search_filter = f"(query: {json.dumps(updated_since_filter(updated_since))})"
+        url = await self.run_bulk_query(BULK_PRODUCTS_QUERY % search_filter)
+        if not url:
+            return
+
+        page: list[dict[str, Any]] = []
+        product: dict[str, Any] | None = None
+        fetched = 0
+
+        # Children follow their parent product in the file, so a product is
+        # complete as soon as the next top-level line arrives.
+        async with get_connection(self.shop_url).in_use() as client, client.stream("GET", url, timeout=None) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                node = json.loads(line)
+                parent_id = node.pop("__parentId", None)
+
+                if parent_id is None:
+                    if product is not None:
+                        page.append(product)
+                        fetched += 1
+                    node["images"] = {"edges": []}
+                    node["variants"] = {"edges": []}
+                    product = node
+                    if len(page) >= BULK_PAGE_SIZE:
+                        logger.info(f"Fetched {fetched} products so far...")
+                        yield ProductPage(page)
+                        page = []
+                    continue
+
+                if product is None or parent_id != product["id"]:
+                    logger.warning(f"Skipping bulk export line for {parent_id}: parent is not the current product")
+                    continue
+                # Match the limits of the paginated query
+                if "price" in node and len(product["variants"]["edges"]) < 10:
+                    product["variants"]["edges"].append({"node": node})
+                elif "url" in node and not product["images"]["edges"]:
+                    product["images"]["edges"].append({"node": node})
+
+        if product is not None:
+            page.append(product)
+            fetched += 1
+        if page:
+            yield ProductPage(page)
+        logger.info(f"Bulk export complete: {fetched} products")
+
+    async def fetch_product_ids(self) -> list[str]:
+        """
+        Fetch the IDs of every product in the store. Used to detect deleted products.
+        Errors are raised: a partial list would look like deletions.
+        """
+        ids = []
         has_next_page = True
         cursor = None
 
         query = """
         query ($cursor: String) {
-          products(first: 50, after: $cursor) {
+          products(first: 250, after: $cursor) {
             edges {
               node {
                 id
-                title
-                descriptionHtml
-                handle
-                tags
-                vendor
-                productType
-                totalInventory
-                priceRangeV2 {
-                  minVariantPrice {
-                    amount
-                    currencyCode
-                  }
-                }
-                images(first: 1) {
-                  edges {
-                    node {
-                      url
-                      altText
-                    }
-                  }
-                }
-                variants(first: 10) {
-                  edges {
-                    node {
-                      id
-                      title
-                      price
-                      sku
-                      availableForSale
-                    }
-                  }
-                }
               }
               cursor
             }
@@ -77,38 +736,14 @@ class ShopifyClient:
         }
         """
 
-        async with httpx.AsyncClient() as client:
-            while has_next_page:
-                variables = {"cursor": cursor}
-                try:
-                    response = await client.post(
-                        self.base_url,
-                        json={"query": query, "variables": variables},
-                        headers=self.headers,
-                        timeout=30.0
-                    )
-                    response.raise_for_status()
-                    data = response.json()
-                    
-                    if "errors" in data:
-                        logger.error(f"Shopify GraphQL Errors: {data['errors']}")
-                        break
-
-                    products_data = data.get("data", {}).get("products", {})
-                    edges = products_data.get("edges", [])
-                    
-                    for edge in edges:
-                        products.append(edge["node"])
-                        cursor = edge["cursor"]
-
-                    has_next_page = products_data.get("pageInfo", {}).get("hasNextPage", False)
-                    logger.info(f"Fetched {len(products)} products so far...")
-
-                except httpx.HTTPStatusError as e:
-                    logger.error(f"HTTP error occurred: {e}")
-                    break
-                except Exception as e:
-                    logger.error(f"An error occurred: {e}")
-                    break
+        while has_next_page:
+            data = await self.graphql(query, {"cursor": cursor})
+            products_data = data.get("products", {})
+            for edge in products_data.get("edges", []):
+                ids.append(edge["node"]["id"])
+                cursor = edge["cursor"]
 
-        return products
+            has_next_page = products_data.get("pageInfo", {}).get("hasNextPage", False)
+
+        logger.info(f"Fetched {len(ids)} product IDs")
+        return ids
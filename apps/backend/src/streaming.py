@@ -0,0 +1,84 @@
+import json
+import logging
+from collections.abc import AsyncIterator
+from typing import Any
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+
+logger = logging.getLogger(__name__)
+
+# Nodes whose model output is internal (routing decisions) and never shown to the shopper
+SILENT_NODES = {"supervisor"}
+
+
+def message_text(message: BaseMessage) -> str:
+    """A message's text, whether its content is a string or a list of parts."""
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(part if isinstance(part, str) else str(part.get("text", "")) for part in message.content)
+
+
+def sse_event(event: str, data: dict[str, Any]) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def stream_chat_events(graph, inputs: dict[str, Any], config: dict[str, Any] | None = None) -> AsyncIterator[str]:
+    """
+    Run the agent graph and yield SSE events as work completes:
+
+    - `node`: the graph entered a node
+    - `token`: a chunk of model output from a specialist node
+    - `products`: the products returned by a search tool call
+    - `message`: a complete reply that was not streamed token by token
+    - `done`: the final response text, products and cart ID
+    - `error`: the run failed
+    """
+    current_node = "supervisor"
+    yield sse_event("node", {"node": current_node})
+
+    streamed_ids = set()
+    final_response = ""
+    products = []
+    cart_id = (inputs or {}).get("cart_id", "")
+
+    try:
+        async for mode, payload in graph.astream(inputs, config=config, stream_mode=["messages", "updates"]):
+            if mode == "messages":
+                chunk, metadata = payload
+                node = metadata.get("langgraph_node", "")
+                if node in SILENT_NODES or not isinstance(chunk, AIMessageChunk):
+                    continue
+                if isinstance(chunk.content, str) and chunk.content:
+                    streamed_ids.add(chunk.id)
+                    yield sse_event("token", {"node": node, "text": chunk.content})
+                continue
+
+            # "updates" mode: one dict per finished node
+            for node, update in payload.items():
+                if not update:
+                    continue
+                next_node = update.get("next_node")
+                if next_node and next_node != "end" and next_node != current_node:
+                    current_node = next_node
+                    yield sse_event("node", {"node": current_node})
+
+                if update.get("cart_id"):
+                    cart_id = update["cart_id"]
+
+                if update.get("products_found"):
+                    products = update["products_found"]
+                    yield sse_event("products", {"products": products})
+
+                messages = [m for m in update.get("messages", []) if isinstance(m, AIMessage) and m.content]
+                if messages:
+                    final_response = message_text(messages[-1])
+                    # Replies built by the node itself (e.g. tool summaries) were never tokenised
+                    for message in messages:
+                        if message.id is None or message.id not in streamed_ids:
+                            yield sse_event("message", {"node": node, "text": message_text(message)})
+
+        yield sse_event("done", {"response": final_response, "products": products, "cart_id": cart_id})
+    except Exception as e:
+        logger.exception("Streaming chat failed")
+        yield sse_event("error", {"detail": str(e)})
@@ -0,0 +1,243 @@
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any, TextIO
+
+from opentelemetry import trace
+
+logger = logging.getLogger(__name__)
+
+# Spans are exported as OTLP/HTTP to this collector (standard OpenTelemetry variable) ...
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+# ... and/or appended to this file, one JSON span per line. With neither, spans are not recorded
+# but stage latencies still are, for /metrics.
+OTEL_TRACES_FILE = os.getenv("OTEL_TRACES_FILE", "")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "shop-agent-backend")
+# Latest observations per stage that p50/p95/p99 are computed over
+METRICS_RECENT_SAMPLES = int(os.getenv("METRICS_RECENT_SAMPLES", "1024"))
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_tracer = trace.get_tracer("shop-agent")
+_provider = None
+# OTEL_TRACES_FILE while spans are written to it; closed by shutdown_tracing
+_trace_file: TextIO | None = None
+
+
+def configure_tracing(service_name: str = OTEL_SERVICE_NAME) -> bool:
+    """
+    Install an OpenTelemetry SDK tracer provider exporting to the collector
+    and/or file configured above. Called once per process (the API and each
+    sync worker); returns whether spans are exported. Without the SDK, or
+    with no exporter configured, spans are no-ops.
+    """
+    global _provider, _trace_file
+    if _provider is not None:
+        return True
+    if not OTEL_EXPORTER_OTLP_ENDPOINT and not OTEL_TRACES_FILE:
+        return False
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import (
+            BatchSpanProcessor,
+            ConsoleSpanExporter,
+        )
+    except ImportError:
+        logger.warning("opentelemetry-sdk is not installed; spans will not be exported")
+        return False
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    if OTEL_EXPORTER_OTLP_ENDPOINT:
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import (  # type: ignore[import-not-found]
+                OTLPSpanExporter,
+            )
+            # Reads OTEL_EXPORTER_OTLP_ENDPOINT (and headers, timeouts) from the environment
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            logger.info(f"Exporting spans to {OTEL_EXPORTER_OTLP_ENDPOINT}")
+        except ImportError:
+            logger.warning("opentelemetry-exporter-otlp-proto-http is not installed; spans will not be sent to the collector")
+    if OTEL_TRACES_FILE:
+        _trace_file = open(OTEL_TRACES_FILE, "a", buffering=1)  # noqa: SIM115 - open until shutdown_tracing
+        provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter(out=_trace_file, formatter=lambda span: span.to_json(indent=None) + "\n")))
+        logger.info(f"Writing spans to {OTEL_TRACES_FILE}")
+    trace.set_tracer_provider(provider)
+    _provider = provider
+    return True
+
+
+def shutdown_tracing():
+    """Flush spans still queued for export and close the trace file."""
+    global _provider, _trace_file
+    if _provider is not None:
+        _provider.shutdown()
+        _provider = None
+    if _trace_file is not None:
+        _trace_file.close()
+        _trace_file = None
+
+
+class _Series:
+    __slots__ = ("count", "errors", "recent", "total")
+
+    def __init__(self, recent: int):
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.recent: deque = deque(maxlen=recent)
+
+    def quantiles(self) -> list[tuple[float, float]]:
+        ordered = sorted(self.recent)
+        if not ordered:
+            return [(q, 0.0) for q in QUANTILES]
+        return [(q, ordered[min(len(ordered) - 1, int(len(ordered) * q))]) for q in QUANTILES]
+
+
+class StageMetrics:
+    """
+    Latency per stage (graph node, model call, tool, Shopify operation,
+    embedding, vector search, sync stage), token counts per model call and
+    executed vs coalesced calls per single-flight group, rendered in the
+    Prometheus text format by `render`. Quantiles are over the latest
+    METRICS_RECENT_SAMPLES observations of each series; counts and sums
+    cover the life of the process.
+    """
+
+    def __init__(self, recent: int = METRICS_RECENT_SAMPLES):
+        self._lock = threading.Lock()
+        self._recent = recent
+        self.stages: dict[str, _Series] = {}
+        # (node, input|output) -> tokens per call
+        self.tokens: dict[tuple[str, str], _Series] = {}
+        # single-flight group -> [calls executed, calls coalesced onto one in flight]
+        self.flights: dict[str, list[int]] = {}
+
+    def _series(self, table: dict, key) -> _Series:
+        series = table.get(key)
+        if series is None:
+            series = table[key] = _Series(self._recent)
+        return series
+
+    def observe(self, stage: str, seconds: float, ok: bool = True):
+        with self._lock:
+            series = self._series(self.stages, stage)
+            series.count += 1
+            series.total += seconds
+            series.recent.append(seconds)
+            if not ok:
+                series.errors += 1
+
+    def record_tokens(self, node: str, input_tokens: int, output_tokens: int):
+        with self._lock:
+            for kind, tokens in (("input", input_tokens), ("output", output_tokens)):
+                series = self._series(self.tokens, (node, kind))
+                series.count += 1
+                series.total += tokens
+                series.recent.append(tokens)
+
+    def record_flight(self, group: str, coalesced: bool):
+        with self._lock:
+            counts = self.flights.get(group)
+            if counts is None:
+                counts = self.flights[group] = [0, 0]
+            counts[coalesced] += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "stages": {
+                    stage: {"count": s.count, "errors": s.errors, "seconds": s.total, **{f"p{int(q * 100)}": v for q, v in s.quantiles()}}
+                    for stage, s in self.stages.items()
+                },
+                "tokens": {
+                    f"{node}.{kind}": {"calls": s.count, "total": int(s.total), **{f"p{int(q * 100)}": v for q, v in s.quantiles()}}
+                    for (node, kind), s in self.tokens.items()
+                },
+                "singleflight": {group: {"executed": executed, "coalesced": coalesced} for group, (executed, coalesced) in self.flights.items()},
+            }
+
+    def render(self) -> str:
+        lines: list[str] = []
+
+        def summary(name: str, help_text: str, series: dict[str, _Series]):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} summary")
+            for labels, s in series.items():
+                for q, value in s.quantiles():
+                    lines.append(f'{name}{{{labels},quantile="{q}"}} {value:.6g}')
+                lines.append(f"{name}_sum{{{labels}}} {s.total:.6g}")
+                lines.append(f"{name}_count{{{labels}}} {s.count}")
+
+        with self._lock:
+            stages = {f'stage="{_escape(stage)}"': s for stage, s in sorted(self.stages.items())}
+            tokens = {f'node="{_escape(node)}",kind="{kind}"': s for (node, kind), s in sorted(self.tokens.items())}
+            summary("shop_agent_stage_seconds", "Time spent per stage of a request or sync.", stages)
+            lines.append("# HELP shop_agent_stage_errors_total Stage executions that raised.")
+            lines.append("# TYPE shop_agent_stage_errors_total counter")
+            for labels, s in stages.items():
+                lines.append(f"shop_agent_stage_errors_total{{{labels}}} {s.errors}")
+            summary("shop_agent_llm_tokens", "Tokens per model call, as reported by the model or estimated.", tokens)
+            lines.append("# HELP shop_agent_singleflight_calls_total Calls through a single-flight group: executed, or coalesced onto an identical call in flight.")
+            lines.append("# TYPE shop_agent_singleflight_calls_total counter")
+            for group, (executed, coalesced) in sorted(self.flights.items()):
+                lines.append(f'shop_agent_singleflight_calls_total{{group="{_escape(group)}",result="executed"}} {executed}')
+                lines.append(f'shop_agent_singleflight_calls_total{{group="{_escape(group)}",result="coalesced"}} {coalesced}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@contextmanager
+def span(stage: str, **attributes: Any) -> Iterator[trace.Span]:
+    """
+    Trace a block as an OpenTelemetry span named `stage` (nested in the
+    current span, if any) and record its duration under `stage` in
+    stage_metrics. Attributes that are None are left out.
+    """
+    start_time = time.perf_counter()
+    ok = False
+    try:
+        with _tracer.start_as_current_span(stage, attributes={key: value for key, value in attributes.items() if value is not None}) as current:
+            yield current
+        ok = True
+    finally:
+        stage_metrics.observe(stage, time.perf_counter() - start_time, ok=ok)
+
+
+def traced(stage: str) -> Callable[[Callable], Callable]:
+    """Decorator form of `span` for sync and async functions."""
+    def decorate(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_llm_tokens(llm_span: trace.Span | None, node: str, input_tokens: int, output_tokens: int):
+    """Token counts of one model call, on its span and in stage_metrics."""
+    if llm_span is not None:
+        llm_span.set_attribute("llm.input_tokens", input_tokens)
+        llm_span.set_attribute("llm.output_tokens", output_tokens)
+    stage_metrics.record_tokens(node, input_tokens, output_tokens)
+
+
+# Per process: the API's /metrics shows the requests it served; sync workers export spans only
+stage_metrics = StageMetrics()
@@ -0,0 +1,319 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from .cache import search_cache
+from .catalogue import catalogue_snapshots
+from .concurrency import run_blocking
+from .lexical import lexical_indexes
+from .retrieval import RetrievalConfig, retrieval
+from .shopify_client import (
+    InvalidShopDomain,
+    ShopifyClient,
+    close_connection,
+    normalize_shop_domain,
+    shop_file_name,
+)
+
+logger = logging.getLogger(__name__)
+
+SHOP_REGISTRY_BACKEND = os.getenv("SHOP_REGISTRY_BACKEND", "local")
+# The local backend keeps each shop's Admin and Storefront tokens here in plain text, readable
+# only by the service's user. It is meant for development and single-host installs; deployments
+# should use the firestore backend, or point this at a private volume.
+SHOP_REGISTRY_DIR = os.getenv("SHOP_REGISTRY_DIR", "/tmp/shop-agent-shops")
+# Shops kept warm in memory, not counting the pinned warm pool
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "64"))
+# Share of the cache reserved for shops seen more than once
+TENANT_PROTECTED_FRACTION = float(os.getenv("TENANT_PROTECTED_FRACTION", "0.8"))
+# Shops loaded at startup and never evicted
+WARM_SHOPS = [normalize_shop_domain(s) for s in os.getenv("WARM_SHOPS", "").split(",") if s.strip()]
+
+
+class ShopConfig:
+    """
+    Everything we know about one shop: where its products are indexed,
+    its API credentials and its product categories. Index fields left empty
+    fall back to the VERTEX_* environment variables.
+    """
+
+    FIELDS = ("index_id", "endpoint_id", "access_token", "storefront_token", "categories", "warm")
+
+    def __init__(self, shop: str, index_id: str | None = None, endpoint_id: str | None = None, access_token: str | None = None,
+                 storefront_token: str | None = None, categories: list[str] | None = None, warm: bool = False):
+        self.shop = shop
+        self.index_id = index_id
+        self.endpoint_id = endpoint_id
+        self.access_token = access_token
+        self.storefront_token = storefront_token
+        self.categories = categories or []
+        self.warm = warm
+
+    def retrieval_config(self) -> RetrievalConfig:
+        config = RetrievalConfig.from_env()
+        return config._replace(index_id=self.index_id or config.index_id, endpoint_id=self.endpoint_id or config.endpoint_id)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, shop: str, data: dict[str, Any]) -> "ShopConfig":
+        return cls(shop, **{field: data[field] for field in cls.FIELDS if field in data})
+
+
+class LocalShopStore:
+    """
+    Keeps one JSON config file per shop on local disk. The files hold API
+    tokens unencrypted, so the directory and files are private to this user.
+    """
+
+    def __init__(self, directory: str = SHOP_REGISTRY_DIR):
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _path(self, shop: str) -> str:
+        return os.path.join(self.directory, f"{shop_file_name(shop)}.json")
+
+    def load(self, shop: str) -> ShopConfig:
+        path = self._path(shop)
+        if not os.path.exists(path):
+            return ShopConfig(shop)
+        with open(path) as f:
+            return ShopConfig.from_dict(shop, json.load(f))
+
+    def save(self, config: ShopConfig):
+        path = self._path(config.shop)
+        # Per writer: concurrent saves of one shop (e.g. from different processes) must not share a temp file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            json.dump(config.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    def warm_shops(self) -> list[str]:
+        shops = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                shop = "" if name == "default.json" else name[:-5]
+                try:
+                    if self.load(shop).warm:
+                        shops.append(shop)
+                except InvalidShopDomain:
+                    logger.warning(f"Ignoring shop config {name}: not a shop domain")
+        return shops
+
+
+class FirestoreShopStore:
+    """Keeps shop configs in Firestore under shops/{shop}."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def load(self, shop: str) -> ShopConfig:
+        snapshot = self.db.collection("shops").document(shop_file_name(shop)).get()
+        return ShopConfig.from_dict(shop, snapshot.to_dict() or {}) if snapshot.exists else ShopConfig(shop)
+
+    def save(self, config: ShopConfig):
+        self.db.collection("shops").document(shop_file_name(config.shop)).set(config.to_dict(), merge=True)
+
+    def warm_shops(self) -> list[str]:
+        return ["" if doc.id == "default" else doc.id for doc in self.db.collection("shops").where("warm", "==", True).stream()]
+
+
+def create_shop_store(db=None):
+    if SHOP_REGISTRY_BACKEND == "firestore":
+        if db is None:
+            from google.cloud import firestore
+            db = firestore.Client()
+        return FirestoreShopStore(db)
+    return LocalShopStore()
+
+
+class ShopContext:
+    """A shop's config plus the clients built from it, cached while the shop is warm."""
+
+    def __init__(self, config: ShopConfig):
+        self.config = config
+        self.retrieval_config = config.retrieval_config()
+        self._client: ShopifyClient | None = None
+        self.loaded_at = time.time()
+
+    @property
+    def shop(self) -> str:
+        return self.config.shop
+
+    @property
+    def client(self) -> ShopifyClient | None:
+        """Shopify client (Admin API for syncs, Storefront API for carts), or None until the shop has a token."""
+        if self._client is None and (self.config.access_token or self.config.storefront_token):
+            self._client = ShopifyClient(self.shop, self.config.access_token or "", storefront_token=self.config.storefront_token)
+        return self._client
+
+
+class ShopRegistry:
+    """
+    Per-shop configuration and warm state, loaded lazily and evicted by
+    segmented LRU: a shop enters a probation segment on first use and is
+    promoted to the protected segment when used again, so a stream of
+    one-off shops only churns probation and cannot flush the shops that are
+    used steadily. Shops in the warm pool are loaded at startup and never
+    evicted. Evicting a shop drops its vector store, lexical index, catalogue
+    snapshot, search cache and HTTP connections.
+    """
+
+    def __init__(self, store=None, capacity: int = TENANT_CACHE_SIZE, protected_fraction: float = TENANT_PROTECTED_FRACTION, warm_shops: list[str] | None = None):
+        self._store = store
+        self.capacity = max(1, capacity)
+        self.protected_capacity = int(self.capacity * protected_fraction)
+        self.warm_shops = list(WARM_SHOPS if warm_shops is None else warm_shops)
+        self._pinned: dict[str, ShopContext] = {}
+        self._probation: OrderedDict[str, ShopContext] = OrderedDict()
+        self._protected: OrderedDict[str, ShopContext] = OrderedDict()
+        self._loading: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = create_shop_store()
+        return self._store
+
+    def _lookup(self, shop: str) -> ShopContext | None:
+        context = self._pinned.get(shop)
+        if context is not None:
+            return context
+        context = self._protected.get(shop)
+        if context is not None:
+            self._protected.move_to_end(shop)
+            return context
+        context = self._probation.pop(shop, None)
+        if context is not None:
+            # Second use: promote, demoting the coldest protected shop if needed
+            self._protected[shop] = context
+            if len(self._protected) > self.protected_capacity:
+                demoted, demoted_context = self._protected.popitem(last=False)
+                self._probation[demoted] = demoted_context
+        return context
+
+    async def get(self, shop: str) -> ShopContext:
+        """The shop's context, loading its config on first use."""
+        shop = normalize_shop_domain(shop)
+        context = self._lookup(shop)
+        if context is not None:
+            self.hits += 1
+            return context
+
+        # Concurrent first requests for a shop share one load
+        loading = self._loading.get(shop)
+        if loading is not None:
+            return await asyncio.shield(loading)
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._loading[shop] = future
+        try:
+            config = await run_blocking(self.store.load, shop)
+            context = ShopContext(config)
+            if shop in self.warm_shops or config.warm:
+                self._pinned[shop] = context
+            else:
+                self._probation[shop] = context
+                await self._evict()
+            future.set_result(context)
+            return context
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; don't warn about an unretrieved exception
+            future.exception()
+            raise
+        finally:
+            del self._loading[shop]
+
+    async def update(self, shop: str, **fields) -> ShopContext:
+        """
+        Change and persist fields of a shop's config (see ShopConfig.FIELDS),
+        refreshing its cached context. With no fields, just reloads the
+        config from the store.
+        """
+        shop = normalize_shop_domain(shop)
+        config = await run_blocking(self.store.load, shop)
+        for field, value in fields.items():
+            if field not in ShopConfig.FIELDS:
+                raise ValueError(f"Unknown shop config field: {field}")
+            setattr(config, field, value)
+        if fields:
+            await run_blocking(self.store.save, config)
+
+        context = ShopContext(config)
+        for segment in (self._pinned, self._protected, self._probation):
+            if shop in segment:
+                segment[shop] = context
+                break
+        return context
+
+    async def refresh(self, shop: str):
+        """
+        Reload a shop's config and drop its vector store and cached searches,
+        e.g. after another process synced it. Lexical indexes and catalogue
+        snapshots notice new versions on their own.
+        """
+        shop = normalize_shop_domain(shop)
+        search_cache.invalidate(shop)
+        retrieval.evict(shop)
+        if any(shop in segment for segment in (self._pinned, self._protected, self._probation)):
+            await self.update(shop)
+
+    async def _evict(self):
+        while len(self._probation) + len(self._protected) > self.capacity:
+            segment = self._probation if self._probation else self._protected
+            shop, _ = segment.popitem(last=False)
+            self.evictions += 1
+            logger.info(f"Evicting shop {shop} from the warm cache")
+            retrieval.evict(shop)
+            lexical_indexes.evict(shop)
+            catalogue_snapshots.evict(shop)
+            search_cache.invalidate(shop)
+            await close_connection(shop)
+
+    async def warm(self):
+        """Load the warm pool: configs, vector stores, lexical indexes and catalogue snapshots."""
+        shops = set(self.warm_shops)
+        try:
+            shops.update(await run_blocking(self.store.warm_shops))
+        except Exception as e:
+            logger.warning(f"Could not list warm shops: {e}", exc_info=True)
+        self.warm_shops = sorted(shops)
+
+        for shop in self.warm_shops:
+            try:
+                context = await self.get(shop)
+                await retrieval.aget_store(context.retrieval_config, shop=shop)
+                await run_blocking(lexical_indexes.get, shop)
+                await run_blocking(catalogue_snapshots.get, shop)
+                logger.info(f"Warmed shop {shop}")
+            except Exception as e:
+                logger.warning(f"Warm-up failed for {shop}: {e}", exc_info=True)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "pinned": len(self._pinned),
+            "protected": len(self._protected),
+            "probation": len(self._probation),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Shared by every request handled by this process
+shop_registry = ShopRegistry()
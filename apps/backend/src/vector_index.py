@@ -0,0 +1,434 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections.abc import Iterable, Sequence
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "/tmp/shop-agent-index")
+# Below this many vectors brute force is fast enough; above it an IVF index is trained on save
+LOCAL_INDEX_IVF_THRESHOLD = int(os.getenv("LOCAL_INDEX_IVF_THRESHOLD", "20000"))
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "16"))
+
+# Rows scored per matrix multiply in exact search, to bound temporary memory
+_SEARCH_BLOCK_ROWS = 65536
+_CURRENT = "CURRENT"
+
+
+def normalize(vectors) -> np.ndarray:
+    """Unit-normalise rows as float32, so a dot product is the cosine similarity."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k best scores in each row, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate index: rows are clustered with spherical k-means
+    and a query only scores the rows in its `nprobe` closest clusters.
+    """
+
+    def __init__(self, centroids: np.ndarray, assignments: np.ndarray):
+        self.centroids = centroids
+        self.assignments = assignments
+        self._lists: tuple[np.ndarray, np.ndarray] | None = None
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: int | None = None, iterations: int = 10, seed: int = 0) -> "IVFIndex":
+        count = len(vectors)
+        nlist = nlist or max(1, min(4096, int(np.sqrt(count))))
+        rng = np.random.default_rng(seed)
+        # Train on a sample; assigning the remaining rows is a single pass
+        sample = vectors[rng.choice(count, size=min(count, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            sizes = np.bincount(labels, minlength=nlist)
+            empty = sizes == 0
+            # Reseed empty clusters from random sample rows
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = normalize(sums)
+
+        index = cls(centroids, np.empty(0, dtype=np.int32))
+        index.assignments = index.assign(vectors)
+        return index
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), _SEARCH_BLOCK_ROWS):
+            block = vectors[start:start + _SEARCH_BLOCK_ROWS]
+            labels[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return labels
+
+    def invalidate(self):
+        self._lists = None
+
+    def candidates(self, queries: np.ndarray, nprobe: int, count: int) -> list[np.ndarray]:
+        """Row indices (among the first `count`) to score for each query."""
+        if self._lists is None:
+            assignments = self.assignments[:count]
+            order = np.argsort(assignments, kind="stable")
+            offsets = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, offsets)
+        order, offsets = self._lists
+
+        probes = _top_k(queries @ self.centroids.T, nprobe)
+        return [np.concatenate([order[offsets[c]:offsets[c + 1]] for c in row]) for row in probes]
+
+
+class PackedStrings:
+    """
+    Read-only list of UTF-8 strings packed into one byte buffer plus offsets,
+    string i being `buffer[offsets[i]:offsets[i + 1]]`, as in the catalogue
+    snapshot. Loaded memory-mapped, so a string is only read and decoded
+    when it is accessed.
+    """
+
+    def __init__(self, buffer: np.ndarray, offsets: np.ndarray):
+        # Plain views of the maps: indexing np.memmap itself costs several times more per access
+        self._offsets = np.asarray(offsets)
+        self._buffer = np.asarray(buffer).data
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return str(self._buffer[self._offsets[row]:self._offsets[row + 1]], "utf-8")
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+    @staticmethod
+    def save(path: str, name: str, values: Iterable[str]):
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(value) for value in encoded])
+        np.save(os.path.join(path, f"{name}.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        np.save(os.path.join(path, f"{name}_offsets.npy"), offsets)
+
+    @classmethod
+    def load(cls, path: str, name: str) -> "PackedStrings":
+        return cls(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"), np.load(os.path.join(path, f"{name}_offsets.npy"), mmap_mode="r"))
+
+
+class LocalVectorStore:
+    """
+    In-process vector index for one shop, a drop-in for VectorSearchVectorStore
+    (`similarity_search`, `similarity_search_by_vector`,
+    `add_texts_with_embeddings`, `delete`).
+
+    Vectors are kept as a normalised float32 matrix and searched exactly with
+    blocked matrix multiplies; past `ivf_threshold` rows an IVF index is
+    trained on save and used for approximate search. `save()` writes a new
+    version directory and then flips the CURRENT pointer; readers memory-map
+    the files, so worker processes share pages and pick up new versions
+    without rebuilding anything. Ids, texts and metadata (as JSON) are saved
+    as packed string columns and decoded per search hit, not loaded into
+    each process's heap; they become plain lists only in a process that
+    writes to the store.
+    """
+
+    def __init__(self, directory: str, embedding=None, ivf_threshold: int = LOCAL_INDEX_IVF_THRESHOLD, nprobe: int = LOCAL_INDEX_NPROBE):
+        self.directory = directory
+        self.embeddings = embedding
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._vectors: np.ndarray = np.empty((0, 0), dtype=np.float32)
+        self._count = 0
+        # Lists while writing, PackedStrings after a load; metadata is a dict or its JSON
+        self._ids: Sequence[str] = []
+        self._texts: Sequence[str] = []
+        self._metadatas: Sequence[Any] = []
+        # Row of each id, built on first use
+        self._row_map: dict[str, int] | None = {}
+        self._ivf: IVFIndex | None = None
+        self._ivf_trained_count = 0
+        self._version: str | None = None
+        self._dirty = False
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return self._count
+
+    # Persistence
+
+    def _current_version(self) -> str | None:
+        try:
+            with open(os.path.join(self.directory, _CURRENT)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        version = self._current_version()
+        if version is None or version == self._version:
+            return
+        start_time = time.perf_counter()
+        path = os.path.join(self.directory, version)
+        if os.path.exists(os.path.join(path, "records.json")):
+            # Saved before records were packed
+            with open(os.path.join(path, "records.json")) as f:
+                records = json.load(f)
+            self._ids, self._texts, self._metadatas = records["ids"], records["texts"], records["metadatas"]
+        else:
+            with open(os.path.join(path, "meta.json")) as f:
+                records = json.load(f)
+            self._ids, self._texts, self._metadatas = (PackedStrings.load(path, name) for name in ("ids", "texts", "metadatas"))
+
+        # Copy-on-write maps: pages are shared between processes until written to
+        self._vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="c")
+        self._count = len(self._ids)
+        self._row_map = None
+        self._ivf = None
+        if os.path.exists(os.path.join(path, "centroids.npy")):
+            self._ivf = IVFIndex(
+                np.load(os.path.join(path, "centroids.npy"), mmap_mode="r"),
+                np.load(os.path.join(path, "assignments.npy"), mmap_mode="c"),
+            )
+        self._ivf_trained_count = records.get("ivf_trained_count", 0)
+        self._version = version
+        self._dirty = False
+        logger.info(f"Loaded local vector index {path} ({self._count} vectors) in {time.perf_counter() - start_time:.3f}s")
+
+    def refresh(self):
+        """Pick up a version saved by another process, unless we hold unsaved changes."""
+        with self._lock:
+            if not self._dirty:
+                self._load()
+
+    def save(self):
+        """Persist the index as a new version, training or dropping the IVF index as needed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            count = self._count
+            vectors = self._vectors[:count]
+
+            if count < self.ivf_threshold:
+                self._ivf = None
+                self._ivf_trained_count = 0
+            elif self._ivf is None or count > 2 * self._ivf_trained_count:
+                start_time = time.perf_counter()
+                self._ivf = IVFIndex.train(vectors)
+                self._ivf_trained_count = count
+                # Size assignments to the vector buffer so later adds can write into it
+                assignments = np.empty(len(self._vectors), dtype=np.int32)
+                assignments[:count] = self._ivf.assignments
+                self._ivf.assignments = assignments
+                logger.info(f"Trained IVF index with {len(self._ivf.centroids)} lists in {time.perf_counter() - start_time:.2f}s")
+
+            version = f"v{time.time_ns()}"
+            path = os.path.join(self.directory, version)
+            os.makedirs(path)
+            np.save(os.path.join(path, "vectors.npy"), vectors)
+            if self._ivf is not None:
+                np.save(os.path.join(path, "centroids.npy"), self._ivf.centroids)
+                np.save(os.path.join(path, "assignments.npy"), self._ivf.assignments[:count])
+            PackedStrings.save(path, "ids", self._ids)
+            PackedStrings.save(path, "texts", self._texts)
+            PackedStrings.save(path, "metadatas", (metadata if isinstance(metadata, str) else json.dumps(metadata) for metadata in self._metadatas))
+            with open(os.path.join(path, "meta.json"), "w") as f:
+                json.dump({"count": count, "ivf_trained_count": self._ivf_trained_count}, f)
+
+            pointer = os.path.join(self.directory, f"{_CURRENT}.tmp")
+            with open(pointer, "w") as f:
+                f.write(version)
+            os.replace(pointer, os.path.join(self.directory, _CURRENT))
+
+            previous = self._version
+            self._version = version
+            self._dirty = False
+            # Keep the previous version for readers that have not switched yet
+            for name in os.listdir(self.directory):
+                if name.startswith("v") and name not in (version, previous):
+                    shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            logger.info(f"Saved local vector index {path} ({count} vectors)")
+
+    # Records
+
+    @property
+    def _rows(self) -> dict[str, int]:
+        if self._row_map is None:
+            self._row_map = {product_id: row for row, product_id in enumerate(self._ids)}
+        return self._row_map
+
+    def _metadata(self, row: int) -> dict[str, Any]:
+        metadata = self._metadatas[row]
+        return json.loads(metadata) if isinstance(metadata, str) else metadata
+
+    def _materialize(self) -> tuple[list[str], list[str], list[Any]]:
+        """Turn loaded records into lists before writing to them; untouched metadata stays JSON."""
+        ids, texts, metadatas = self._ids, self._texts, self._metadatas
+        if not (isinstance(ids, list) and isinstance(texts, list) and isinstance(metadatas, list)):
+            ids, texts, metadatas = list(ids), list(texts), list(metadatas)
+            self._ids, self._texts, self._metadatas = ids, texts, metadatas
+        return ids, texts, metadatas
+
+    # Writes
+
+    def _reserve(self, rows: int, dimensions: int):
+        capacity = len(self._vectors)
+        writable = not isinstance(self._vectors, np.memmap)
+        if rows <= capacity and writable:
+            return
+        new_capacity = max(rows, capacity * 2, 1024)
+        vectors = np.empty((new_capacity, dimensions), dtype=np.float32)
+        if self._count:
+            vectors[:self._count] = self._vectors[:self._count]
+        self._vectors = vectors
+        if self._ivf is not None:
+            assignments = np.empty(new_capacity, dtype=np.int32)
+            assignments[:self._count] = self._ivf.assignments[:self._count]
+            self._ivf.assignments = assignments
+
+    def add_texts_with_embeddings(self, texts: Sequence[str], embeddings: Sequence[Sequence[float]], metadatas: Sequence[dict[str, Any]] | None = None, ids: Sequence[str] | None = None, **kwargs) -> list[str]:
+        """Insert or overwrite vectors by id. Call `save()` to persist."""
+        vectors = normalize(embeddings)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [str(time.time_ns() + i) for i in range(len(texts))]
+
+        with self._lock:
+            if self._count and vectors.shape[1] != self._vectors.shape[1]:
+                raise ValueError(f"Expected {self._vectors.shape[1]}-dimensional embeddings, got {vectors.shape[1]}")
+            self._reserve(self._count + len(ids), vectors.shape[1])
+            stored_ids, stored_texts, stored_metadatas = self._materialize()
+
+            rows = np.empty(len(ids), dtype=np.int64)
+            for i, (product_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                row = self._rows.get(product_id)
+                if row is None:
+                    row = self._count
+                    self._count += 1
+                    self._rows[product_id] = row
+                    stored_ids.append(product_id)
+                    stored_texts.append(text)
+                    stored_metadatas.append(metadata)
+                else:
+                    stored_texts[row] = text
+                    stored_metadatas[row] = metadata
+                rows[i] = row
+
+            self._vectors[rows] = vectors
+            if self._ivf is not None:
+                self._ivf.assignments[rows] = self._ivf.assign(vectors)
+                self._ivf.invalidate()
+            self._dirty = True
+        return ids
+
+    def delete(self, ids: Sequence[str] | None = None, **kwargs) -> bool:
+        """Remove vectors by id, moving the last row into each freed slot."""
+        with self._lock:
+            stored_ids, stored_texts, stored_metadatas = self._materialize()
+            for product_id in ids or []:
+                row = self._rows.pop(product_id, None)
+                if row is None:
+                    continue
+                last = self._count - 1
+                if row != last:
+                    self._reserve(self._count, self._vectors.shape[1])
+                    self._vectors[row] = self._vectors[last]
+                    if self._ivf is not None:
+                        self._ivf.assignments[row] = self._ivf.assignments[last]
+                    stored_ids[row] = stored_ids[last]
+                    stored_texts[row] = stored_texts[last]
+                    stored_metadatas[row] = stored_metadatas[last]
+                    self._rows[stored_ids[row]] = row
+                stored_ids.pop()
+                stored_texts.pop()
+                stored_metadatas.pop()
+                self._count -= 1
+                self._dirty = True
+            if self._ivf is not None:
+                self._ivf.invalidate()
+        return True
+
+    # Search
+
+    def search(self, queries, k: int = 4, exact: bool = False, rows: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Batched top-k search. Returns (rows, scores), each of shape
+        (len(queries), k'), with k' = min(k, len(self)) and best matches first.
+        Uses the IVF index when there is one, unless `exact` is set.
+        If `rows` is given, only those rows are scored (exactly).
+        """
+        queries = normalize(queries)
+        with self._lock:
+            count = self._count
+            if count == 0 or (rows is not None and len(rows) == 0):
+                empty = np.empty((len(queries), 0))
+                return empty.astype(np.int64), empty.astype(np.float32)
+            if rows is not None:
+                scores = queries @ self._vectors[rows].T
+                top = _top_k(scores, k)
+                return rows[top], np.take_along_axis(scores, top, axis=1)
+            if self._ivf is not None and not exact:
+                return self._search_ivf(queries, k, self._ivf)
+            return self._search_exact(queries, k, count)
+
+    def _search_exact(self, queries: np.ndarray, k: int, count: int) -> tuple[np.ndarray, np.ndarray]:
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, count, _SEARCH_BLOCK_ROWS):
+            block = self._vectors[start:min(start + _SEARCH_BLOCK_ROWS, count)]
+            scores = queries @ block.T
+            top = _top_k(scores, k)
+            # Merge this block's winners with the running best
+            rows = np.concatenate([best_rows, top + start], axis=1)
+            merged = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            keep = _top_k(merged, k)
+            best_rows = np.take_along_axis(rows, keep, axis=1)
+            best_scores = np.take_along_axis(merged, keep, axis=1)
+        return best_rows, best_scores
+
+    def _search_ivf(self, queries: np.ndarray, k: int, ivf: IVFIndex) -> tuple[np.ndarray, np.ndarray]:
+        width = min(k, self._count)
+        all_rows = np.full((len(queries), width), -1, dtype=np.int64)
+        all_scores = np.full((len(queries), width), -np.inf, dtype=np.float32)
+        for i, candidates in enumerate(ivf.candidates(queries, self.nprobe, self._count)):
+            scores = self._vectors[candidates] @ queries[i]
+            top = _top_k(scores[None, :], k)[0]
+            all_rows[i, :len(top)] = candidates[top]
+            all_scores[i, :len(top)] = scores[top]
+        return all_rows, all_scores
+
+    def similarity_search_by_vector_with_score(self, embedding: Sequence[float], k: int = 4, allowed_ids: Iterable[str] | None = None, **kwargs) -> list[tuple[Document, float]]:
+        """`allowed_ids` restricts the search to those products, scoring nothing else."""
+        self.refresh()
+        with self._lock:
+            allowed_rows = None
+            if allowed_ids is not None:
+                allowed_rows = np.sort(np.fromiter((self._rows[i] for i in allowed_ids if i in self._rows), dtype=np.int64))
+            rows, scores = self.search([embedding], k, rows=allowed_rows)
+            return [
+                (Document(page_content=self._texts[row], metadata=self._metadata(row)), float(score))
+                for row, score in zip(rows[0], scores[0]) if row >= 0
+            ]
+
+    def similarity_search_by_vector(self, embedding: Sequence[float], k: int = 4, **kwargs) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> list[Document]:
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k, **kwargs)
@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+# Module-level singletons (shop registry, job store, caches) read their paths
+# at import time, so point them at a scratch directory before src is imported
+_scratch = tempfile.mkdtemp(prefix="shop-agent-tests-")
+for name, directory in (
+    ("SHOP_REGISTRY_DIR", "shops"),
+    ("LEXICAL_INDEX_DIR", "lexical"),
+    ("CATALOGUE_DIR", "catalogue"),
+    ("SYNC_MANIFEST_DIR", "manifests"),
+    ("LOCAL_INDEX_DIR", "vectors"),
+    ("SEARCH_CACHE_DIR", "cache"),
+):
+    os.environ.setdefault(name, os.path.join(_scratch, directory))
+os.environ.setdefault("SYNC_JOBS_PATH", os.path.join(_scratch, "jobs.sqlite"))
+os.environ.setdefault("CHAT_MEMORY_SQLITE_PATH", os.path.join(_scratch, "memory.sqlite"))
+os.environ.setdefault("VERTEX_INDEX_ID", "test-index")
+os.environ.setdefault("VERTEX_ENDPOINT_ID", "test-endpoint")
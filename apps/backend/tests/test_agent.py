@@ -0,0 +1,69 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from benchmarks.fakes import StubChatModel, StubVectorStore
+from src import agent, router
+from src.retrieval import RetrievalConfig, retrieval
+
+model_calls = {"count": 0}
+
+
+class CountingChatModel(StubChatModel):
+    async def _agenerate(self, *args, **kwargs):
+        model_calls["count"] += 1
+        return await super()._agenerate(*args, **kwargs)
+
+
+def test_search_turns_make_one_model_call_and_template_the_reply(monkeypatch):
+    monkeypatch.setattr(agent, "_llm", CountingChatModel(latency=0))
+    monkeypatch.setattr(retrieval, "_override", (StubVectorStore(latency=0), RetrievalConfig.from_env()))
+
+    async def turn(graph, message):
+        before = model_calls["count"]
+        result = await graph.ainvoke({"messages": [HumanMessage(content=message)], "shop_domain": "agent-test.myshopify.com"})
+        return model_calls["count"] - before, result
+
+    calls, result = asyncio.run(turn(agent.compile_agent(mode="single"), "looking for a linen shirt, single"))
+    assert calls == 1
+    reply = result["messages"][-1].content
+    # The stub model would have answered "Here is what I found for you." had it been asked again
+    assert reply.startswith("Here are 5 products I found:")
+    assert len(result["products_found"]) == 5
+
+    # Route through the supervisor model rather than the rule-based fast path
+    monkeypatch.setattr(router, "FAST_ROUTER_ENABLED", False)
+    calls, result = asyncio.run(turn(agent.compile_agent(mode="routed"), "looking for a linen shirt, routed"))
+    # The supervisor's call plus the search node's
+    assert calls == 2
+    assert result["messages"][-1].content.startswith("Here are 5 products I found:")
+
+
+def test_cart_calls_run_as_one_batch_and_results_keep_call_order(monkeypatch):
+    batches = []
+
+    async def apply_cart_operations(shop, cart_id, operations):
+        batches.append(operations)
+        return [{"message": f"{operation.action} {operation.product_id}", "cart": {"id": "gid://shopify/Cart/1"}} for operation in operations]
+
+    monkeypatch.setattr(agent, "apply_cart_operations", apply_cart_operations)
+    add = {"name": "add_to_cart", "args": {"product_id": "p1"}, "id": "call-1"}
+    calls = [
+        add,
+        {"name": "remove_from_cart", "args": {"product_id": "p2"}, "id": "call-2"},
+        # The model repeating a call word for word still gets both applied
+        dict(add),
+        {"name": "search_products", "args": {"query": "socks"}, "id": "call-3"},
+    ]
+    results = asyncio.run(agent.execute_tool_calls({"shop_domain": "", "cart_id": ""}, calls, agent.CART_TOOLS))
+
+    assert [(operation.action, operation.product_id) for operation in batches[0]] == [("add", "p1"), ("remove", "p2"), ("add", "p1")]
+    assert [result.call for result in results] == calls
+    assert [result.output["message"] for result in results[:3]] == ["add p1", "remove p2", "add p1"]
+    # search_products was not allowed in this node
+    assert results[3].error == "Unknown tool search_products"
+
+
+def test_list_content_is_read_as_text():
+    message = AIMessage(content=["search", {"type": "text", "text": "_agent"}])
+    assert agent.message_text(message) == "search_agent"
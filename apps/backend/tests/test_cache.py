@@ -0,0 +1,108 @@
+import asyncio
+import threading
+
+from src.cache import (
+    FileCacheBackend,
+    MemoryCacheBackend,
+    SearchCache,
+    SemanticIndex,
+    normalize_query,
+)
+
+SHOP = "cache-test.myshopify.com"
+RED_DRESS = [1.0, 0.0, 0.0]
+# Cosine similarity 0.99 with RED_DRESS
+CRIMSON_DRESS = [0.99, 0.141, 0.0]
+SOFA = [0.0, 0.0, 1.0]
+
+
+def test_normalized_queries_keep_their_words_in_order():
+    assert normalize_query("Red dresses, under $50!") == "red dresses under 50"
+    assert normalize_query("shirt over jacket") != normalize_query("jacket over shirt")
+
+
+def test_a_lookup_counts_once_whichever_level_answers():
+    cache = SearchCache(MemoryCacheBackend(), threshold=0.95)
+    cache.put(SHOP, "Red dress", ["dress-1"], embedding=RED_DRESS)
+
+    assert cache.get_exact(SHOP, "red   DRESS!") == ["dress-1"]
+    assert cache.get_exact(SHOP, "crimson dress") is None
+    assert cache.get_semantic(SHOP, CRIMSON_DRESS) == ["dress-1"]
+    assert cache.get_exact(SHOP, "sofa") is None
+    assert cache.get_semantic(SHOP, SOFA) is None
+    # Another shop shares nothing
+    assert cache.get_exact("other.myshopify.com", "red dress") is None
+
+    assert cache.stats() == {"exact_hits": 1, "semantic_hits": 1, "misses": 2, "hit_rate": 0.5}
+
+
+def test_semantic_rows_follow_the_backends_evictions():
+    cache = SearchCache(MemoryCacheBackend(max_entries=2))
+    cache.put(SHOP, "red dress", ["dress-1"], embedding=RED_DRESS)
+    cache.put(SHOP, "sofa", ["sofa-1"], embedding=SOFA)
+    cache.put(SHOP, "blue dress", ["dress-2"], embedding=[0.0, 1.0, 0.0])
+
+    assert len(cache._indexes[SHOP]) == 2
+    assert cache.get_semantic(SHOP, RED_DRESS) is None
+    assert cache.get_semantic(SHOP, SOFA) == ["sofa-1"]
+
+
+def test_removing_a_row_moves_the_last_one_into_its_place():
+    index = SemanticIndex(capacity=1)
+    for key, embedding in (("red", RED_DRESS), ("sofa", SOFA), ("crimson", CRIMSON_DRESS)):
+        index.add(key, embedding)
+    index.remove("red")
+    assert index.keys == ["crimson", "sofa"]
+    assert index.nearest(RED_DRESS, 0.9) == ["crimson"]
+    assert index.nearest(SOFA, 0.9) == ["sofa"]
+
+
+def test_invalidate_drops_one_shops_entries():
+    cache = SearchCache(MemoryCacheBackend())
+    cache.put(SHOP, "red dress", ["dress-1"], embedding=RED_DRESS)
+    cache.put("other.myshopify.com", "red dress", ["dress-9"])
+    cache.invalidate(SHOP)
+    assert cache.get_exact(SHOP, "red dress") is None
+    assert cache.get_semantic(SHOP, RED_DRESS) is None
+    assert cache.get_exact("other.myshopify.com", "red dress") == ["dress-9"]
+
+
+def test_file_backends_merge_each_others_entries(tmp_path):
+    first = FileCacheBackend(str(tmp_path), flush_seconds=60)
+    second = FileCacheBackend(str(tmp_path), flush_seconds=60)
+    first.set("shop:exact", "red dress", ["dress-1"], ttl=60)
+    second.set("shop:exact", "sofa", ["sofa-1"], ttl=60)
+    first.flush()
+    second.flush()
+
+    restarted = FileCacheBackend(str(tmp_path))
+    assert dict(restarted.items("shop:exact")) == {"red dress": ["dress-1"], "sofa": ["sofa-1"]}
+
+    # A cleared namespace is written out empty rather than merged back in
+    restarted.clear("shop:exact")
+    restarted.flush()
+    assert FileCacheBackend(str(tmp_path)).items("shop:exact") == []
+
+
+def test_file_backed_lookups_read_off_the_event_loop(tmp_path, monkeypatch):
+    writer = SearchCache(FileCacheBackend(str(tmp_path)))
+    writer.put(SHOP, "red dress", ["dress-1"], embedding=RED_DRESS)
+    writer.backend.flush()
+
+    backend = FileCacheBackend(str(tmp_path))
+    readers = []
+    read = backend._read
+
+    def recording_read(namespace):
+        readers.append(threading.current_thread())
+        return read(namespace)
+
+    monkeypatch.setattr(backend, "_read", recording_read)
+    cache = SearchCache(backend)
+
+    async def lookups():
+        return await cache.aget_exact(SHOP, "red dress"), await cache.aget_semantic(SHOP, CRIMSON_DRESS)
+
+    assert asyncio.run(lookups()) == (["dress-1"], ["dress-1"])
+    assert len(readers) == 2
+    assert threading.main_thread() not in readers
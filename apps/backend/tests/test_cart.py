@@ -0,0 +1,137 @@
+import asyncio
+import subprocess
+import sys
+
+import httpx
+import pytest
+
+from benchmarks.cart_batching import in_stock_products
+from benchmarks.fetch_memory import free_port, wait_for_port
+from src.cart import CartOperation, CartService
+from src.catalogue import catalogue_snapshots
+from src.shopify_client import (
+    CartNotFoundError,
+    ShopifyAPIError,
+    ShopifyClient,
+    close_connections,
+)
+
+SHOP = "cart-test.myshopify.com"
+
+
+@pytest.fixture(scope="module")
+def storefront():
+    """The local mock Storefront server, and the URL of its request counters."""
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.mock_storefront", "--port", str(port)])
+    try:
+        wait_for_port(port)
+        yield f"http://127.0.0.1:{port}/api/2024-01/graphql.json", f"http://127.0.0.1:{port}/stats"
+    finally:
+        server.terminate()
+        server.wait()
+
+
+@pytest.fixture(scope="module")
+def products():
+    records = in_stock_products(3)
+    catalogue_snapshots.save(SHOP, records)
+    return list(records)
+
+
+def run(storefront, operations, cart_id="", storefront_token="token"):
+    """Apply `operations` through a CartService and return (outcome, mutations sent by name)."""
+    url, stats_url = storefront
+    client = ShopifyClient(SHOP, "", storefront_token=storefront_token, storefront_url=url)
+
+    async def get_client(shop):
+        return client
+
+    async def main():
+        try:
+            async with httpx.AsyncClient() as http:
+                before = (await http.get(stats_url)).json()
+                outcome = await CartService(get_client).apply(SHOP, cart_id, operations)
+                after = (await http.get(stats_url)).json()
+            return outcome, {name: count - before.get(name, 0) for name, count in after.items() if name != "requests" and count != before.get(name, 0)}
+        finally:
+            await close_connections()
+
+    return asyncio.run(main())
+
+
+def test_adds_in_one_turn_are_one_mutation(storefront, products):
+    first, second, _ = products
+    outcome, mutations = run(storefront, [CartOperation("add", first), CartOperation("add", second, 2), CartOperation("add", first)])
+    assert mutations == {"cartCreate": 1}
+    assert outcome.cart["total_quantity"] == 4
+    # The same product twice becomes one line
+    assert sorted(line["quantity"] for line in outcome.cart["lines"]) == [2, 2]
+    assert outcome.messages[1].startswith("Added 2 x ")
+
+
+def test_adding_to_an_expired_cart_starts_a_new_one(storefront, products):
+    outcome, mutations = run(storefront, [CartOperation("add", products[0])], cart_id="gid://shopify/Cart/999")
+    assert mutations == {"cartLinesAdd": 1, "cartCreate": 1}
+    assert outcome.cart["id"] != "gid://shopify/Cart/999"
+    assert outcome.cart["total_quantity"] == 1
+
+
+def test_updates_and_removals_are_batched_per_kind(storefront, products):
+    first, second, third = products
+    created, _ = run(storefront, [CartOperation("add", first), CartOperation("add", second), CartOperation("add", third)])
+    operations = [
+        CartOperation("update", first, 3),
+        CartOperation("remove", second),
+        CartOperation("update", third, 0),
+        CartOperation("remove", "gid://shopify/Product/999999"),
+    ]
+    outcome, mutations = run(storefront, operations, cart_id=created.cart["id"])
+    # The cart was fetched once to find the lines, then one mutation per kind
+    assert mutations == {"cart": 1, "cartLinesUpdate": 1, "cartLinesRemove": 1}
+    assert [line["product_id"] for line in outcome.cart["lines"]] == [first]
+    assert outcome.cart["total_quantity"] == 3
+    assert outcome.messages[0].startswith("Updated ")
+    assert outcome.messages[1].startswith("Removed ") and outcome.messages[2].startswith("Removed ")
+    assert outcome.messages[3] == "That item isn't in your cart."
+
+
+def test_changing_an_expired_cart_asks_to_start_again(storefront, products):
+    outcome, _ = run(storefront, [CartOperation("remove", products[0])], cart_id="gid://shopify/Cart/999")
+    assert outcome.cart is None
+    assert outcome.messages == ["Your cart has expired. Add the items again to start a new one."]
+
+
+def test_products_that_cannot_be_added_send_nothing(storefront, products):
+    outcome, mutations = run(storefront, [CartOperation("add", "gid://shopify/Product/999999"), CartOperation("add", products[0], 0)])
+    assert mutations == {}
+    assert outcome.messages == ["Sorry, I couldn't find that product in the store.", "Please tell me how many you'd like to add."]
+
+
+def test_missing_storefront_token_fails_the_operation(storefront, products):
+    outcome, mutations = run(storefront, [CartOperation("add", products[0])], storefront_token=None)
+    assert mutations == {}
+    assert outcome.cart is None
+    assert outcome.messages == ["Sorry, I couldn't add that to your cart right now."]
+
+
+def test_user_errors_map_to_client_exceptions(storefront):
+    url, _ = storefront
+    client = ShopifyClient(SHOP, "", storefront_token="token", storefront_url=url)
+
+    async def main():
+        try:
+            cart = await client.cart_create([])
+            with pytest.raises(CartNotFoundError):
+                await client.cart_lines_add("gid://shopify/Cart/999", [])
+            # A userError on anything but the cart is a plain API error: the cart itself is fine
+            with pytest.raises(ShopifyAPIError, match="merchandise line does not exist") as error:
+                await client.cart_lines_update(cart["id"], [{"id": "gid://shopify/CartLine/missing", "quantity": 1}])
+            assert error.type is ShopifyAPIError
+            assert await client.fetch_cart("gid://shopify/Cart/999") is None
+            with pytest.raises(ShopifyAPIError, match="HTTP 401"):
+                await ShopifyClient(SHOP, "", storefront_url=url).fetch_cart(cart["id"])
+        finally:
+            await close_connections()
+
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from src import main
+from src.concurrency import SingleFlight
+from src.jobs import JobStore
+from src.telemetry import stage_metrics
+
+
+def test_identical_calls_in_flight_share_one_execution():
+    flights = SingleFlight("test-coalesce")
+    calls = []
+
+    async def fetch(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def burst():
+        return await asyncio.gather(*(flights.do("key", fetch, 21) for _ in range(5)), flights.do("other", fetch, 1))
+
+    results = asyncio.run(burst())
+    assert calls == [21, 1]
+    assert results == [(42, False)] + [(42, True)] * 4 + [(2, False)]
+    assert flights.in_flight() == 0
+    assert stage_metrics.snapshot()["singleflight"]["test-coalesce"] == {"executed": 2, "coalesced": 4}
+
+    # Nothing is remembered once a call has finished
+    assert asyncio.run(flights.do("key", fetch, 5)) == (10, False)
+
+
+def test_an_error_reaches_every_waiting_caller():
+    flights = SingleFlight("test-errors")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    async def burst():
+        return await asyncio.gather(*(flights.do("key", fail) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(burst())
+    assert [str(error) for error in errors] == ["upstream down"] * 3
+    assert flights.in_flight() == 0
+
+
+def test_a_caller_giving_up_does_not_cancel_the_call_for_the_others():
+    flights = SingleFlight("test-cancel")
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(flights.do("key", slow))
+        second = asyncio.ensure_future(flights.do("key", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == ("done", True)
+
+
+def test_sync_requests_coalesce_by_shop_without_their_tokens(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "sync_jobs", JobStore(str(tmp_path / "jobs.sqlite")))
+    keys, stored = [], []
+
+    async def update(shop, **credentials):
+        keys.extend(main.sync_flights._calls)
+        stored.append(credentials)
+        await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(main.shop_registry, "update", update)
+
+    async def burst():
+        requests = [
+            main.SyncRequest(shop_url="https://Sync-Test.myshopify.com", api_token="shpat_first"),
+            main.SyncRequest(shop_url="sync-test.myshopify.com", api_token="shpat_second"),
+            main.SyncRequest(shop_url="sync-test.myshopify.com", api_token="shpat_first", full_rebuild=True),
+        ]
+        return await asyncio.gather(*(main.sync_endpoint(request) for request in requests))
+
+    first, second, rebuild = asyncio.run(burst())
+    assert first["status"] == "accepted"
+    assert second == {**first, "status": "already_queued", "message": "A sync of this shop is already queued"}
+    # A full rebuild is its own flight, which finds the job queued and upgrades it
+    assert rebuild["job_id"] == first["job_id"] and rebuild["status"] == "already_queued"
+    assert main.sync_jobs.get(first["job_id"]).full_rebuild
+    assert stored == [{"access_token": "shpat_first"}, {"access_token": "shpat_first"}]
+    assert set(keys) == {("sync-test.myshopify.com", False), ("sync-test.myshopify.com", True)}
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from src.hybrid import hybrid_search, merge_filters, parse_filters
+from src.lexical import LexicalIndex, SearchFilters
+
+CATALOGUE = {
+    "tv-55": {"text": "55 inch 4K TV", "metadata": {"id": "tv-55", "title": "55 inch 4K TV", "category": "TVs", "vendor": "Vizio", "price": "899.00"}},
+    "tv-75": {"text": "75 inch OLED TV", "metadata": {"id": "tv-75", "title": "75 inch OLED TV", "category": "TVs", "vendor": "Sony", "price": "1499.00"}},
+    "dress": {"text": "Red evening dress", "metadata": {"id": "dress", "title": "Red evening dress", "category": "Dress", "vendor": "Acme", "price": "80.00"}},
+    "pumps": {"text": "Red dress shoes, leather pumps", "metadata": {"id": "pumps", "title": "Red dress shoes", "category": "Shoes", "vendor": "Acme", "price": "60.00"}},
+}
+
+
+def search(query: str):
+    index = LexicalIndex.build(CATALOGUE)
+    filters, lexical_query, boosts = parse_filters(query, index)
+    results = asyncio.run(hybrid_search("shop.myshopify.com", lexical_query, None, filters, index, boosts=boosts))
+    return [product["id"] for product in results]
+
+
+@pytest.mark.parametrize("query, min_price, max_price, remaining", [
+    ("red dress under $50", None, 50.0, "red dress"),
+    ("tv under $1,000", None, 1000.0, "tv"),
+    ("laptop under $1,500.00", None, 1500.0, "laptop"),
+    ("sofa between $1,000 and $2,500", 1000.0, 2500.0, "sofa"),
+    ("shoes from $20 to $60", 20.0, 60.0, "shoes"),
+    ("$20-$60 sneakers", 20.0, 60.0, "sneakers"),
+    ("30-40 dollars shirts", 30.0, 40.0, "shirts"),
+    ("mugs price 20 - 40", 20.0, 40.0, "mugs price"),
+    ("budget of 30 for a gift", None, 30.0, "for a gift"),
+    ("jackets over 100 euros", 100.0, None, "jackets"),
+])
+def test_prices_are_parsed_out_of_the_query(query, min_price, max_price, remaining):
+    filters, lexical_query, _ = parse_filters(query)
+    assert (filters.min_price, filters.max_price) == (min_price, max_price)
+    assert lexical_query == remaining
+
+
+@pytest.mark.parametrize("query", [
+    "shoes from 2023 collection",
+    "from 2023 to 2024 collection",
+    "tv over 40 inch",
+    "a 2 pack of socks at least 3",
+    "usb cable sku 12-0",
+    "boots size 8-10",
+    "red dress under 50.",
+])
+def test_numbers_that_are_not_clearly_prices_stay_in_the_query(query):
+    filters, lexical_query, _ = parse_filters(query)
+    assert filters.is_empty
+    assert lexical_query == query
+
+
+def test_contradictory_limits_are_dropped():
+    filters, lexical_query, _ = parse_filters("tv under $50 over $100")
+    assert filters.is_empty
+    assert lexical_query == "tv"
+
+
+def test_in_stock_is_a_filter():
+    filters, lexical_query, _ = parse_filters("boots in stock under $80")
+    assert filters == SearchFilters(max_price=80.0, available_only=True)
+    assert lexical_query == "boots"
+
+
+def test_price_with_thousands_separator_filters_the_catalogue():
+    assert search("tv under $1,000") == ["tv-55"]
+    assert search("tv over $1,000") == ["tv-75"]
+
+
+def test_contradictory_limits_still_find_products():
+    assert set(search("tv under $50 over $100")) == {"tv-55", "tv-75"}
+
+
+def test_a_category_named_in_the_query_boosts_without_excluding():
+    filters, _, boosts = parse_filters("red dress shoes", LexicalIndex.build(CATALOGUE))
+    assert filters.is_empty and boosts.category == "dress"
+    assert {"dress", "pumps"} <= set(search("red dress shoes"))
+
+
+def test_explicit_filters_take_precedence():
+    parsed = SearchFilters(max_price=50.0, available_only=True)
+    explicit = SearchFilters(max_price=30.0, category="shoes")
+    assert merge_filters(parsed, explicit) == SearchFilters(category="shoes", max_price=30.0, available_only=True)
@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import main
+from src.jobs import JobStore, JobStoreUnavailable, SyncProgress
+
+SHOP = "jobs-test.myshopify.com"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite"), max_attempts=2, retry_seconds=30, retry_max_seconds=600)
+
+
+def test_a_shop_has_one_queued_job_which_can_become_a_full_rebuild(store):
+    job, created = store.enqueue("https://Jobs-Test.myshopify.com/")
+    again, created_again = store.enqueue(SHOP, full_rebuild=True)
+    assert created and not created_again
+    assert again.id == job.id and again.shop == SHOP and again.full_rebuild
+
+    # A shop whose sync is running gets that job back rather than a second one
+    store.claim("worker-1")
+    running, created = store.enqueue(SHOP)
+    assert not created and running.id == job.id and running.status == "running" and running.full_rebuild
+
+
+def test_an_expired_lease_is_taken_over_and_the_old_worker_fenced_off(store):
+    job, _ = store.enqueue(SHOP)
+    claimed = store.claim("worker-1", lease_seconds=0.01)
+    assert claimed.id == job.id and claimed.attempts == 1
+    assert store.claim("worker-2") is None
+    products = {"gid://shopify/Product/1": {"hash": "abc"}}
+    assert store.checkpoint(job.id, "worker-1", "indexing", {"indexed": 1}, {"cursor": "c1"}, products, lease_seconds=0.01)
+    time.sleep(0.02)
+
+    resumed = store.claim("worker-2")
+    assert resumed.id == job.id and resumed.attempts == 2
+    assert (resumed.stage, resumed.checkpoint, resumed.counts) == ("indexing", {"cursor": "c1"}, {"indexed": 1})
+    assert store.load_products(job.id) == products
+    # The first worker woke up again: none of its writes land
+    assert not store.checkpoint(job.id, "worker-1", "saving", {}, {}, {})
+    assert store.fail(job.id, "worker-1", "late") is None
+    assert not store.complete(job.id, "worker-1", {})
+
+    assert store.complete(job.id, "worker-2", {"indexed": 2})
+    assert store.get(job.id).status == "succeeded"
+    assert store.load_products(job.id) == {}
+
+
+def test_a_failed_job_waits_out_its_backoff_then_fails_for_good(store):
+    job, _ = store.enqueue(SHOP)
+    store.claim("worker-1")
+    assert store.fail(job.id, "worker-1", "boom") == "queued"
+    assert store.get(job.id).error == "boom"
+    assert store.claim("worker-2") is None
+
+    store._connect().execute("UPDATE sync_jobs SET run_after = ? WHERE id = ?", (time.time() - 1, job.id))
+    assert store.claim("worker-2").attempts == 2
+    assert store.fail(job.id, "worker-2", "boom again") == "failed"
+    assert store.get(job.id).status == "failed"
+
+
+def test_a_released_job_keeps_its_attempt(store):
+    job, _ = store.enqueue(SHOP)
+    store.claim("worker-1")
+    store.release(job.id, "worker-1")
+    assert store.get(job.id).status == "queued"
+    assert store.claim("worker-2").attempts == 1
+
+
+def test_the_checkpointed_cursor_waits_for_every_earlier_page(store):
+    job, _ = store.enqueue(SHOP)
+    job = store.claim("worker-1")
+    progress = SyncProgress(store, job, "worker-1")
+    progress.start(updated_since=None)
+    progress.page_fetched("c1", ["p1", "p2"])
+    progress.page_fetched("c2", ["p3"])
+
+    progress.product_done("p3", {}, {}, {})
+    progress.product_done("p1", {}, {}, {})
+    assert progress.checkpoint["cursor"] is None
+    progress.product_done("p2", {}, {}, {})
+    assert progress.checkpoint["cursor"] == "c2"
+
+    asyncio.run(progress.flush(force=True))
+    assert set(store.load_products(job.id)) == {"p1", "p2", "p3"}
+    assert store.get(job.id).checkpoint == {"updated_since": None, "cursor": "c2"}
+
+
+def test_cloud_run_refuses_a_queue_under_tmp(monkeypatch):
+    monkeypatch.setenv("K_SERVICE", "shop-agent")
+    store = JobStore("/tmp/shop-agent-jobs-test.sqlite")
+    with pytest.raises(JobStoreUnavailable):
+        store.get("job")
+    assert JobStore("/tmp/shop-agent-jobs-test.sqlite", allow_ephemeral=True).unavailable_reason() is None
+
+    monkeypatch.setattr(main, "sync_jobs", store)
+    client = TestClient(main.app)
+    response = client.post("/sync", json={"shop_url": SHOP, "api_token": "token"})
+    assert response.status_code == 503
+    assert "SYNC_JOBS_PATH" in response.json()["detail"]
+    assert client.get("/sync/job").status_code == 503
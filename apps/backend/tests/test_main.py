@@ -0,0 +1,36 @@
+from fastapi.testclient import TestClient
+from langgraph.checkpoint.memory import InMemorySaver
+
+from benchmarks.fakes import StubChatModel, StubVectorStore
+from src import agent, main
+from src.memory import session_lock
+from src.retrieval import RetrievalConfig, retrieval
+
+CHAT = {"message": "looking for a linen shirt", "shop_domain": "main-test.myshopify.com", "session_id": "session-1"}
+
+
+def test_agent_load_failures_are_reported_as_errors(monkeypatch):
+    async def get_agent():
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(main, "get_agent", get_agent)
+    client = TestClient(main.app)
+    for path in ("/chat", "/chat/stream"):
+        response = client.post(path, json=CHAT)
+        assert response.status_code == 500
+        assert response.json()["detail"] == "model unavailable"
+
+
+def test_summaries_are_scheduled_before_the_session_is_unlocked(monkeypatch):
+    monkeypatch.setattr(agent, "_llm", StubChatModel(latency=0))
+    monkeypatch.setattr(retrieval, "_override", (StubVectorStore(latency=0), RetrievalConfig.from_env()))
+    monkeypatch.setattr(main, "conversation_checkpointer", InMemorySaver())
+    monkeypatch.setattr(main, "agent_graphs", {})
+    held = []
+    monkeypatch.setattr(agent.summarizer, "schedule", lambda graph, config: held.append(session_lock(config).locked()))
+
+    client = TestClient(main.app)
+    assert client.post("/chat", json=CHAT).status_code == 200
+    with client.stream("POST", "/chat/stream", json=CHAT) as response:
+        assert "event: done" in response.read().decode()
+    assert held == [True, True]
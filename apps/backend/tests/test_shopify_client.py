@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from src import shopify_client
+from src.shopify_client import (
+    ShopifyAPIError,
+    ShopifyClient,
+    close_connections,
+    get_connection,
+    updated_since_filter,
+)
+
+SHOP = "client-test.myshopify.com"
+HOSTILE = '2024-01-01" OR status:\\"draft'
+
+
+def run(handler, request):
+    """Run `request(client)` with Shopify answered by `handler`; returns its result and the pooled connection."""
+    async def main():
+        connection = get_connection(SHOP)
+        await connection.client.aclose()
+        connection.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await request(ShopifyClient(SHOP, "token", storefront_token="token")), connection
+        finally:
+            await close_connections()
+
+    return asyncio.run(main())
+
+
+def test_updated_since_is_a_quoted_search_value():
+    assert updated_since_filter("2024-01-01T00:00:00Z") == 'updated_at:>"2024-01-01T00:00:00Z"'
+    # Quotes and backslashes in the value stay inside it
+    assert updated_since_filter(HOSTILE) == 'updated_at:>"2024-01-01\\" OR status:\\\\\\"draft"'
+
+
+def test_paginated_sync_sends_the_filter_as_a_variable():
+    sent = []
+
+    def handler(request):
+        sent.append(json.loads(request.content)["variables"])
+        return httpx.Response(200, json={"data": {"products": {"edges": [], "pageInfo": {"hasNextPage": False}}}})
+
+    products, _ = run(handler, lambda client: client.fetch_all_products(updated_since=HOSTILE))
+    assert products == []
+    assert sent == [{"cursor": None, "query": updated_since_filter(HOSTILE)}]
+
+
+def test_bulk_export_embeds_the_filter_as_a_graphql_string(monkeypatch):
+    queries = []
+
+    async def run_bulk_query(self, query):
+        queries.append(query)
+
+    monkeypatch.setattr(ShopifyClient, "run_bulk_query", run_bulk_query)
+
+    async def export(client):
+        return [page async for page in client.iter_product_pages_bulk(HOSTILE)]
+
+    pages, _ = run(lambda request: httpx.Response(500), export)
+    assert pages == []
+    literal = queries[0].split("products(query: ", 1)[1].split(") {", 1)[0]
+    assert json.loads(literal) == updated_since_filter(HOSTILE)
+
+
+def test_non_json_responses_are_retried_like_server_errors(monkeypatch):
+    monkeypatch.setattr(shopify_client.random, "uniform", lambda low, high: 0.0)
+    responses = [
+        httpx.Response(200, text="<html>upstream timeout</html>"),
+        httpx.Response(200, json={"data": {"shop": {"name": "Test"}}}),
+    ]
+
+    data, connection = run(lambda request: responses.pop(0), lambda client: client.graphql("{ shop { name } }"))
+    assert data == {"shop": {"name": "Test"}}
+    assert connection.retries == 1
+
+
+def test_non_json_responses_to_mutations_are_not_retried(monkeypatch):
+    monkeypatch.setattr(shopify_client.random, "uniform", lambda low, high: 0.0)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, text="<html>upstream timeout</html>")
+
+    with pytest.raises(ShopifyAPIError, match="non-JSON body"):
+        run(handler, lambda client: client.cart_create([]))
+    assert len(calls) == 1
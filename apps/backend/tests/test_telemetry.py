@@ -0,0 +1,72 @@
+import json
+
+from src import telemetry
+from src.telemetry import StageMetrics
+
+
+def test_render_writes_prometheus_text_format():
+    metrics = StageMetrics(recent=100)
+    for seconds in (0.1, 0.2, 0.3, 0.4):
+        metrics.observe("tool.search", seconds)
+    metrics.observe("tool.search", 0.5, ok=False)
+    metrics.record_tokens("search", 120, 30)
+    metrics.record_flight("search", coalesced=False)
+    metrics.record_flight("search", coalesced=True)
+    metrics.record_flight("search", coalesced=True)
+
+    lines = metrics.render().splitlines()
+    assert lines[:2] == [
+        "# HELP shop_agent_stage_seconds Time spent per stage of a request or sync.",
+        "# TYPE shop_agent_stage_seconds summary",
+    ]
+    assert 'shop_agent_stage_seconds{stage="tool.search",quantile="0.5"} 0.3' in lines
+    assert 'shop_agent_stage_seconds_sum{stage="tool.search"} 1.5' in lines
+    assert 'shop_agent_stage_seconds_count{stage="tool.search"} 5' in lines
+    assert "# TYPE shop_agent_stage_errors_total counter" in lines
+    assert 'shop_agent_stage_errors_total{stage="tool.search"} 1' in lines
+    assert "# TYPE shop_agent_llm_tokens summary" in lines
+    assert 'shop_agent_llm_tokens_sum{node="search",kind="input"} 120' in lines
+    assert 'shop_agent_llm_tokens_count{node="search",kind="output"} 1' in lines
+    assert "# TYPE shop_agent_singleflight_calls_total counter" in lines
+    assert 'shop_agent_singleflight_calls_total{group="search",result="executed"} 1' in lines
+    assert 'shop_agent_singleflight_calls_total{group="search",result="coalesced"} 2' in lines
+
+
+def test_render_escapes_label_values():
+    metrics = StageMetrics()
+    metrics.observe('odd "stage"\\name', 1.0)
+    assert 'shop_agent_stage_seconds_count{stage="odd \\"stage\\"\\\\name"} 1' in metrics.render().splitlines()
+
+
+def test_every_sample_line_follows_its_type_declaration():
+    metrics = StageMetrics()
+    metrics.observe("request.chat", 0.25)
+    metrics.record_tokens("supervisor", 10, 2)
+    metrics.record_flight("sync", coalesced=False)
+    text = metrics.render()
+    assert text.endswith("\n")
+    declared = set()
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            declared.add(line.split()[2])
+        elif not line.startswith("#"):
+            name = line.split("{", 1)[0]
+            assert name in declared or name.rsplit("_", 1)[0] in declared, line
+
+
+def test_spans_go_to_the_trace_file_until_shutdown(tmp_path, monkeypatch):
+    path = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(telemetry, "OTEL_EXPORTER_OTLP_ENDPOINT", "")
+    monkeypatch.setattr(telemetry, "OTEL_TRACES_FILE", str(path))
+    assert telemetry.configure_tracing("test-service")
+    trace_file = telemetry._trace_file
+    try:
+        with telemetry.span("tool.search", shop="shop.myshopify.com"):
+            pass
+    finally:
+        telemetry.shutdown_tracing()
+
+    assert trace_file.closed and telemetry._trace_file is None
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [item["name"] for item in spans] == ["tool.search"]
+    assert spans[0]["attributes"] == {"shop": "shop.myshopify.com"}
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import stat
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from src.catalogue import CatalogueStore
+from src.lexical import LexicalIndexStore
+from src.main import app
+from src.manifest import LocalManifestStore
+from src.retrieval import local_index_path
+from src.shopify_client import InvalidShopDomain, get_connection, normalize_shop_domain
+from src.tenants import LocalShopStore, ShopConfig, ShopRegistry
+
+TRAVERSAL = "https://evil.myshopify.com/../../../tmp/pwned"
+
+
+@pytest.mark.parametrize("shop_url, expected", [
+    ("https://My-Shop.myshopify.com/", "my-shop.myshopify.com"),
+    ("http://shop1.myshopify.com", "shop1.myshopify.com"),
+    (" shop.myshopify.com ", "shop.myshopify.com"),
+    ("", ""),
+])
+def test_normalize_shop_domain_accepts_shopify_domains(shop_url, expected):
+    assert normalize_shop_domain(shop_url) == expected
+
+
+@pytest.mark.parametrize("shop_url", [
+    TRAVERSAL,
+    "../shop.myshopify.com",
+    "shop.myshopify.com/admin",
+    "shop.myshopify.com.evil.com",
+    "-shop.myshopify.com",
+    "example.com",
+    "shop.myshopify.com:8080",
+])
+def test_normalize_shop_domain_rejects_anything_else(shop_url):
+    with pytest.raises(InvalidShopDomain):
+        normalize_shop_domain(shop_url)
+
+
+def test_path_builders_refuse_unvalidated_shops(tmp_path):
+    builders = [
+        LocalShopStore(str(tmp_path / "shops"))._path,
+        LocalManifestStore(str(tmp_path / "manifests"))._path,
+        LexicalIndexStore(str(tmp_path / "lexical"))._path,
+        CatalogueStore(str(tmp_path / "catalogue"))._path,
+        lambda shop: local_index_path(str(tmp_path / "vectors"), shop),
+    ]
+    for path in builders:
+        assert os.path.dirname(path("shop.myshopify.com")).startswith(str(tmp_path))
+        assert os.path.basename(path("")).startswith("default")
+        with pytest.raises(InvalidShopDomain):
+            path("evil.myshopify.com/../../pwned")
+
+
+def test_default_shop_is_listed_as_the_empty_domain(tmp_path):
+    store = LocalShopStore(str(tmp_path))
+    store.save(ShopConfig("", warm=True))
+    store.save(ShopConfig("warm.myshopify.com", warm=True))
+    store.save(ShopConfig("cold.myshopify.com"))
+    assert sorted(store.warm_shops()) == ["", "warm.myshopify.com"]
+
+
+def test_endpoints_reject_invalid_shops_before_touching_disk(tmp_path):
+    client = TestClient(app)
+    response = client.post("/sync", json={"shop_url": TRAVERSAL, "api_token": "token"})
+    assert response.status_code == 400
+    assert "Not a Shopify shop domain" in response.json()["detail"]
+    assert not os.path.exists("/tmp/pwned.json")
+
+    assert client.post("/sync", json={"shop_url": "", "api_token": "token"}).status_code == 400
+    assert client.post("/chat", json={"message": "hi", "shop_domain": TRAVERSAL}).status_code == 400
+    assert client.post("/chat/stream", json={"message": "hi", "shop_domain": TRAVERSAL}).status_code == 400
+
+
+def test_shop_configs_holding_tokens_are_private(tmp_path):
+    store = LocalShopStore(str(tmp_path / "shops"))
+    store.save(ShopConfig("shop.myshopify.com", access_token="shpat_secret"))
+    assert stat.S_IMODE(os.stat(store.directory).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(store._path("shop.myshopify.com")).st_mode) == 0o600
+    assert store.load("shop.myshopify.com").access_token == "shpat_secret"
+
+
+def test_evicting_a_shop_lets_its_requests_in_flight_finish(tmp_path):
+    shop = "evicted.myshopify.com"
+
+    async def main():
+        arrived, respond = asyncio.Event(), asyncio.Event()
+
+        async def handler(request):
+            arrived.set()
+            await respond.wait()
+            return httpx.Response(200, json={"data": {"cart": {"id": "gid://shopify/Cart/1"}}})
+
+        registry = ShopRegistry(store=LocalShopStore(str(tmp_path)), capacity=1, warm_shops=[])
+        context = await registry.get(shop)
+        context.config.storefront_token = "token"
+        connection = get_connection(shop)
+        await connection.client.aclose()
+        connection.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        request = asyncio.create_task(context.client.fetch_cart("gid://shopify/Cart/1"))
+        await arrived.wait()
+        # Loading a second shop evicts the first while its request is waiting on Shopify
+        await registry.get("other.myshopify.com")
+        assert registry.stats()["evictions"] == 1 and not connection.client.is_closed
+        respond.set()
+        cart = await request
+        assert connection.client.is_closed
+        return cart
+
+    assert asyncio.run(main()) == {"id": "gid://shopify/Cart/1"}
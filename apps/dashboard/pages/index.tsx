@@ -4,7 +4,30 @@ import Head from 'next/head';
 export default function Home() {
     const [shopUrl, setShopUrl] = useState('');
     const [apiToken, setApiToken] = useState('');
+    const [storefrontToken, setStorefrontToken] = useState('');
     const [status, setStatus] = useState('');
+    const [fullRebuild, setFullRebuild] = useState(false);
+
+    const pollJob = async (apiUrl: string, jobId: string) => {
+        while (true) {
+            await new Promise((resolve) => setTimeout(resolve, 2000));
+            const response = await fetch(`${apiUrl}/sync/${jobId}`);
+            if (!response.ok) {
+                throw new Error(`Sync status failed with status: ${response.status}`);
+            }
+            const job = await response.json();
+            const counts = Object.entries(job.counts || {}).map(([name, count]) => `${name}: ${count}`).join(', ');
+            if (job.status === 'succeeded') {
+                setStatus(`Sync finished in ${job.elapsed_seconds}s. ${counts}`);
+                return;
+            }
+            if (job.status === 'failed') {
+                setStatus(`Sync failed: ${job.error}`);
+                return;
+            }
+            setStatus(`Sync ${job.status} (${job.stage})... ${counts}${job.products_per_second ? ` (${job.products_per_second} products/s)` : ''}`);
+        }
+    };
 
     const handleSync = async () => {
         setStatus('Syncing products... This may take a while.');
@@ -17,14 +40,22 @@ export default function Home() {
                 headers: {
                     'Content-Type': 'application/json'
                 },
-                body: JSON.stringify({ shop_url: shopUrl, api_token: apiToken })
+                body: JSON.stringify({
+                    shop_url: shopUrl,
+                    api_token: apiToken,
+                    // Only sent when entered, so a sync doesn't clear a token saved earlier
+                    ...(storefrontToken ? { storefront_token: storefrontToken } : {}),
+                    full_rebuild: fullRebuild
+                })
             });
 
             if (!response.ok) {
                 throw new Error(`Sync failed with status: ${response.status}`);
             }
 
-            setStatus('Sync started! Check backend logs for progress.');
+            const { job_id: jobId, message } = await response.json();
+            setStatus(message);
+            await pollJob(apiUrl, jobId);
         } catch (error) {
             console.error(error);
             setStatus('Error syncing products. Check console for details.');
@@ -61,6 +92,27 @@ export default function Home() {
                         style={{ width: '100%', padding: '8px' }}
                     />
                 </div>
+                <div style={{ marginBottom: '10px' }}>
+                    <label style={{ display: 'block', marginBottom: '5px' }}>Storefront API Token (for carts):</label>
+                    <input
+                        type="password"
+                        value={storefrontToken}
+                        onChange={(e) => setStorefrontToken(e.target.value)}
+                        placeholder="Leave empty to keep the saved token"
+                        style={{ width: '100%', padding: '8px' }}
+                    />
+                </div>
+                <div style={{ marginBottom: '10px' }}>
+                    <label>
+                        <input
+                            type="checkbox"
+                            checked={fullRebuild}
+                            onChange={(e) => setFullRebuild(e.target.checked)}
+                            style={{ marginRight: '5px' }}
+                        />
+                        Full rebuild (re-embed every product instead of only changes)
+                    </label>
+                </div>
                 <button
                     onClick={handleSync}
                     style={{ padding: '10px 20px', backgroundColor: '#0070f3', color: 'white', border: 'none', borderRadius: '4px', cursor: 'pointer' }}
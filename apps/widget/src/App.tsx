@@ -145,6 +145,8 @@ function App() {
     ]);
     const [inputValue, setInputValue] = useState('');
     const [isLoading, setIsLoading] = useState(false);
+    // The Storefront cart the agent created, sent back so later turns add to the same cart
+    const [cartId, setCartId] = useState('');
 
     const toggleOpen = () => setIsOpen(!isOpen);
 
@@ -156,30 +158,74 @@ function App() {
         setInputValue('');
         setIsLoading(true);
 
+        const botMsgId = (Date.now() + 1).toString();
+        // Create the reply bubble on the first visible event, then update it in place
+        const updateBotMsg = (update: Partial<Message>) => {
+            setIsLoading(false);
+            setMessages(prev => prev.some(m => m.id === botMsgId)
+                ? prev.map(m => m.id === botMsgId ? { ...m, ...update } : m)
+                : [...prev, { id: botMsgId, text: '', isUser: false, ...update }]);
+        };
+
         try {
             const apiUrl = 'https://shop-agent-backend-prod-c3lyao3wuq-uc.a.run.app';
-            const response = await fetch(`${apiUrl}/chat`, {
+            const response = await fetch(`${apiUrl}/chat/stream`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ message: userMsg.text })
+                body: JSON.stringify({ message: userMsg.text, cart_id: cartId })
             });
 
-            const data = await response.json();
+            if (!response.ok || !response.body) {
+                throw new Error(`Chat failed with status: ${response.status}`);
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let text = '';
+
+            // Server-Sent Events: blocks of "event: <name>\ndata: <json>" separated by a blank line
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                const blocks = buffer.split('\n\n');
+                buffer = blocks.pop() || '';
+
+                for (const block of blocks) {
+                    const eventLine = block.split('\n').find(line => line.startsWith('event: '));
+                    const dataLine = block.split('\n').find(line => line.startsWith('data: '));
+                    if (!eventLine || !dataLine) continue;
 
-            // Use structured product data from backend
-            const products = data.products || [];
-            const responseText = data.response;
+                    const event = eventLine.slice('event: '.length);
+                    const data = JSON.parse(dataLine.slice('data: '.length));
 
-            const botMsg: Message = {
-                id: (Date.now() + 1).toString(),
-                text: responseText || 'Here are some products I found:',
-                isUser: false,
-                products
-            };
-            setMessages(prev => [...prev, botMsg]);
+                    if (event === 'token') {
+                        text += data.text;
+                        updateBotMsg({ text });
+                    } else if (event === 'message') {
+                        text = data.text;
+                        updateBotMsg({ text });
+                    } else if (event === 'products') {
+                        updateBotMsg({ products: data.products });
+                    } else if (event === 'done') {
+                        if (data.cart_id) setCartId(data.cart_id);
+                        updateBotMsg({
+                            text: data.response || text || 'Here are some products I found:',
+                            products: data.products || []
+                        });
+                    } else if (event === 'error') {
+                        throw new Error(data.detail);
+                    }
+                }
+            }
         } catch (error) {
             console.error('Error sending message:', error);
-            setMessages(prev => [...prev, { id: Date.now().toString(), text: 'Sorry, something went wrong.', isUser: false }]);
+            setMessages(prev => [
+                ...prev.filter(m => m.id !== botMsgId),
+                { id: Date.now().toString(), text: 'Sorry, something went wrong.', isUser: false }
+            ]);
         } finally {
             setIsLoading(false);
         }